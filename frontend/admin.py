@@ -2,9 +2,411 @@
 Module that defines some basic properties of the app.
 """
 
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.timesince import timesince
 
-from .models import Impressum
+from qlued.models import StorageProviderDb
+
+from .latency import CHART_HEIGHT, CHART_WIDTH, chart_lines, get_history
+from .models import (
+    Impressum,
+    JobArchive,
+    LatencySketch,
+    PendingJob,
+    RateLimit,
+    RequestProfile,
+)
+from .provider_health import attach_health
+from .storage_bulk import (
+    FORMATS,
+    dump_records,
+    export_storage_providers,
+    import_storage_providers,
+    parse_records,
+)
+from .submission import flusher
 
 # Register your models here.
 admin.site.register(Impressum)
+
+
+@admin.register(RateLimit)
+class RateLimitAdmin(admin.ModelAdmin):
+    """
+    The rate limits can be changed here without a redeploy.
+    """
+
+    list_display = ("scope", "name", "capacity", "refill_rate", "is_active")
+    list_editable = ("capacity", "refill_rate", "is_active")
+    list_filter = ("scope", "is_active")
+    search_fields = ("name",)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    The profiles of single requests. They are only created by the profiler, so they
+    cannot be added or changed here.
+    """
+
+    list_display = (
+        "created_at",
+        "method",
+        "path",
+        "status",
+        "duration_ms",
+        "n_samples",
+        "user",
+        "download_link",
+    )
+    list_filter = ("url_name",)
+    search_fields = ("path",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:profile_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="frontend_requestprofile_download",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    @admin.display(description="Profile")
+    def download_link(self, obj):
+        """
+        Link to the folded stacks, which can be opened in flame graph tools.
+        """
+        url = reverse("admin:frontend_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+
+    def download_view(self, request, profile_id):
+        """
+        Serve the profile to staff users only, as the media files are not public.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        return FileResponse(
+            profile.profile.open("rb"),
+            as_attachment=True,
+            filename=profile.profile.name.split("/")[-1],
+        )
+
+
+@admin.register(JobArchive)
+class JobArchiveAdmin(admin.ModelAdmin):
+    """
+    The bundles of archived jobs. They are only written by `archive_jobs`.
+    """
+
+    list_display = ("storage_provider", "display_name", "month", "n_jobs", "updated_at")
+    list_filter = ("storage_provider",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        # the archived jobs were removed from the storage providers
+        return False
+
+
+@admin.register(PendingJob)
+class PendingJobAdmin(admin.ModelAdmin):
+    """
+    The jobs of the write-behind queue. Jobs that failed too often are not tried again
+    until they are retried here, or they can be deleted.
+    """
+
+    list_display = (
+        "job_id",
+        "storage_provider",
+        "display_name",
+        "username",
+        "created_at",
+        "attempts",
+        "last_error",
+    )
+    list_filter = ("storage_provider",)
+    search_fields = ("job_id", "username")
+    readonly_fields = [field.name for field in PendingJob._meta.fields]
+    actions = ["retry"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(permissions=["change"], description="Upload the selected jobs again")
+    def retry(self, request, queryset):
+        """
+        Give the jobs a new set of attempts.
+        """
+        n_jobs = queryset.update(attempts=0, last_error="", lease="", leased_until=None)
+        flusher.wake()
+        self.message_user(request, f"{n_jobs} jobs will be uploaded again.")
+
+
+@admin.register(LatencySketch)
+class LatencySketchAdmin(admin.ModelAdmin):
+    """
+    The history of the latency. Instead of the sketches, the list shows the charts of
+    the percentiles of each endpoint and storage provider.
+    """
+
+    # the periods that can be charted in days
+    DAY_CHOICES = (1, 3, 7, 14)
+
+    # the percentiles and the colors of their lines
+    PERCENTILES = (
+        ("p50", 50, "#417690"),
+        ("p95", 95, "#e8a33d"),
+        ("p99", 99, "#ba2121"),
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get("days", 3))
+        except ValueError:
+            days = 3
+        if days not in self.DAY_CHOICES:
+            days = 3
+        kind = request.GET.get("kind", "")
+        kinds = [kind] if kind in dict(LatencySketch.KIND_CHOICES) else None
+        history = get_history(days, kinds) if kinds else get_history(days)
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,  # pylint: disable=W0212
+            "title": "Latency history",
+            "days": days,
+            "day_choices": self.DAY_CHOICES,
+            "kind": kind,
+            "kind_choices": LatencySketch.KIND_CHOICES,
+            "chart_width": CHART_WIDTH,
+            "chart_height": CHART_HEIGHT,
+            "history": [
+                {
+                    "series": series,
+                    "kind_label": dict(LatencySketch.KIND_CHOICES)[series.kind],
+                    "peak_ms": chart["peak_ms"],
+                    # the percentile, its color, lines, value over the whole time
+                    # and the position of its legend
+                    "lines": [
+                        (
+                            label,
+                            color,
+                            chart["lines"][label],
+                            series.total.quantile(q),
+                            200 + 60 * i,
+                        )
+                        for i, (label, q, color) in enumerate(self.PERCENTILES)
+                    ],
+                }
+                for series in history
+                for chart in [chart_lines(series)]
+            ],
+            **(extra_context or {}),
+        }
+        return TemplateResponse(
+            request, "admin/frontend/latencysketch/dashboard.html", context
+        )
+
+
+class StorageProviderImportForm(forms.Form):
+    """
+    The upload of storage providers in the admin.
+    """
+
+    file = forms.FileField(help_text="A list of storage providers as JSON or YAML.")
+    format = forms.ChoiceField(choices=[(fmt, fmt.upper()) for fmt in FORMATS])
+    check_credentials = forms.BooleanField(required=False, initial=True)
+
+
+# qlued registers the storage providers itself, so we extend its admin
+StorageProviderBaseAdmin = (
+    type(admin.site.get_model_admin(StorageProviderDb))
+    if admin.site.is_registered(StorageProviderDb)
+    else admin.ModelAdmin
+)
+
+
+class StorageProviderAdmin(StorageProviderBaseAdmin):
+    """
+    The storage providers can be exported and imported in bulk. The list shows their
+    recorded health next to the columns of qlued.
+    """
+
+    change_list_template = "admin/qlued/storageproviderdb/change_list.html"
+    actions = ["export_json", "export_yaml"]
+    health_columns = ("last_contact", "p95_latency", "error_rate", "backend_count")
+
+    def get_list_display(self, request):
+        return tuple(super().get_list_display(request)) + self.health_columns
+
+    def get_changelist_instance(self, request):
+        """
+        Read the health of the storage providers on the page with a fixed number of
+        queries.
+        """
+        changelist = super().get_changelist_instance(request)
+        attach_health(changelist.result_list)
+        return changelist
+
+    @admin.display(description="Last contact")
+    def last_contact(self, obj):
+        """
+        The last successful call to the storage provider.
+        """
+        health = getattr(obj, "health", None)
+        if health is None or health.last_success_at is None:
+            return "-"
+        return f"{timesince(health.last_success_at)} ago"
+
+    @admin.display(description="p95 latency")
+    def p95_latency(self, obj):
+        """
+        The 95th percentile of the latency within the window.
+        """
+        health = getattr(obj, "health", None)
+        if health is None or health.p95_ms is None:
+            return "-"
+        return f"{health.p95_ms:.0f} ms"
+
+    @admin.display(description="Error rate")
+    def error_rate(self, obj):
+        """
+        The fraction of failed calls within the window.
+        """
+        health = getattr(obj, "health", None)
+        if health is None or health.error_percent is None:
+            return "-"
+        return f"{health.error_percent:.1f} %"
+
+    @admin.display(description="Backends")
+    def backend_count(self, obj):
+        """
+        The number of backends that were seen last.
+        """
+        health = getattr(obj, "health", None)
+        if health is None or health.backend_count is None:
+            return "-"
+        return health.backend_count
+
+    def get_urls(self):
+        urls = [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="qlued_storageproviderdb_import",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def export(self, queryset, fmt: str, content_type: str):
+        """
+        Download the selected storage providers.
+        """
+        response = HttpResponse(
+            dump_records(export_storage_providers(queryset), fmt),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="storage_providers.{fmt}"'
+        )
+        return response
+
+    # the exports contain the logins, so they need the permission to change them
+    @admin.action(
+        permissions=["change"], description="Export selected storage providers as JSON"
+    )
+    def export_json(self, request, queryset):
+        """
+        Export the selection as JSON.
+        """
+        return self.export(queryset, "json", "application/json")
+
+    @admin.action(
+        permissions=["change"], description="Export selected storage providers as YAML"
+    )
+    def export_yaml(self, request, queryset):
+        """
+        Export the selection as YAML if PyYAML is installed.
+        """
+        try:
+            return self.export(queryset, "yaml", "application/yaml")
+        except ValueError as err:
+            self.message_user(request, str(err), messages.ERROR)
+            return None
+
+    def import_view(self, request):
+        """
+        Import storage providers. The requesting user owns those that do not name one.
+        """
+        if not self.has_add_permission(request) or not self.has_change_permission(
+            request
+        ):
+            raise PermissionDenied
+        form = StorageProviderImportForm(request.POST or None, request.FILES or None)
+        errors = {}
+        if request.method == "POST" and form.is_valid():
+            try:
+                records = parse_records(
+                    form.cleaned_data["file"].read().decode("utf-8"),
+                    form.cleaned_data["format"],
+                )
+            except (UnicodeDecodeError, ValueError) as err:
+                form.add_error("file", str(err))
+            else:
+                result = import_storage_providers(
+                    records,
+                    default_owner=request.user,
+                    credentials=form.cleaned_data["check_credentials"],
+                )
+                errors = result.errors
+                if not errors:
+                    self.message_user(
+                        request,
+                        f"Created {len(result.created)} and updated "
+                        f"{len(result.updated)} storage providers.",
+                        messages.SUCCESS,
+                    )
+                    return HttpResponseRedirect(
+                        reverse("admin:qlued_storageproviderdb_changelist")
+                    )
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Import storage providers",
+            "form": form,
+            "import_errors": errors,
+        }
+        return TemplateResponse(
+            request, "admin/qlued/storageproviderdb/import.html", context
+        )
+
+
+if admin.site.is_registered(StorageProviderDb):
+    admin.site.unregister(StorageProviderDb)
+admin.site.register(StorageProviderDb, StorageProviderAdmin)
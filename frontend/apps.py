@@ -12,3 +12,14 @@ class FrontEndConfig(AppConfig):
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "frontend"
+
+    def ready(self):
+        """
+        Instrument the storage providers, hook the submission of jobs into them and
+        connect the signals of the app.
+        """
+        # pylint: disable=C0415, W0611
+        from . import instrumentation, ratelimit, submission, telemetry
+
+        instrumentation.install()
+        submission.install()
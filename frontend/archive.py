@@ -0,0 +1,464 @@
+"""
+Module that archives the old jobs of the storage providers. Finished and deleted jobs are
+moved into compressed bundles per backend and month, which keeps the folders of the
+storage providers small. The bundles are indexed in the database, such that an archived
+job can still be read by its id.
+"""
+
+import io
+import json
+import logging
+import os
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+from sqooler.schemes import ResultDict
+from sqooler.storage_providers.local import LocalProviderExtended
+
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from .models import ArchivedJob, JobArchive
+
+logger = logging.getLogger(__name__)
+
+# the number of job ids per query, such that we stay below the limits of SQLite
+CHUNK_SIZE = 500
+
+# some storage providers prefix the names of the files
+FILE_PREFIXES = ("job-", "status-", "result-")
+
+
+class FinishedJob(NamedTuple):
+    """
+    A finished or deleted job that was found in a storage provider.
+    """
+
+    display_name: str
+    username: str
+    job_id: str
+    is_deleted: bool
+    storage_path: str
+    file_name: str
+
+
+def chunks(items: list, size: int = CHUNK_SIZE):
+    """
+    Split the items into lists of the given size.
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def job_id_from_file_name(file_name: str) -> str:
+    """
+    The id of the job that belongs to a file in the storage provider.
+    """
+    for prefix in FILE_PREFIXES:
+        if file_name.startswith(prefix):
+            return file_name[len(prefix) :]
+    return file_name
+
+
+def job_username(job_id: str) -> str:
+    """
+    The username in job ids of the form `date-display_name-username-suffix`, which the
+    Dropbox provider creates. The other providers do not need the username to find the
+    files of a job, so it is empty for them.
+    """
+    parts = job_id.split("-")
+    return parts[2] if len(parts) == 4 else ""
+
+
+def finished_paths(storage_provider, display_name: str) -> dict[str, str]:
+    """
+    The folders of the finished jobs of the backend and the username of each. Dropbox
+    keeps the finished jobs of every user in a folder of their own, so one folder per
+    user of this site is listed. The other providers have a single folder.
+    """
+    if storage_provider.get_attribute_path(
+        "finished", display_name, username="a"
+    ) == storage_provider.get_attribute_path("finished", display_name, username="b"):
+        return {storage_provider.get_attribute_path("finished", display_name): ""}
+    usernames = get_user_model().objects.values_list("username", flat=True)
+    return {
+        storage_provider.get_attribute_path(
+            "finished", display_name, username=username
+        ): username
+        for username in usernames.order_by("username")
+    }
+
+
+def status_path(storage_provider, display_name: str, username: str) -> str:
+    """
+    The folder of the status files. The arguments are passed like `upload_status` and
+    `get_status` of the storage providers pass them, such that the same folder is found.
+    """
+    return storage_provider.get_attribute_path("status", display_name, username)
+
+
+def file_timestamp(
+    storage_provider, storage_path: str, file_name: str
+) -> Optional[datetime]:
+    """
+    The time at which the file was written, if the storage provider can tell us cheaply.
+    """
+    if not isinstance(storage_provider, LocalProviderExtended):
+        return None
+    path = os.path.join(
+        storage_provider.base_path, storage_path.strip("/"), file_name + ".json"
+    )
+    try:
+        return datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc)
+    except OSError:
+        return None
+
+
+def find_finished_jobs(storage_provider, display_names: list[str]) -> list[FinishedJob]:
+    """
+    List the finished and deleted jobs of the backends. The deleted jobs share a single
+    folder, so they are assigned to their backend through the status files.
+    """
+    jobs = []
+    for display_name in display_names:
+        for storage_path, username in finished_paths(
+            storage_provider, display_name
+        ).items():
+            for file_name in storage_provider.get_file_queue(storage_path):
+                job_id = job_id_from_file_name(file_name)
+                jobs.append(
+                    FinishedJob(
+                        display_name,
+                        username or job_username(job_id),
+                        job_id,
+                        False,
+                        storage_path,
+                        file_name,
+                    )
+                )
+
+    deleted_path = storage_provider.get_attribute_path("deleted")
+    deleted = {
+        job_id_from_file_name(file_name): file_name
+        for file_name in storage_provider.get_file_queue(deleted_path)
+    }
+    if deleted:
+        usernames = {job_username(job_id) for job_id in deleted}
+        for display_name in display_names:
+            status_paths = {
+                status_path(storage_provider, display_name, username)
+                for username in usernames
+            }
+            file_names = [
+                file_name
+                for path in sorted(status_paths)
+                for file_name in storage_provider.get_file_queue(path)
+            ]
+            for file_name in file_names:
+                job_id = job_id_from_file_name(file_name)
+                if job_id in deleted:
+                    jobs.append(
+                        FinishedJob(
+                            display_name,
+                            job_username(job_id),
+                            job_id,
+                            True,
+                            deleted_path,
+                            deleted.pop(job_id),
+                        )
+                    )
+    return jobs
+
+
+def month_of(timestamp: datetime) -> date:
+    """
+    The first day of the month of the timestamp.
+    """
+    return timestamp.date().replace(day=1)
+
+
+def add_to_bundle(archive: JobArchive, jobs: dict[str, dict[str, dict]]) -> str:
+    """
+    Write the bundle of the archive anew with the jobs added. Storages like S3 cannot
+    append to a file, so the bundle is read, extended in memory and saved under a new
+    name. The jobs that are in the bundle already are left out.
+
+    Args:
+        archive: the archive of the backend and month
+        jobs: the job, status and result of each job id
+
+    Returns:
+        The name of the previous bundle, which is deleted once the archive is saved.
+    """
+    buffer = io.BytesIO()
+    old_name = archive.bundle.name or ""
+    if old_name:
+        with archive.bundle.open("rb") as bundle_file:
+            buffer.write(bundle_file.read())
+    with zipfile.ZipFile(buffer, "a", compression=zipfile.ZIP_DEFLATED) as bundle:
+        existing = set(bundle.namelist())
+        for job_id, members in jobs.items():
+            for member, content in members.items():
+                name = f"{job_id}/{member}.json"
+                if name not in existing:
+                    bundle.writestr(name, json.dumps(content))
+    archive.bundle.save(
+        f"{archive.storage_provider}/{archive.display_name}/{archive.month:%Y-%m}.zip",
+        ContentFile(buffer.getvalue()),
+        save=False,
+    )
+    return old_name
+
+
+def read_result(storage_provider, job: FinishedJob, backend_name: str) -> dict:
+    """
+    The result of the job like `get_result` returns it. The name of the backend is passed
+    in, such that its configuration is read once per backend instead of once per job.
+    """
+    try:
+        result_dict = storage_provider.get(
+            storage_provider.get_attribute_path(
+                "results", job.display_name, job.job_id
+            ),
+            storage_provider.get_attribute_id("results", job.job_id),
+        )
+    except FileNotFoundError:
+        # deleted jobs have no result
+        return ResultDict(
+            display_name=job.display_name,
+            backend_version="",
+            job_id=job.job_id,
+            qobj_id=None,
+            success=False,
+            status="ERROR",
+            header={},
+            results=[],
+        ).model_dump()
+    # signed results carry the result as their payload
+    if set(result_dict) == {"header", "payload", "signature"}:
+        result_dict = result_dict["payload"]
+    return ResultDict(**{**result_dict, "backend_name": backend_name}).model_dump()
+
+
+def read_job(storage_provider, job: FinishedJob, backend_name: str) -> dict[str, dict]:
+    """
+    Read everything that belongs to the job from the storage provider.
+    """
+    return {
+        "job": storage_provider.get(job.storage_path, job.file_name),
+        "status": storage_provider.get_status(
+            job.display_name, job.username, job.job_id
+        ).model_dump(),
+        "result": read_result(storage_provider, job, backend_name),
+    }
+
+
+def delete_job(storage_provider, job: FinishedJob) -> None:
+    """
+    Remove the job, its status and its result from the storage provider.
+    """
+    files = [
+        (job.storage_path, job.file_name),
+        (
+            status_path(storage_provider, job.display_name, job.username),
+            storage_provider.get_attribute_id("status", job.job_id),
+        ),
+        (
+            storage_provider.get_attribute_path(
+                "results", job.display_name, job_id=job.job_id, username=job.username
+            ),
+            storage_provider.get_attribute_id("results", job.job_id),
+        ),
+    ]
+    for storage_path, file_name in files:
+        try:
+            storage_provider.delete(storage_path, file_name)
+        except FileNotFoundError:
+            # deleted jobs have no result
+            pass
+
+
+def index_jobs(
+    entry, storage_provider, jobs: list[FinishedJob], cutoff: datetime, now: datetime
+) -> tuple[int, dict[tuple[str, date], list[FinishedJob]]]:
+    """
+    Add the jobs that are seen for the first time to the index and remove the files of
+    jobs that were archived by an earlier run already.
+
+    Returns:
+        The number of newly indexed jobs and the jobs older than the cutoff per backend
+        and month.
+    """
+    # pylint: disable=E1101
+    indexed = {}
+    for chunk in chunks([job.job_id for job in jobs]):
+        indexed.update(
+            (job_id, (archive_id, finished_at))
+            for job_id, archive_id, finished_at in ArchivedJob.objects.filter(
+                storage_provider=entry.name, job_id__in=chunk
+            ).values_list("job_id", "archive_id", "finished_at")
+        )
+
+    new_entries = []
+    to_archive: dict[tuple[str, date], list[FinishedJob]] = {}
+    for job in jobs:
+        archive_id, finished_at = indexed.get(job.job_id, (None, None))
+        if finished_at is None:
+            finished_at = (
+                file_timestamp(storage_provider, job.storage_path, job.file_name) or now
+            )
+            new_entries.append(
+                ArchivedJob(
+                    storage_provider=entry.name,
+                    display_name=job.display_name,
+                    job_id=job.job_id,
+                    is_deleted=job.is_deleted,
+                    finished_at=finished_at,
+                )
+            )
+        if archive_id is not None:
+            if settings.JOB_ARCHIVE_PERSISTENT:
+                # the files of an earlier run were not deleted completely
+                delete_job(storage_provider, job)
+        elif finished_at < cutoff:
+            to_archive.setdefault((job.display_name, month_of(finished_at)), []).append(
+                job
+            )
+    ArchivedJob.objects.bulk_create(
+        new_entries, batch_size=CHUNK_SIZE, ignore_conflicts=True
+    )
+    return len(new_entries), to_archive
+
+
+def archive_month(
+    entry,
+    storage_provider,
+    bundle_key: tuple[str, date],
+    jobs: list[FinishedJob],
+    backend_name: str,
+) -> int:
+    """
+    Move the jobs of a backend and month into their bundle.
+
+    Args:
+        entry: the storage provider from the database
+        storage_provider: the storage provider of the jobs
+        bundle_key: the name of the backend and the month of the bundle
+        jobs: the jobs of the backend within the month
+        backend_name: the full name of the backend
+
+    Returns:
+        The number of archived jobs.
+    """
+    contents = {}
+    for job in jobs:
+        try:
+            contents[job.job_id] = read_job(storage_provider, job, backend_name)
+        except Exception:  # pylint: disable=W0718
+            logger.exception("Could not read the job %s.", job.job_id)
+    if not contents:
+        return 0
+
+    display_name, month = bundle_key
+    # pylint: disable=E1101
+    archive, _ = JobArchive.objects.get_or_create(
+        storage_provider=entry.name, display_name=display_name, month=month
+    )
+    old_bundle = add_to_bundle(archive, contents)
+    with transaction.atomic():
+        n_jobs = 0
+        for chunk in chunks(list(contents)):
+            n_jobs += ArchivedJob.objects.filter(
+                storage_provider=entry.name, job_id__in=chunk, archive=None
+            ).update(archive=archive)
+        archive.n_jobs += n_jobs
+        archive.save()
+    if old_bundle and old_bundle != archive.bundle.name:
+        archive.bundle.storage.delete(old_bundle)
+    if not settings.JOB_ARCHIVE_PERSISTENT:
+        return len(contents)
+    # the jobs are only deleted once they are safe in the archive
+    for job in jobs:
+        if job.job_id in contents:
+            delete_job(storage_provider, job)
+    return len(contents)
+
+
+def archive_storage_provider(
+    entry, retention: timedelta, now: Optional[datetime] = None
+) -> dict:
+    """
+    Index the finished and deleted jobs of the storage provider and move those older
+    than the retention into the archives. If the age of a job cannot be read from the
+    storage provider, it counts from the first time the job was seen.
+
+    Args:
+        entry: the storage provider from the database
+        retention: how long the jobs stay in the storage provider
+        now: the current time
+
+    Returns:
+        The number of newly indexed and archived jobs and of the updated bundles.
+    """
+    now = now or datetime.now(timezone.utc)
+    storage_provider = get_storage_provider_from_entry(entry)
+    jobs = find_finished_jobs(storage_provider, storage_provider.get_backends())
+    n_indexed, to_archive = index_jobs(
+        entry, storage_provider, jobs, now - retention, now
+    )
+
+    report = {"indexed": n_indexed, "archived": 0, "bundles": 0}
+    backend_names: dict[str, str] = {}
+    for (display_name, month), month_jobs in sorted(to_archive.items()):
+        if display_name not in backend_names:
+            backend_names[display_name] = storage_provider.get_backend_dict(
+                display_name
+            ).backend_name
+        n_archived = archive_month(
+            entry,
+            storage_provider,
+            (display_name, month),
+            month_jobs,
+            backend_names[display_name],
+        )
+        if n_archived:
+            report["archived"] += n_archived
+            report["bundles"] += 1
+    return report
+
+
+def read_archived_job(
+    storage_provider: str, display_name: str, job_id: str, member: str
+) -> Optional[dict]:
+    """
+    Read the status or result of an archived job.
+
+    Args:
+        storage_provider: the name of the storage provider
+        display_name: the name of the backend
+        job_id: the id of the job
+        member: "job", "status" or "result"
+
+    Returns:
+        The content or None if the job is not archived.
+    """
+    # pylint: disable=E1101
+    archived_job = (
+        ArchivedJob.objects.filter(
+            storage_provider=storage_provider,
+            display_name=display_name,
+            job_id=job_id,
+            archive__isnull=False,
+        )
+        .select_related("archive")
+        .first()
+    )
+    if archived_job is None:
+        return None
+    with archived_job.archive.bundle.open("rb") as bundle_file:
+        with zipfile.ZipFile(bundle_file) as bundle:
+            return json.loads(bundle.read(f"{job_id}/{member}.json"))
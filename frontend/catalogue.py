@@ -0,0 +1,242 @@
+"""
+Module that keeps the catalogue of the devices. The backends of all active storage
+providers are copied into an indexed table, such that the devices can be searched,
+filtered and paginated by the database instead of asking every storage provider on each
+request. The catalogue is refreshed at most once per `DEVICE_CATALOGUE_MAX_AGE`.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.paginator import Page, Paginator
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.template import loader
+from django.utils.safestring import SafeString, mark_safe
+from pydantic import ValidationError
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import deadlines
+from .models import Device
+
+logger = logging.getLogger(__name__)
+
+# the storage providers that did not answer during the last refresh. The key expires
+# with the catalogue, such that the next request refreshes it.
+CATALOGUE_CACHE_KEY = "devices:catalogue"
+
+# the fields that are updated when a backend is refreshed
+DEVICE_FIELDS = [
+    "storage_provider",
+    "display_name",
+    "description",
+    "cold_atom_type",
+    "simulator",
+    "operational",
+    "status",
+    "version",
+]
+
+# fields of the configuration that change with every check of the queue and are not shown
+VOLATILE_FIELDS = {"last_queue_check", "pending_jobs"}
+
+
+def device_version(backend_config, status) -> str:
+    """
+    A hash of the configuration and the status of a backend. It only changes if the
+    device looks different, such that its rendered card can be cached.
+    """
+    content = {
+        "config": backend_config.model_dump(mode="json", exclude=VOLATILE_FIELDS),
+        "status": status.model_dump(mode="json", exclude=VOLATILE_FIELDS),
+    }
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def fetch_devices(storage_provider) -> list[Device]:
+    """
+    Read the backends of a storage provider. The status is computed from the
+    configuration, such that each backend needs a single storage call.
+    """
+    found = []
+    for display_name in storage_provider.get_backends():
+        # for testing we created dummy devices. We should ignore them in any other cases.
+        if "dummy_" in display_name:
+            continue
+        backend_config = storage_provider.get_config(display_name)
+        status = storage_provider.backend_dict_to_qiskit_status(backend_config)
+        found.append(
+            Device(
+                storage_provider=storage_provider.name,
+                backend_name=status.backend_name,
+                display_name=display_name,
+                description=backend_config.description,
+                cold_atom_type=backend_config.cold_atom_type,
+                simulator=backend_config.simulator,
+                operational=status.operational,
+                status=status.model_dump(),
+                version=device_version(backend_config, status),
+            )
+        )
+    return found
+
+
+def refresh_catalogue() -> list[str]:
+    """
+    Copy the backends of all active storage providers into the catalogue. Each storage
+    provider gets its share of the remaining time of the request. The devices of the
+    storage providers that do not answer in time are kept as they are.
+
+    Returns:
+        The names of the storage providers that did not answer in time.
+    """
+    # pylint: disable=E1101
+    active_entries = list(StorageProviderDb.objects.filter(is_active=True))
+    missing_providers = []
+    fresh: dict[str, list[Device]] = {}
+    for index, entry in enumerate(active_entries):
+        # a slow storage provider cannot take the devices of all the others with it
+        left = deadlines.remaining()
+        share = None if left is None else left / (len(active_entries) - index)
+        try:
+            with deadlines.budget(share):
+                fresh[entry.name] = fetch_devices(
+                    get_storage_provider_from_entry(entry)
+                )
+        except ValidationError:
+            # we ignore the entry if it is not valid
+            logger.warning("The storage provider %s has invalid backends.", entry.name)
+        except deadlines.DeadlineExceeded:
+            missing_providers.append(entry.name)
+
+    devices = [device for found in fresh.values() for device in found]
+    with transaction.atomic():
+        # remove the backends that are gone and the storage providers that were removed
+        # or deactivated
+        gone = ~Q(storage_provider__in=[entry.name for entry in active_entries])
+        for name, found in fresh.items():
+            gone |= Q(storage_provider=name) & ~Q(
+                backend_name__in=[device.backend_name for device in found]
+            )
+        Device.objects.filter(gone).delete()
+        Device.objects.bulk_create(
+            devices,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["backend_name"],
+            update_fields=DEVICE_FIELDS,
+        )
+    return missing_providers
+
+
+def ensure_fresh_catalogue() -> list[str]:
+    """
+    Refresh the catalogue if it is older than `DEVICE_CATALOGUE_MAX_AGE`. Only a single
+    request refreshes it, all others read the catalogue as it is.
+
+    Returns:
+        The names of the storage providers that did not answer during the last refresh.
+    """
+    missing_providers = cache.get(CATALOGUE_CACHE_KEY)
+    if missing_providers is not None:
+        return missing_providers
+    timeout = settings.DEVICE_CATALOGUE_MAX_AGE
+    if not cache.add(CATALOGUE_CACHE_KEY, [], timeout):
+        # another request is refreshing the catalogue right now
+        return []
+    try:
+        missing_providers = refresh_catalogue()
+    except BaseException:
+        cache.delete(CATALOGUE_CACHE_KEY)
+        raise
+    cache.set(CATALOGUE_CACHE_KEY, missing_providers, timeout)
+    return missing_providers
+
+
+def invalidate_catalogue() -> None:
+    """
+    Refresh the catalogue with the next request, e.g. after a storage provider changed.
+    """
+    cache.delete(CATALOGUE_CACHE_KEY)
+
+
+def filter_devices(
+    q: str = "",
+    cold_atom_type: str = "",
+    kind: str = "",
+    status: str = "",
+) -> QuerySet:
+    """
+    Search the catalogue.
+
+    Args:
+        q: a text that appears in the name or the description
+        cold_atom_type: the type of the cold atoms
+        kind: "simulator" or "hardware"
+        status: "online" or "offline"
+    """
+    # pylint: disable=E1101
+    devices = Device.objects.all()
+    if q:
+        devices = devices.filter(
+            Q(display_name__icontains=q)
+            | Q(backend_name__icontains=q)
+            | Q(description__icontains=q)
+        )
+    if cold_atom_type:
+        devices = devices.filter(cold_atom_type=cold_atom_type)
+    if kind:
+        devices = devices.filter(simulator=kind == "simulator")
+    if status:
+        devices = devices.filter(operational=status == "online")
+    return devices
+
+
+def get_page(devices: QuerySet, number: Optional[str]) -> Page:
+    """
+    The page of the devices. Invalid page numbers give the first or the last page.
+    """
+    return Paginator(devices, settings.DEVICES_PER_PAGE).get_page(number)
+
+
+def card_cache_key(device: dict) -> str:
+    """
+    The cache key of the rendered card of a device. It changes with the version of the
+    device and with its url.
+    """
+    return make_template_fragment_key(
+        "device_card", [device["backend_name"], device["version"], device["url"]]
+    )
+
+
+def render_cards(devices: list[dict]) -> list[SafeString]:
+    """
+    The cards of the devices. The cached cards are read with a single call to the cache
+    and only the cards of new or changed devices are rendered again.
+
+    Args:
+        devices: the devices as returned by `Device.as_dict`
+    """
+    template = loader.get_template("frontend/device_card.html")
+    keys = [card_cache_key(device) for device in devices]
+    cached = cache.get_many(keys)
+    cards = []
+    rendered = {}
+    for key, device in zip(keys, devices):
+        card = cached.get(key)
+        if card is None:
+            card = template.render({"backend": device})
+            rendered[key] = card
+        cards.append(mark_safe(card))
+    if rendered:
+        cache.set_many(rendered, settings.DEVICE_CARD_CACHE_TIMEOUT)
+    return cards
@@ -0,0 +1,31 @@
+"""
+Module that keeps the context of the request that is currently handled. It is stored in
+context variables, such that the storage calls and the logging can access it without
+passing the request around.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RequestStats:
+    """
+    The time that a request spent waiting for the storage providers.
+
+    Attributes:
+        storage_calls: the number of calls to the storage providers
+        storage_seconds: the total time of these calls
+    """
+
+    storage_calls: int = 0
+    storage_seconds: float = 0.0
+
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="")
+request_stats_var: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+# the time.monotonic() at which the time budget of the request ends
+deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
@@ -0,0 +1,88 @@
+"""
+Module that gives every request a time budget for the storage providers. The deadline is
+kept in a context variable and checked before each call to a storage provider, such that
+a slow storage provider makes the request fail fast instead of running into the timeout
+of the worker.
+"""
+
+import contextlib
+import time
+from typing import Iterator, Optional
+
+import pymongo
+from django.conf import settings
+from pymongo.errors import PyMongoError
+
+from .context import deadline_var
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    The time budget of the request is used up.
+    """
+
+
+def get_budget(url_name: str) -> Optional[float]:
+    """
+    The time budget of the url in s, or None if it has no deadline.
+    """
+    return settings.REQUEST_DEADLINES.get(url_name, settings.REQUEST_DEADLINE)
+
+
+def remaining() -> Optional[float]:
+    """
+    The time in s until the deadline of the current request, or None without deadline.
+    """
+    deadline = deadline_var.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextlib.contextmanager
+def budget(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Limit the time of the code within. A nested budget can only shorten the deadline.
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = deadline_var.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = deadline_var.set(deadline)
+    try:
+        yield
+    finally:
+        deadline_var.reset(token)
+
+
+@contextlib.contextmanager
+def storage_call(method: str) -> Iterator[None]:
+    """
+    Pass the remaining budget to a call to a storage provider. The call is not started
+    if too little time is left. MongoDB additionally applies the budget to every
+    operation within the call. Dropbox and local files cannot be interrupted, so their
+    calls are only checked before they start.
+
+    Raises:
+        DeadlineExceeded: if the budget is too small or MongoDB ran out of time
+    """
+    left = remaining()
+    if left is None:
+        yield
+        return
+    if left < settings.STORAGE_CALL_MIN_BUDGET:
+        raise DeadlineExceeded(
+            f"Only {max(left, 0):.2f} s were left for the storage call {method}."
+        )
+    try:
+        with pymongo.timeout(left):
+            yield
+    except PyMongoError as err:
+        if err.timeout:
+            raise DeadlineExceeded(
+                f"The storage call {method} did not finish in time."
+            ) from err
+        raise
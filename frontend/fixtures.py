@@ -0,0 +1,97 @@
+"""
+Module with the fake backends and jobs that are shared by the tests, the load test and
+the benchmarks, such that all of them submit jobs that the backends accept. It also holds
+the base class of the tests that work with local storage providers.
+"""
+
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import Optional
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from qlued.models import StorageProviderDb, Token
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from .validation import validators
+
+# the payload of the jobs, which follows the fermion notebooks
+JOB_PAYLOAD = {
+    "experiment_0": {
+        "instructions": [
+            ["load", [0], []],
+            ["load", [1], []],
+            ["fhop", [0, 1, 2, 3], [0.5]],
+            ["measure", [0], []],
+            ["measure", [1], []],
+        ],
+        "num_wires": 4,
+        "shots": 2,
+        "wire_order": "interleaved",
+    },
+}
+
+
+def backend_config(display_name: str) -> dict:
+    """
+    The configuration of a fake backend that accepts `JOB_PAYLOAD`.
+    """
+    return {
+        "display_name": display_name,
+        "name": display_name,
+        "gates": [{"description": "Fermionic hopping gate", "name": "fhop"}],
+        "supported_instructions": ["load", "measure", "barrier", "fhop"],
+        "num_wires": 4,
+        "version": "0.1",
+        "simulator": True,
+        "wire_order": "interleaved",
+        "cold_atom_type": "fermion",
+        "max_shots": 1000,
+        "max_experiments": 5,
+        "description": "Fake spooler for load tests",
+        "num_species": 1,
+    }
+
+
+class LocalStorageTestCase(TestCase):
+    """
+    Base class of the tests with the user `sandy` and a temporary folder for local
+    storage providers, which starts with empty caches. If `storage_name` is set, the
+    folder holds a storage provider of this name with the backend `fake0` and the user
+    has the token `token_key`.
+    """
+
+    storage_name: Optional[str] = None
+    token_key = "testtoken"
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="sandy")
+        self.storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.storage_dir)
+        cache.clear()
+        validators.clear()
+        if self.storage_name is None:
+            return
+
+        # pylint: disable=E1101
+        self.token = Token.objects.create(
+            key=self.token_key,
+            user=self.user,
+            created_at=datetime.now(timezone.utc),
+            is_active=True,
+        )
+        self.entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name=self.storage_name,
+            owner=self.user,
+            description="test",
+            login={"base_path": self.storage_dir},
+            is_active=True,
+        )
+        self.storage_provider = get_storage_provider_from_entry(self.entry)
+        self.storage_provider.upload(
+            backend_config("fake0"), "backends/configs", "fake0"
+        )
@@ -48,3 +48,46 @@ class SignUpForm(UserCreationForm):
             "password1",
             "password2",
         )
+
+
+class DeviceFilterForm(forms.Form):
+    """
+    Form that is used to search and filter the devices.
+    """
+
+    # the types of cold atoms that are known to sqooler
+    COLD_ATOM_TYPES = [
+        ("", "All atoms"),
+        ("fermion", "Fermions"),
+        ("boson", "Bosons"),
+        ("spin", "Spins"),
+        ("mixed", "Mixed"),
+    ]
+
+    q = forms.CharField(
+        max_length=100,
+        required=False,
+        label="Search",
+        widget=forms.TextInput(
+            attrs={"class": "form-control", "placeholder": "Name or description"}
+        ),
+    )
+    cold_atom_type = forms.ChoiceField(
+        choices=COLD_ATOM_TYPES,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    kind = forms.ChoiceField(
+        choices=[
+            ("", "Simulators and hardware"),
+            ("simulator", "Simulators"),
+            ("hardware", "Hardware"),
+        ],
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    status = forms.ChoiceField(
+        choices=[("", "Any status"), ("online", "Online"), ("offline", "Offline")],
+        required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
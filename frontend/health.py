@@ -0,0 +1,131 @@
+"""
+Module that checks the dependencies of the server for the readiness probe.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import deadlines
+
+STORAGE_CHECKS_CACHE_KEY = "health:storage"
+
+# the storage providers whose check is still running. They are not checked again,
+# such that a hanging provider cannot pile up threads.
+_pending_checks: set[str] = set()
+_pending_lock = threading.Lock()
+
+
+def check_database() -> dict:
+    """
+    Check that the database answers.
+
+    Returns:
+        The status and the latency of the database in ms.
+    """
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except Exception as err:  # pylint: disable=W0718
+        return {
+            "status": "error",
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "error": str(err),
+        }
+    return {"status": "ok", "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def check_storage_provider(storage_provider_entry: StorageProviderDb) -> dict:
+    """
+    Check that a storage provider answers by listing its backends.
+
+    Args:
+        storage_provider_entry: the entry of the storage provider in the database
+
+    Returns:
+        The status and the latency of the storage provider in ms.
+    """
+    start = time.perf_counter()
+    try:
+        storage_provider = get_storage_provider_from_entry(storage_provider_entry)
+        storage_provider.get_backends()
+    # the dropbox provider exits on invalid tokens, so we also have to catch SystemExit
+    except (Exception, SystemExit) as err:  # pylint: disable=W0718
+        return {
+            "status": "error",
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "error": str(err),
+        }
+    finally:
+        with _pending_lock:
+            _pending_checks.discard(storage_provider_entry.name)
+    return {"status": "ok", "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def check_storage_providers() -> dict[str, dict]:
+    """
+    Check a random sample of the active storage providers. The checks run concurrently
+    with a strict timeout and the results are cached for a short time, such that
+    frequent probes do not hit the storage providers on every call.
+
+    Returns:
+        The status and latency of each of the sampled storage providers.
+    """
+    results = cache.get(STORAGE_CHECKS_CACHE_KEY)
+    if results is not None:
+        return results
+
+    # pylint: disable=E1101
+    entries = list(
+        StorageProviderDb.objects.filter(is_active=True).order_by("?")[
+            : settings.READINESS_STORAGE_SAMPLE_SIZE
+        ]
+    )
+    results = {}
+    futures = {}
+    timeout = settings.READINESS_STORAGE_TIMEOUT
+    left = deadlines.remaining()
+    if left is not None:
+        timeout = max(min(timeout, left), 0)
+    executor = ThreadPoolExecutor(max_workers=settings.READINESS_MAX_CONCURRENCY)
+    for entry in entries:
+        with _pending_lock:
+            if entry.name in _pending_checks:
+                results[entry.name] = {
+                    "status": "timeout",
+                    "latency_ms": timeout * 1000,
+                    "error": "The previous check is still running.",
+                }
+                continue
+            _pending_checks.add(entry.name)
+        futures[entry.name] = executor.submit(check_storage_provider, entry)
+
+    wait(futures.values(), timeout=timeout)
+    # do not wait for the hanging checks, they finish in the background
+    executor.shutdown(wait=False, cancel_futures=True)
+    for name, future in futures.items():
+        if future.done() and not future.cancelled():
+            results[name] = future.result()
+            continue
+        if future.cancelled():
+            with _pending_lock:
+                _pending_checks.discard(name)
+        results[name] = {
+            "status": "timeout",
+            "latency_ms": timeout * 1000,
+            "error": f"No answer within {timeout} s.",
+        }
+
+    cache.set(
+        STORAGE_CHECKS_CACHE_KEY, results, timeout=settings.READINESS_CACHE_SECONDS
+    )
+    return results
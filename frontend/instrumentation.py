@@ -0,0 +1,192 @@
+"""
+Module that instruments the calls to the storage providers. The methods of the sqooler
+storage providers are wrapped once when the app is loaded, such that every call to a
+storage provider is timed, recorded for the health and the latency history of its storage
+provider and gets the remaining time budget of the request, no matter if it comes from
+the frontend or from the API.
+"""
+
+import functools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.dispatch import receiver
+from sqooler.storage_providers.dropbox import DropboxProviderExtended
+from sqooler.storage_providers.local import LocalProviderExtended
+from sqooler.storage_providers.mongodb import MongodbProviderExtended
+
+from . import deadlines, latency, provider_health
+from .context import request_stats_var
+
+STORAGE_PROVIDER_CLASSES = (
+    DropboxProviderExtended,
+    LocalProviderExtended,
+    MongodbProviderExtended,
+)
+
+# the methods that talk to the storage. Nested calls are only counted once.
+STORAGE_METHODS = (
+    "upload",
+    "get",
+    "update",
+    "move",
+    "delete",
+    "get_file_queue",
+    "get_backends",
+    "get_config",
+    "upload_config",
+    "update_config",
+    "get_backend_dict",
+    "get_backend_status",
+    "upload_job",
+    "get_job",
+    "upload_status",
+    "get_status",
+    "upload_result",
+    "get_result",
+    "get_next_job_in_queue",
+    "update_in_database",
+    "upload_public_key",
+    "get_public_key",
+)
+
+LATENCY_CACHE_KEY = "storage:latency"
+LATENCY_CACHE_TIMEOUT = 60
+
+_call_depth: ContextVar[int] = ContextVar("storage_call_depth", default=0)
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """
+    Exponentially weighted moving average of the storage latency within this process.
+    The average is regularly published to the cache, such that all workers share it.
+    It is published from the thread of a request once the request is finished, since the
+    storage calls also run in thread pools, which must not open connections to the
+    database of the cache.
+    """
+
+    smoothing = 0.2
+    publish_interval = 1.0
+
+    def __init__(self) -> None:
+        self.average = 0.0
+        self.last_publish = 0.0
+        self.changed = False
+        self.lock = threading.Lock()
+
+    def add(self, duration: float) -> None:
+        """Add the duration of a storage call in seconds."""
+        with self.lock:
+            self.average += self.smoothing * (duration - self.average)
+            self.changed = True
+
+    def publish(self) -> None:
+        """
+        Write the average to the cache, at most once per `publish_interval`.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if not self.changed or now - self.last_publish <= self.publish_interval:
+                return
+            self.last_publish = now
+            self.changed = False
+            average = self.average
+        try:
+            cache.set(LATENCY_CACHE_KEY, average, timeout=LATENCY_CACHE_TIMEOUT)
+        # the cache can be unavailable, e.g. if the cache table is locked by another
+        # connection. The request that publishes must not fail because of it.
+        except Exception:  # pylint: disable=W0718
+            logger.warning("Could not publish the storage latency.", exc_info=True)
+
+
+latency_tracker = LatencyTracker()
+
+
+# pylint: disable=W0613
+@receiver(request_finished)
+def publish_after_request(sender, **kwargs):
+    """
+    Publish the latency of the storage calls once the response was sent to the client.
+    """
+    latency_tracker.publish()
+
+
+def get_storage_latency() -> float:
+    """
+    The recent average latency of the storage providers in seconds. It falls back to zero
+    if no storage call happened within the last minute.
+    """
+    return cache.get(LATENCY_CACHE_KEY, 0.0)
+
+
+def instrument(func: Callable) -> Callable:
+    """
+    Decorator that times a method of a storage provider.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+        """
+        Wrapper that only measures the outermost call to the storage.
+        """
+        depth = _call_depth.get()
+        if depth:
+            return func(self, *args, **kwargs)
+
+        # only the outermost call gets the deadline, such that a call is never stopped
+        # half way through. Calls that are not started are not measured either.
+        with deadlines.storage_call(func.__name__):
+            token = _call_depth.set(depth + 1)
+            start = time.perf_counter()
+            success = False
+            result = None
+            try:
+                result = func(self, *args, **kwargs)
+                success = True
+                return result
+            finally:
+                _call_depth.reset(token)
+                duration = time.perf_counter() - start
+                latency_tracker.add(duration)
+                provider_health.recorder.record(
+                    self.name, func.__name__, duration, success, result
+                )
+                latency.recorder.record("storage", self.name, duration)
+                stats = request_stats_var.get()
+                if stats is not None:
+                    stats.storage_calls += 1
+                    stats.storage_seconds += duration
+                # the id of the request is added by the logging filter. The calls are
+                # only logged on demand, as a busy worker makes many of them.
+                logger.debug(
+                    "storage call",
+                    extra={
+                        "storage_provider": self.name,
+                        "method": func.__name__,
+                        "success": success,
+                        "duration_ms": duration * 1000,
+                    },
+                )
+
+    wrapper.__instrumented__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def install() -> None:
+    """
+    Wrap the storage methods of all the storage providers. Calling it multiple times
+    does not add additional wrappers.
+    """
+    for provider_class in STORAGE_PROVIDER_CLASSES:
+        for method_name in STORAGE_METHODS:
+            method = getattr(provider_class, method_name, None)
+            if method is None or getattr(method, "__instrumented__", False):
+                continue
+            setattr(provider_class, method_name, instrument(method))
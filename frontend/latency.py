@@ -0,0 +1,329 @@
+"""
+Module that keeps a compact history of the latency of each endpoint and each storage
+provider. The durations are counted in sketches of fixed size, whose buckets grow
+logarithmically, such that every percentile is known within `RELATIVE_ACCURACY`. Sketches
+can be merged without losing this accuracy, which allows to store one sketch per worker
+and period and to downsample them into hourly sketches once they are older than
+`LATENCY_HISTORY_FINE_RETENTION`. The sketches are written by the telemetry of the worker.
+The staff can chart the percentiles in the admin.
+"""
+
+import math
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import LatencySketch
+from .telemetry import BufferedRecorder, flusher
+
+# every percentile is within 2 % of the real value
+RELATIVE_ACCURACY = 0.02
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+# durations beyond these limits in ms are counted at the limits, such that a sketch has
+# at most about 500 buckets
+MIN_MS = 0.01
+MAX_MS = 1_000_000.0
+
+# only one worker downsamples the history at a time and at most once per interval
+COMPACTION_CACHE_KEY = "latency:compaction"
+COMPACTION_INTERVAL = 3600
+
+
+@dataclass
+class Sketch:
+    """
+    The distribution of durations in logarithmic buckets.
+
+    Attributes:
+        buckets: the number of durations of each bucket
+        count: the number of durations
+        total_ms: the sum of the durations
+        max_ms: the longest duration
+    """
+
+    buckets: dict[int, int] = field(default_factory=dict)
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def add(self, value_ms: float) -> None:
+        """Count a duration in ms."""
+        index = math.ceil(math.log(min(max(value_ms, MIN_MS), MAX_MS)) / LOG_GAMMA)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+
+    def merge(self, other: "Sketch") -> None:
+        """Add the durations of another sketch."""
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        The percentile of the durations in ms.
+
+        Args:
+            q: the percentile between 0 and 100
+        """
+        if not self.count:
+            return None
+        rank = q / 100 * (self.count - 1)
+        cumulative = 0
+        for index in sorted(self.buckets):
+            cumulative += self.buckets[index]
+            if cumulative > rank:
+                # the value in the middle of the bucket in terms of the relative error
+                return min(2 * GAMMA**index / (GAMMA + 1), self.max_ms)
+        return self.max_ms
+
+    @classmethod
+    def from_record(cls, record: LatencySketch) -> "Sketch":
+        """The sketch of a database row."""
+        return cls(
+            buckets={int(index): count for index, count in record.buckets.items()},
+            count=record.count,
+            total_ms=record.total_ms,
+            max_ms=record.max_ms,
+        )
+
+    def to_record(
+        self, kind: str, name: str, period_start: datetime, resolution: int
+    ) -> LatencySketch:
+        """The database row of the sketch."""
+        return LatencySketch(
+            kind=kind,
+            name=name,
+            period_start=period_start,
+            resolution=resolution,
+            count=self.count,
+            total_ms=round(self.total_ms, 3),
+            max_ms=round(self.max_ms, 3),
+            buckets={str(index): count for index, count in self.buckets.items()},
+        )
+
+
+def period_of(timestamp: datetime, resolution: int) -> datetime:
+    """
+    The start of the period of the given length in s that contains the timestamp.
+    """
+    seconds = int(timestamp.timestamp())
+    return datetime.fromtimestamp(seconds - seconds % resolution, tz=timezone.utc)
+
+
+class LatencyRecorder(BufferedRecorder):
+    """
+    Collects the durations of this worker in one sketch per endpoint and storage
+    provider until the telemetry of the worker writes them.
+    """
+
+    description = "latency history"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending: dict[tuple[str, str], Sketch] = {}
+
+    def record(self, kind: str, name: str, duration: float) -> None:
+        """
+        Count a duration.
+
+        Args:
+            kind: "endpoint" or "storage"
+            name: the name of the url or of the storage provider
+            duration: the duration in s
+        """
+        with self.lock:
+            self.pending.setdefault((kind, name), Sketch()).add(duration * 1000)
+
+    def write(self, pending: dict[tuple[str, str], Sketch]) -> None:
+        """
+        Write the sketches to the database and downsample the history once in a while.
+        """
+        resolution = settings.LATENCY_HISTORY_RESOLUTION
+        period_start = period_of(datetime.now(timezone.utc), resolution)
+        # pylint: disable=E1101
+        LatencySketch.objects.bulk_create(
+            [
+                sketch.to_record(kind, name, period_start, resolution)
+                for (kind, name), sketch in pending.items()
+            ]
+        )
+        if cache.add(COMPACTION_CACHE_KEY, True, COMPACTION_INTERVAL):
+            compact_history()
+
+
+recorder = flusher.register(LatencyRecorder())
+
+
+def compact_history(now: Optional[datetime] = None) -> int:
+    """
+    Merge the sketches that are older than `LATENCY_HISTORY_FINE_RETENTION` into one
+    sketch per hour and remove those older than `LATENCY_HISTORY_RETENTION`.
+
+    Returns:
+        The number of sketches that were merged.
+    """
+    now = now or datetime.now(timezone.utc)
+    coarse = settings.LATENCY_HISTORY_COARSE_RESOLUTION
+    # pylint: disable=E1101
+    with transaction.atomic():
+        LatencySketch.objects.filter(
+            period_start__lt=now - timedelta(seconds=settings.LATENCY_HISTORY_RETENTION)
+        ).delete()
+        fine = list(
+            LatencySketch.objects.filter(
+                resolution__lt=coarse,
+                period_start__lt=period_of(
+                    now - timedelta(seconds=settings.LATENCY_HISTORY_FINE_RETENTION),
+                    coarse,
+                ),
+            )
+        )
+        merged: dict[tuple[str, str, datetime], Sketch] = {}
+        for record in fine:
+            key = (record.kind, record.name, period_of(record.period_start, coarse))
+            merged.setdefault(key, Sketch()).merge(Sketch.from_record(record))
+        LatencySketch.objects.bulk_create(
+            [
+                sketch.to_record(kind, name, period_start, coarse)
+                for (kind, name, period_start), sketch in merged.items()
+            ]
+        )
+        LatencySketch.objects.filter(id__in=[record.id for record in fine]).delete()
+    return len(fine)
+
+
+@dataclass
+class LatencySeries:
+    """
+    The percentiles of an endpoint or a storage provider over time.
+
+    Attributes:
+        kind: "endpoint" or "storage"
+        name: the name of the url or of the storage provider
+        periods: the start of each period
+        percentiles: the 50th, 95th and 99th percentile in ms of each period
+        total: the sketch of the whole time
+    """
+
+    kind: str
+    name: str
+    periods: list[datetime] = field(default_factory=list)
+    percentiles: dict[str, list[Optional[float]]] = field(default_factory=dict)
+    total: Sketch = field(default_factory=Sketch)
+
+
+PERCENTILES = {"p50": 50, "p95": 95, "p99": 99}
+
+
+def chart_periods(days: float, now: datetime) -> tuple[list[datetime], int]:
+    """
+    The start of each period of a chart over the given days and the length of the
+    periods, which is an hour for more than a day and the fine resolution otherwise.
+    """
+    resolution = (
+        settings.LATENCY_HISTORY_RESOLUTION
+        if days <= 1
+        else settings.LATENCY_HISTORY_COARSE_RESOLUTION
+    )
+    periods = [period_of(now - timedelta(days=days), resolution)]
+    while periods[-1] + timedelta(seconds=resolution) <= now:
+        periods.append(periods[-1] + timedelta(seconds=resolution))
+    return periods, resolution
+
+
+def merged_sketches(
+    kinds: Iterable[str], start: datetime, resolution: int
+) -> dict[tuple[str, str], dict[datetime, Sketch]]:
+    """
+    The sketches of all workers since the start, merged per name and period.
+    """
+    slots: dict[tuple[str, str], dict[datetime, Sketch]] = {}
+    # pylint: disable=E1101
+    for record in LatencySketch.objects.filter(
+        kind__in=list(kinds), period_start__gte=start
+    ):
+        slot = slots.setdefault((record.kind, record.name), {})
+        slot.setdefault(period_of(record.period_start, resolution), Sketch()).merge(
+            Sketch.from_record(record)
+        )
+    return slots
+
+
+def get_history(
+    days: float, kinds: Iterable[str] = ("endpoint", "storage")
+) -> list[LatencySeries]:
+    """
+    The percentiles of every endpoint and storage provider with a single query. The
+    sketches of the workers are merged per period, which is an hour for more than a day
+    and the fine resolution otherwise.
+
+    Args:
+        days: how far to look back
+        kinds: the kinds of series
+    """
+    periods, resolution = chart_periods(days, datetime.now(timezone.utc))
+    history = []
+    for (kind, name), sketches in sorted(
+        merged_sketches(kinds, periods[0], resolution).items()
+    ):
+        series = LatencySeries(kind=kind, name=name, periods=periods)
+        for label, q in PERCENTILES.items():
+            series.percentiles[label] = [
+                sketches[period].quantile(q) if period in sketches else None
+                for period in periods
+            ]
+        for sketch in sketches.values():
+            series.total.merge(sketch)
+        history.append(series)
+    return history
+
+
+# the size of the charts in the admin
+CHART_WIDTH = 600
+CHART_HEIGHT = 120
+
+
+def chart_lines(series: LatencySeries) -> dict:
+    """
+    The coordinates of the percentiles in an SVG chart with a linear axis from zero to
+    the highest value. Periods without requests interrupt the lines.
+
+    Returns:
+        The highest value in ms and the polylines of each percentile.
+    """
+    peak = max(
+        (
+            value
+            for values in series.percentiles.values()
+            for value in values
+            if value is not None
+        ),
+        default=0.0,
+    )
+    scale = CHART_HEIGHT / peak if peak else 0.0
+    step = CHART_WIDTH / max(len(series.periods) - 1, 1)
+    lines = {}
+    for label, values in series.percentiles.items():
+        segments: list[list[str]] = [[]]
+        for i, value in enumerate(values):
+            if value is None:
+                segments.append([])
+                continue
+            segments[-1].append(f"{i * step:.1f},{CHART_HEIGHT - value * scale:.1f}")
+        # a single point is drawn as a dot by the round line caps
+        lines[label] = [
+            " ".join(segment * 2 if len(segment) == 1 else segment)
+            for segment in segments
+            if segment
+        ]
+    return {"peak_ms": peak, "lines": lines}
@@ -0,0 +1,367 @@
+"""
+Module that drives the whole job lifecycle for load tests without real hardware. Fake
+spoolers work on the queues of `local` storage providers at a fixed service rate and
+clients replay the requests of the notebooks in `docs/notebooks`:
+`post_job` -> `get_job_status` until the job is done -> `get_job_result`. The fake
+backends and their jobs are shared with the tests in `fixtures`.
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+import requests
+from django.test import Client
+from sqooler.schemes import ResultDict, StatusMsgDict
+
+from .fixtures import JOB_PAYLOAD
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    The nearest-rank percentile of the values, or nan if there are none.
+    """
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    index = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+@dataclass
+class LoadStats:
+    """
+    The measurements of a load test, shared by all threads.
+
+    Attributes:
+        requests: the number of requests per endpoint
+        errors: the number of failed requests per endpoint
+        jobs_failed: the number of jobs that ended with an error or a timeout
+        job_latencies: the time from `post_job` until the result was fetched in s for
+            each job that was finished
+        submitted_at: when each job was posted
+        picked_up_at: when a spooler took each job from the queue
+    """
+
+    requests: dict[str, int] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    jobs_failed: int = 0
+    job_latencies: list[float] = field(default_factory=list)
+    submitted_at: dict[str, float] = field(default_factory=dict)
+    picked_up_at: dict[str, float] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def jobs_done(self) -> int:
+        """The number of jobs that were finished and fetched."""
+        return len(self.job_latencies)
+
+    def record_request(self, endpoint: str, success: bool) -> None:
+        """Count a request to the endpoint."""
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if not success:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def record_submission(self, job_id: str, submitted_at: float) -> None:
+        """Remember when the job was posted."""
+        with self.lock:
+            self.submitted_at[job_id] = submitted_at
+
+    def record_pickup(self, job_id: str, picked_up_at: float) -> None:
+        """A spooler took the job from the queue."""
+        with self.lock:
+            self.picked_up_at[job_id] = picked_up_at
+
+    def record_job(self, latency: Optional[float]) -> None:
+        """A job was finished or failed if there is no latency."""
+        with self.lock:
+            if latency is None:
+                self.jobs_failed += 1
+            else:
+                self.job_latencies.append(latency)
+
+    def summary(self, duration: float) -> dict:
+        """
+        The sustained throughput, the delays and error rates.
+        """
+        with self.lock:
+            n_requests = sum(self.requests.values())
+            # the spooler can take a job before the client got its id back
+            queueing_delays = [
+                picked_up_at - self.submitted_at[job_id]
+                for job_id, picked_up_at in self.picked_up_at.items()
+                if job_id in self.submitted_at
+            ]
+            return {
+                "jobs_per_second": self.jobs_done / duration,
+                "jobs_done": self.jobs_done,
+                "jobs_failed": self.jobs_failed,
+                "requests_per_second": n_requests / duration,
+                "error_rates": {
+                    endpoint: self.errors.get(endpoint, 0) / count
+                    for endpoint, count in sorted(self.requests.items())
+                },
+                "queueing_delay": {
+                    f"p{q}": percentile(queueing_delays, q) for q in (50, 95, 99)
+                },
+                "job_latency": {
+                    f"p{q}": percentile(self.job_latencies, q) for q in (50, 95, 99)
+                },
+            }
+
+
+class FakeSpooler(threading.Thread):
+    """
+    A spooler that takes the jobs of one backend from the queue and finishes them after
+    a fixed service time without executing them.
+
+    Attributes:
+        storage_provider: the `local` storage provider with the queue
+        display_name: the name of the backend
+        service_rate: how many jobs the spooler finishes per s
+        stats: where the pickup of the jobs is recorded
+    """
+
+    def __init__(
+        self,
+        storage_provider,
+        display_name: str,
+        service_rate: float,
+        stats: LoadStats,
+        poll_interval: float = 0.1,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.storage_provider = storage_provider
+        self.display_name = display_name
+        self.service_rate = service_rate
+        self.stats = stats
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+
+    def stop(self) -> None:
+        """Stop after the current job."""
+        self.stop_event.set()
+
+    def run(self) -> None:
+        while not self.stop_event.is_set():
+            next_job = self.storage_provider.get_next_job_in_queue(self.display_name)
+            # an empty queue is marked by the string "None"
+            if next_job.job_id == "None":
+                self.stop_event.wait(self.poll_interval)
+                continue
+            self.stats.record_pickup(next_job.job_id, time.monotonic())
+            # the job "runs" for the service time and is finished even when stopping
+            self.stop_event.wait(1 / self.service_rate)
+            try:
+                self.finish_job(next_job.job_id)
+            except Exception:  # pylint: disable=W0718
+                logger.exception("The fake spooler could not finish a job.")
+                self.stats.record_request("spooler", False)
+            else:
+                self.stats.record_request("spooler", True)
+
+    def finish_job(self, job_id: str) -> None:
+        """
+        Upload a result with fixed data and mark the job as done.
+        """
+        experiment = JOB_PAYLOAD["experiment_0"]
+        result = ResultDict(
+            display_name=self.display_name,
+            backend_name=self.storage_provider.long_backend_name(
+                self.display_name, simulator=True
+            ),
+            backend_version="0.1",
+            job_id=job_id,
+            status="DONE",
+            results=[
+                {
+                    "header": {"name": "experiment_0"},
+                    "shots": experiment["shots"],
+                    "success": True,
+                    "data": {"memory": ["1 0 1 0"] * experiment["shots"]},
+                }
+            ],
+        )
+        status = StatusMsgDict(
+            job_id=job_id,
+            status="DONE",
+            detail="Done by a fake spooler.",
+            error_message="None",
+        )
+        self.storage_provider.update_in_database(
+            result, status, job_id, self.display_name
+        )
+
+
+class DjangoTransport:
+    """
+    Send the requests to this process through the test client of Django.
+    """
+
+    def __init__(self) -> None:
+        self.client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+
+    def get(self, path: str, params: dict) -> tuple[int, dict]:
+        """Send a GET request and return the status code and the json content."""
+        response = self.client.get(path, params)
+        return response.status_code, parse_json(response.content)
+
+    def post(
+        self, path: str, payload: dict, headers: Optional[dict] = None
+    ) -> tuple[int, dict]:
+        """Send a POST request with a json body."""
+        response = self.client.post(
+            path, json.dumps(payload), content_type="application/json", headers=headers
+        )
+        return response.status_code, parse_json(response.content)
+
+
+class HttpTransport:
+    """
+    Send the requests to a running server, like the notebooks do.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get(self, path: str, params: dict) -> tuple[int, dict]:
+        """Send a GET request and return the status code and the json content."""
+        try:
+            response = self.session.get(
+                self.base_url + path, params=params, timeout=self.timeout
+            )
+        except requests.RequestException:
+            return 0, {}
+        return response.status_code, parse_json(response.content)
+
+    def post(
+        self, path: str, payload: dict, headers: Optional[dict] = None
+    ) -> tuple[int, dict]:
+        """Send a POST request with a json body."""
+        try:
+            response = self.session.post(
+                self.base_url + path,
+                json=payload,
+                headers=headers,
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            return 0, {}
+        return response.status_code, parse_json(response.content)
+
+
+def parse_json(content: bytes) -> dict:
+    """
+    The json content of a response, or an empty dict if it is not json.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def submit_job(transport, prefix: str, credentials: dict, stats: LoadStats):
+    """
+    Post a new job.
+
+    Returns:
+        The id of the job or None if the submission failed.
+    """
+    # every submission is a new job, which would be deduplicated without its own key
+    status_code, content = transport.post(
+        prefix + "post_job",
+        {"job": json.dumps(JOB_PAYLOAD), **credentials},
+        headers={"Idempotency-Key": uuid.uuid4().hex},
+    )
+    job_id = content.get("job_id", "None")
+    success = status_code == 200 and job_id != "None"
+    stats.record_request("post_job", success)
+    return job_id if success else None
+
+
+# pylint: disable=R0913
+def wait_for_job(
+    transport,
+    prefix: str,
+    params: dict,
+    stats: LoadStats,
+    *,
+    deadline: float,
+    poll_interval: float,
+) -> bool:
+    """
+    Poll the status of a job until it is done or failed.
+
+    Returns:
+        True if the job was done before the deadline.
+    """
+    status = ""
+    while status not in ("DONE", "ERROR"):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(poll_interval)
+        status_code, content = transport.get(prefix + "get_job_status", params)
+        stats.record_request("get_job_status", status_code == 200)
+        status = content.get("status", "")
+    return status == "DONE"
+
+
+def run_client(
+    transport,
+    backend_name: str,
+    credentials: dict,
+    stats: LoadStats,
+    stop_time: float,
+    *,
+    poll_interval: float = 0.1,
+    job_timeout: float = 30.0,
+) -> None:
+    """
+    Submit jobs one after the other until the stop time, like a user of the notebooks.
+
+    Args:
+        transport: sends the requests
+        backend_name: the full name of the backend
+        credentials: the username and the token of the user
+        stats: where the requests and jobs are recorded
+        stop_time: when to stop submitting jobs
+        poll_interval: the time between two requests for the status in s
+        job_timeout: the time after which a job counts as failed in s
+    """
+    prefix = f"/api/v2/{backend_name}/"
+    while time.monotonic() < stop_time:
+        submitted_at = time.monotonic()
+        job_id = submit_job(transport, prefix, credentials, stats)
+        if job_id is None:
+            stats.record_job(None)
+            time.sleep(poll_interval)
+            continue
+        stats.record_submission(job_id, submitted_at)
+
+        params = {"job_id": job_id, **credentials}
+        if not wait_for_job(
+            transport,
+            prefix,
+            params,
+            stats,
+            deadline=submitted_at + job_timeout,
+            poll_interval=poll_interval,
+        ):
+            stats.record_job(None)
+            continue
+
+        status_code, content = transport.get(prefix + "get_job_result", params)
+        success = status_code == 200 and content.get("status") == "DONE"
+        stats.record_request("get_job_result", success)
+        stats.record_job(time.monotonic() - submitted_at if success else None)
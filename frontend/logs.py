@@ -0,0 +1,111 @@
+"""
+Module that provides the structured logging of the app. The records are handed over to
+a queue in the request thread and written as json lines by a background thread, such
+that logging does not add latency to the requests.
+"""
+
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .context import request_id_var
+
+# the attributes that every log record has. Everything else was passed as `extra`.
+STANDARD_ATTRIBUTES = set(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__.keys()
+) | {"message", "asctime", "taskName"}
+
+
+# pylint: disable=R0903
+class RequestContextFilter(logging.Filter):
+    """
+    Adds the id of the current request to every record.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single json line. The fields that were passed as `extra`
+    become fields of the json object.
+    """
+
+    def format(self, record):
+        log_dict = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                log_dict[key] = value
+        if record.exc_info:
+            log_dict["exception"] = self.formatException(record.exc_info)
+        return json.dumps(log_dict, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Handler that puts the records into a queue. A listener thread takes them out of the
+    queue and writes them to stdout. The thread is started lazily in each process, such
+    that it also works if the server forks its workers.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.stream_handler = logging.StreamHandler(stream or sys.stdout)
+        self.listener = None
+        self.listener_pid = None
+        self.listener_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # the formatting happens in the background thread
+        self.stream_handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Only merge the arguments into the message. The records stay within the process,
+        so there is no need to format or pickle them here.
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def start_listener(self):
+        """
+        Start the background thread if it is not running in this process yet.
+        """
+        with self.listener_lock:
+            if self.listener_pid == os.getpid():
+                return
+            self.listener = QueueListener(
+                self.queue, self.stream_handler, respect_handler_level=True
+            )
+            self.listener.start()
+            self.listener_pid = os.getpid()
+
+    def emit(self, record):
+        if self.listener_pid != os.getpid():
+            self.start_listener()
+        super().emit(record)
+
+    def close(self):
+        """
+        Write out the remaining records. It is called by logging on shutdown.
+        """
+        with self.listener_lock:
+            if self.listener is not None and self.listener_pid == os.getpid():
+                self.listener.stop()
+                self.listener = None
+                self.listener_pid = None
+        super().close()
@@ -0,0 +1,63 @@
+"""
+Management command that archives the old jobs of the storage providers.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from qlued.models import StorageProviderDb
+
+from ...archive import archive_storage_provider
+
+
+class Command(BaseCommand):
+    """
+    Move the finished and deleted jobs that are older than the retention into compressed
+    bundles per backend and month. It is meant to be run regularly by a scheduler.
+    """
+
+    help = "Archive the old jobs of the storage providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.JOB_ARCHIVE_RETENTION_DAYS,
+            help="Jobs older than this are archived.",
+        )
+        parser.add_argument(
+            "--provider",
+            action="append",
+            help="The storage provider to archive. Can be given multiple times. "
+            "Defaults to all active ones.",
+        )
+
+    def handle(self, *args, **options):
+        # pylint: disable=E1101
+        entries = StorageProviderDb.objects.filter(is_active=True).order_by("name")
+        if options["provider"]:
+            entries = entries.filter(name__in=options["provider"])
+        retention = timedelta(days=options["retention_days"])
+
+        failed = []
+        for entry in entries:
+            try:
+                report = archive_storage_provider(entry, retention)
+            # one broken storage provider should not stop the others
+            except (Exception, SystemExit) as err:  # pylint: disable=W0718
+                self.stderr.write(f"{entry.name}: {err}")
+                failed.append(entry.name)
+                continue
+            self.stdout.write(
+                f"{entry.name}: indexed {report['indexed']} jobs, archived "
+                f"{report['archived']} jobs into {report['bundles']} bundles"
+            )
+        if not settings.JOB_ARCHIVE_PERSISTENT:
+            self.stdout.write(
+                "The jobs were kept in the storage providers, because "
+                "JOB_ARCHIVE_PERSISTENT is not set."
+            )
+        if failed:
+            raise CommandError(f"Could not archive {', '.join(failed)}.")
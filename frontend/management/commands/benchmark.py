@@ -0,0 +1,372 @@
+"""
+Management command that benchmarks the parts of the server that are performance critical.
+"""
+
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Callable, Iterator
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.template import engines
+from django.utils import timezone
+
+from sqooler.schemes import LocalLoginInformation
+from sqooler.storage_providers.local import LocalProviderExtended
+
+from main.database import configure_sqlite, database_settings
+
+from ...catalogue import render_cards
+from ...fixtures import JOB_PAYLOAD, backend_config
+from ...models import Device
+from ...validation import JobValidator, ValidatorCache
+
+
+def drop_connections() -> None:
+    """
+    Close the connections of this thread and forget them, such that the next query
+    opens a connection with the current settings.
+    """
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+        del connections[connection.alias]
+
+
+@contextmanager
+def benchmark_database(db_settings: dict, pragmas: bool) -> Iterator[None]:
+    """
+    Point the default database of this process to other settings, like the test runner
+    of Django does it for the test database.
+
+    Args:
+        db_settings: the settings that replace the ones of the default database
+        pragmas: apply the SQLite pragmas to the new connections
+    """
+    default = connections.settings[DEFAULT_DB_ALIAS]
+    saved = dict(default)
+    drop_connections()
+    if not pragmas:
+        connection_created.disconnect(dispatch_uid="configure_sqlite")
+    default.update(db_settings)
+    try:
+        yield
+    finally:
+        drop_connections()
+        default.clear()
+        default.update(saved)
+        connection_created.connect(configure_sqlite, dispatch_uid="configure_sqlite")
+
+
+def fill_database(n_users: int, n_devices: int) -> None:
+    """
+    Create the tables and the users, their sessions and the devices that the requests
+    of the benchmark read.
+    """
+    call_command("migrate", verbosity=0, interactive=False)
+    user_model = get_user_model()
+    users = user_model.objects.bulk_create(
+        user_model(username=f"bench{i}", email=f"bench{i}@example.com")
+        for i in range(n_users)
+    )
+    expire_date = timezone.now() + timedelta(days=1)
+    Session.objects.bulk_create(
+        Session(
+            session_key=f"bench{i:05d}",
+            session_data=SessionStore().encode({SESSION_KEY: str(user.pk)}),
+            expire_date=expire_date,
+        )
+        for i, user in enumerate(users)
+    )
+    Device.objects.bulk_create(fake_device(i, "bench") for i in range(n_devices))
+
+
+def db_request(rng: random.Random, n_users: int) -> None:
+    """
+    The queries of a typical request of a logged in user between the signals that open
+    and close the connections of Django. It reads the session, the user and the first
+    page of the devices and a fifth of the requests writes the session.
+    """
+    request_started.send(sender=Command)
+    try:
+        session = SessionStore(session_key=f"bench{rng.randrange(n_users):05d}")
+        # pylint: disable=E1101
+        get_user_model().objects.get(pk=session[SESSION_KEY])
+        list(Device.objects.order_by("backend_name")[:20])
+        if rng.random() < 0.2:
+            session["last_request"] = time.time()
+            session.save()
+    finally:
+        request_finished.send(sender=Command)
+
+
+def run_db_requests(n_threads: int, duration: float, n_users: int) -> dict:
+    """
+    Run requests against the default database from many threads.
+
+    Returns:
+        The number of requests, errors and the throughput
+    """
+    counts = {"requests": 0, "errors": 0}
+    lock = threading.Lock()
+    stop_time = time.monotonic() + duration
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        requests = errors = 0
+        try:
+            while time.monotonic() < stop_time:
+                try:
+                    db_request(rng, n_users)
+                    requests += 1
+                except OperationalError:
+                    errors += 1
+        finally:
+            connections.close_all()
+        with lock:
+            counts["requests"] += requests
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts["throughput"] = counts["requests"] / duration
+    return counts
+
+
+def fake_device(index: int, salt: str) -> Device:
+    """
+    A device of the benchmark. The salt gives it a new version.
+    """
+    backend_name = f"bench_fermions{index}_simulator"
+    return Device(
+        storage_provider="bench",
+        backend_name=backend_name,
+        display_name=f"fermions{index}",
+        description="Fake device of the benchmark",
+        cold_atom_type="fermion",
+        simulator=True,
+        operational=index % 2 == 0,
+        status={
+            "backend_name": backend_name,
+            "backend_version": "0.1",
+            "operational": index % 2 == 0,
+            "pending_jobs": 0,
+            "status_msg": "",
+        },
+        version=f"{salt}-{index}",
+    )
+
+
+def fake_devices(n_devices: int, salt: str) -> list[dict]:
+    """
+    The devices like the devices page shows them. The salt gives them new versions, such
+    that none of their cards is cached yet.
+    """
+    return [
+        fake_device(i, salt).as_dict("http://www.example.com") for i in range(n_devices)
+    ]
+
+
+def large_job(n_experiments: int, n_instructions: int) -> dict:
+    """
+    A job with many experiments that each repeat the instructions of `JOB_PAYLOAD`.
+    """
+    experiment = JOB_PAYLOAD["experiment_0"]
+    instructions = [
+        experiment["instructions"][i % len(experiment["instructions"])]
+        for i in range(n_instructions)
+    ]
+    return {
+        f"experiment_{i}": {**experiment, "instructions": instructions}
+        for i in range(n_experiments)
+    }
+
+
+def time_call(func: Callable[[], Any], repeats: int = 1) -> float:
+    """
+    The median duration of the calls in s.
+    """
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the server. Each suite prints the numbers before and after an optimization.
+    """
+
+    help = "Benchmark performance critical parts of the server."
+
+    suites = ["db", "cards", "validation"]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--suite",
+            action="append",
+            choices=self.suites,
+            help="The suite to run. Can be given multiple times. Defaults to all.",
+        )
+        parser.add_argument(
+            "--threads", type=int, default=8, help="Number of concurrent clients."
+        )
+        parser.add_argument(
+            "--duration", type=float, default=3.0, help="Duration of each run in s."
+        )
+        parser.add_argument(
+            "--devices",
+            type=int,
+            default=100,
+            help="Number of devices for the cards and the db suite.",
+        )
+        parser.add_argument(
+            "--experiments",
+            type=int,
+            default=100,
+            help="Number of experiments per job for the validation suite.",
+        )
+        parser.add_argument(
+            "--instructions",
+            type=int,
+            default=100,
+            help="Number of instructions per experiment for the validation suite.",
+        )
+
+    def handle(self, *args, **options):
+        for suite in options["suite"] or self.suites:
+            getattr(self, "benchmark_" + suite)(options)
+
+    def benchmark_db(self, options):
+        """
+        Throughput of concurrent requests against SQLite with the database settings of
+        the project before and after the tuning. Before, Django opened a new connection
+        for every request and used the defaults of SQLite.
+        """
+        n_users = 1000
+        self.stdout.write(
+            f"db: {options['threads']} threads for {options['duration']} s each"
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for tuned in (False, True):
+                path = os.path.join(tmp_dir, f"bench_{tuned}.sqlite3")
+                if tuned:
+                    db_settings = database_settings(
+                        "sqlite:///" + path, conn_max_age=settings.MAX_CONN_AGE
+                    )
+                else:
+                    db_settings = {
+                        "ENGINE": "django.db.backends.sqlite3",
+                        "NAME": path,
+                        "CONN_MAX_AGE": 0,
+                        "CONN_HEALTH_CHECKS": False,
+                        "OPTIONS": {},
+                    }
+                with benchmark_database(db_settings, pragmas=tuned):
+                    fill_database(n_users, options["devices"])
+                    result = run_db_requests(
+                        options["threads"], options["duration"], n_users
+                    )
+                label = "tuned" if tuned else "default"
+                self.stdout.write(
+                    f"  {label:>8}: {result['throughput']:10.1f} requests/s, "
+                    f"{result['errors']} locked requests"
+                )
+
+    def benchmark_cards(self, options):
+        """
+        Time to render the device cards of a page without the cache, with an empty
+        cache, with a full cache and after a tenth of the devices changed.
+        """
+        n_devices = options["devices"]
+        self.stdout.write(
+            f"cards: {n_devices} devices, {settings.CACHES['default']['BACKEND']}"
+        )
+        uncached = engines["django"].from_string(
+            "{% for backend in backend_list %}"
+            '{% include "frontend/device_card.html" %}'
+            "{% endfor %}"
+        )
+        devices = fake_devices(n_devices, uuid.uuid4().hex)
+
+        baseline = time_call(lambda: uncached.render({"backend_list": devices}), 5)
+        results = [("uncached", baseline)]
+        results.append(("cold", time_call(lambda: render_cards(devices))))
+        results.append(("warm", time_call(lambda: render_cards(devices), 5)))
+        for device in devices[::10]:
+            device["version"] += "-changed"
+        results.append(("10% changed", time_call(lambda: render_cards(devices))))
+        for label, duration in results:
+            self.stdout.write(
+                f"  {label:>12}: {duration * 1000:10.1f} ms per page, "
+                f"{baseline / duration:5.1f}x"
+            )
+
+    def benchmark_validation(self, options):
+        """
+        Throughput of the validation of a large job, if the configuration of the backend
+        is read from a local storage provider for every job, with the cached validator
+        and for the validation alone. Remote storage providers add their round trip to
+        every job that reads the configuration.
+        """
+        n_experiments = options["experiments"]
+        n_instructions = options["instructions"]
+        self.stdout.write(
+            f"validation: {n_experiments} experiments with {n_instructions} "
+            "instructions each"
+        )
+        job = large_job(n_experiments, n_instructions)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            storage_provider = LocalProviderExtended(
+                LocalLoginInformation(base_path=tmp_dir), "bench"
+            )
+            storage_provider.upload(
+                {**backend_config("bench0"), "max_experiments": n_experiments},
+                "backends/configs",
+                "bench0",
+            )
+            cache = ValidatorCache()
+
+            def fetched():
+                backend_config_in = storage_provider.get_config("bench0")
+                return JobValidator.compile(backend_config_in).validate(job)
+
+            def cached():
+                validator = cache.get(
+                    storage_provider, "bench_bench0_simulator", "bench0"
+                )
+                return validator.validate(job)
+
+            validator = cache.get(storage_provider, "bench_bench0_simulator", "bench0")
+            if validator.validate(job):
+                self.stderr.write("The job of the benchmark is not valid.")
+            baseline = time_call(fetched, 5)
+            results = [
+                ("fetched", baseline),
+                ("cached", time_call(cached, 5)),
+                ("validate", time_call(lambda: validator.validate(job), 5)),
+            ]
+        for label, duration in results:
+            self.stdout.write(
+                f"  {label:>12}: {1 / duration:10.1f} jobs/s, "
+                f"{n_experiments * n_instructions / duration / 1e6:6.2f} M "
+                f"instructions/s, {baseline / duration:5.1f}x"
+            )
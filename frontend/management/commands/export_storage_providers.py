@@ -0,0 +1,44 @@
+"""
+Management command that exports the storage providers as JSON or YAML.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from qlued.models import StorageProviderDb
+
+from ...storage_bulk import FORMATS, dump_records, export_storage_providers
+
+
+class Command(BaseCommand):
+    """
+    Export the storage providers including their logins. Keep the output secret.
+    """
+
+    help = "Export the storage providers as JSON or YAML."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=FORMATS, default="json", help="The output format."
+        )
+        parser.add_argument(
+            "--owner", help="Only export the storage providers of this user."
+        )
+        parser.add_argument(
+            "--output", help="The file to write to. Defaults to the standard output."
+        )
+
+    def handle(self, *args, **options):
+        # pylint: disable=E1101
+        queryset = StorageProviderDb.objects.order_by("name")
+        if options["owner"]:
+            queryset = queryset.filter(owner__username=options["owner"])
+        try:
+            text = dump_records(export_storage_providers(queryset), options["format"])
+        except ValueError as err:
+            raise CommandError(err) from err
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(text)
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,67 @@
+"""
+Management command that uploads the jobs of the write-behind queue.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...submission import exhausted_jobs, flush_pending_jobs
+
+
+class Command(BaseCommand):
+    """
+    Upload the pending jobs to their storage providers in batches. It can be run
+    regularly by a scheduler, or keep running next to the web workers with `--interval`.
+    """
+
+    help = "Upload the jobs of the write-behind queue to the storage providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.JOB_WRITE_BEHIND_BATCH_SIZE,
+            help="The number of jobs that are uploaded together.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=None,
+            help="Keep running and look for pending jobs every interval in s.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            uploaded, failed = 0, 0
+            while True:
+                report = flush_pending_jobs(batch_size)
+                uploaded += report["uploaded"]
+                failed += report["failed"]
+                # failed jobs are only tried again in the next round
+                if report["uploaded"] < batch_size:
+                    break
+            if options["interval"] is None:
+                break
+            if uploaded or failed:
+                self.stdout.write(f"uploaded {uploaded} jobs, {failed} failed")
+                self.report_exhausted()
+            time.sleep(options["interval"])
+
+        self.stdout.write(f"uploaded {uploaded} jobs, {failed} failed")
+        self.report_exhausted()
+        if failed:
+            raise CommandError(f"Could not upload {failed} jobs.")
+
+    def report_exhausted(self) -> None:
+        """
+        Point to the jobs that are not tried again, such that they are not forgotten.
+        """
+        n_jobs = exhausted_jobs()
+        if n_jobs:
+            self.stderr.write(
+                f"{n_jobs} jobs failed {settings.JOB_WRITE_BEHIND_MAX_ATTEMPTS} times "
+                "and wait under Pending jobs in the admin."
+            )
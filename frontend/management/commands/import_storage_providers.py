@@ -0,0 +1,82 @@
+"""
+Management command that imports storage providers from JSON or YAML.
+"""
+
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ...storage_bulk import FORMATS, import_storage_providers, parse_records
+
+
+class Command(BaseCommand):
+    """
+    Import the storage providers of a file. Nothing is written if any of them is invalid.
+    """
+
+    help = "Create or update storage providers from a JSON or YAML file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file with the storage providers.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="The format of the file. Defaults to the file extension.",
+        )
+        parser.add_argument(
+            "--owner", help="The owner of the storage providers that do not name one."
+        )
+        parser.add_argument(
+            "--skip-credential-check",
+            action="store_true",
+            help="Do not check that the storage providers can be reached.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Number of concurrent credential checks.",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "yaml" if options["path"].endswith((".yaml", ".yml")) else "json"
+
+        owner = None
+        if options["owner"]:
+            try:
+                owner = get_user_model().objects.get_by_natural_key(options["owner"])
+            except get_user_model().DoesNotExist as err:
+                raise CommandError(f"Unknown owner {options['owner']!r}.") from err
+
+        try:
+            with open(options["path"], encoding="utf-8") as file:
+                records = parse_records(file.read(), fmt)
+        except (OSError, ValueError) as err:
+            raise CommandError(err) from err
+
+        start = time.perf_counter()
+        result = import_storage_providers(
+            records,
+            default_owner=owner,
+            credentials=not options["skip_credential_check"],
+            max_workers=options["workers"],
+        )
+        duration = time.perf_counter() - start
+
+        if result.errors:
+            for name, errors in result.errors.items():
+                for error in errors:
+                    self.stderr.write(f"{name}: {error}")
+            raise CommandError(
+                f"{len(result.errors)} of {len(records)} storage providers are invalid. "
+                "Nothing was imported."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {len(result.created)} and updated {len(result.updated)} "
+                f"storage providers in {duration:.2f} s."
+            )
+        )
@@ -0,0 +1,203 @@
+"""
+Management command that runs fake spoolers and clients against the job API.
+"""
+
+import contextlib
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import pytz
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+
+from qlued.models import StorageProviderDb, Token
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from ...fixtures import backend_config
+from ...loadtest import (
+    DjangoTransport,
+    FakeSpooler,
+    HttpTransport,
+    LoadStats,
+    run_client,
+)
+
+LOADTEST_NAME = "loadtest"
+
+
+class Command(BaseCommand):
+    """
+    Drive the whole job lifecycle with fake spoolers on a temporary `local` storage
+    provider and report the sustained throughput, queueing delay and error rates.
+    """
+
+    help = "Load test the job API with fake spoolers and clients."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--spoolers", type=int, default=2, help="Number of fake backends."
+        )
+        parser.add_argument(
+            "--service-rate",
+            type=float,
+            default=20.0,
+            help="Jobs that each spooler finishes per s.",
+        )
+        parser.add_argument(
+            "--clients", type=int, default=8, help="Number of concurrent clients."
+        )
+        parser.add_argument(
+            "--duration", type=float, default=10.0, help="Duration of the run in s."
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.1,
+            help="Time between two status requests of a client in s.",
+        )
+        parser.add_argument(
+            "--job-timeout",
+            type=float,
+            default=30.0,
+            help="Time after which a client gives up on a job in s.",
+        )
+        parser.add_argument(
+            "--url",
+            help="Send the requests to a running server with the same database, "
+            "e.g. http://localhost:8000. Defaults to this process.",
+        )
+        parser.add_argument(
+            "--no-ratelimit",
+            action="store_true",
+            help="Disable the rate limits for requests to this process.",
+        )
+
+    def handle(self, *args, **options):
+        # pylint: disable=E1101
+        if StorageProviderDb.objects.filter(name=LOADTEST_NAME).exists():
+            raise CommandError(
+                f"The storage provider {LOADTEST_NAME!r} exists already. "
+                "Remove it before the load test."
+            )
+        storage_dir = tempfile.mkdtemp(prefix="qlued-loadtest-")
+        user, user_created = get_user_model().objects.get_or_create(
+            username=LOADTEST_NAME
+        )
+        token = Token.objects.filter(user=user).first()
+        token_created = token is None
+        if token_created:
+            token = Token.objects.create(
+                key=uuid.uuid4().hex,
+                user=user,
+                created_at=datetime.now(pytz.utc),
+                is_active=True,
+            )
+        entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name=LOADTEST_NAME,
+            owner=user,
+            description="Temporary storage provider of the load test",
+            login={"base_path": storage_dir},
+            is_active=True,
+        )
+        try:
+            settings_context = (
+                override_settings(RATELIMIT_ENABLED=False)
+                if options["no_ratelimit"]
+                else contextlib.nullcontext()
+            )
+            with settings_context:
+                stats = self.run(entry, user.username, token.key, options)
+        finally:
+            entry.delete()
+            if user_created:
+                user.delete()
+            elif token_created:
+                token.delete()
+            shutil.rmtree(storage_dir, ignore_errors=True)
+        self.report(stats.summary(options["duration"]), options)
+
+    def run(self, entry, username: str, token: str, options) -> LoadStats:
+        """
+        Start the spoolers and the clients and wait until the time is up.
+        """
+        storage_provider = get_storage_provider_from_entry(entry)
+        display_names = [f"fake{i}" for i in range(options["spoolers"])]
+        for display_name in display_names:
+            storage_provider.upload(
+                backend_config(display_name), "backends/configs", display_name
+            )
+
+        stats = LoadStats()
+        spoolers = [
+            FakeSpooler(storage_provider, display_name, options["service_rate"], stats)
+            for display_name in display_names
+        ]
+        for spooler in spoolers:
+            spooler.start()
+
+        stop_time = time.monotonic() + options["duration"]
+
+        def client(index: int) -> None:
+            transport = (
+                HttpTransport(options["url"]) if options["url"] else DjangoTransport()
+            )
+            display_name = display_names[index % len(display_names)]
+            try:
+                run_client(
+                    transport,
+                    storage_provider.long_backend_name(display_name, simulator=True),
+                    {"username": username, "token": token},
+                    stats,
+                    stop_time,
+                    poll_interval=options["poll_interval"],
+                    job_timeout=options["job_timeout"],
+                )
+            finally:
+                connection.close()
+
+        clients = [
+            threading.Thread(target=client, args=(i,))
+            for i in range(options["clients"])
+        ]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        for spooler in spoolers:
+            spooler.stop()
+        for spooler in spoolers:
+            spooler.join()
+        return stats
+
+    def report(self, summary: dict, options) -> None:
+        """
+        Print the results of the run.
+        """
+        capacity = options["spoolers"] * options["service_rate"]
+        self.stdout.write(
+            f"loadtest: {options['clients']} clients, {options['spoolers']} spoolers "
+            f"at {options['service_rate']} jobs/s for {options['duration']} s"
+        )
+        self.stdout.write(
+            f"  throughput: {summary['jobs_per_second']:8.2f} jobs/s "
+            f"(capacity {capacity:.2f} jobs/s), "
+            f"{summary['requests_per_second']:.1f} requests/s"
+        )
+        self.stdout.write(
+            f"  jobs: {summary['jobs_done']} done, {summary['jobs_failed']} failed"
+        )
+        for label in ("queueing_delay", "job_latency"):
+            values = ", ".join(
+                f"{name} {value * 1000:.0f} ms"
+                for name, value in summary[label].items()
+            )
+            self.stdout.write(f"  {label.replace('_', ' ')}: {values}")
+        for endpoint, rate in summary["error_rates"].items():
+            self.stdout.write(f"  errors {endpoint}: {rate:.1%}")
@@ -0,0 +1,42 @@
+"""
+Management command that refreshes the catalogue of the devices.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import deadlines
+from ...catalogue import CATALOGUE_CACHE_KEY, refresh_catalogue
+from ...models import Device
+
+
+class Command(BaseCommand):
+    """
+    Copy the backends of all active storage providers into the catalogue of the
+    devices. If it is run regularly by a scheduler, the requests to the devices page
+    do not have to refresh the catalogue themselves.
+    """
+
+    help = "Refresh the catalogue of the devices from the storage providers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=settings.REQUEST_DEADLINE,
+            help="The time in s that all storage providers get together.",
+        )
+
+    def handle(self, *args, **options):
+        with deadlines.budget(options["timeout"]):
+            missing_providers = refresh_catalogue()
+        cache.set(
+            CATALOGUE_CACHE_KEY, missing_providers, settings.DEVICE_CATALOGUE_MAX_AGE
+        )
+        # pylint: disable=E1101
+        self.stdout.write(f"{Device.objects.count()} devices in the catalogue")
+        if missing_providers:
+            raise CommandError(
+                f"Could not reach {', '.join(missing_providers)} in time."
+            )
@@ -0,0 +1,617 @@
+"""
+Module that contains the middleware of the app.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.http import HttpResponse, JsonResponse
+
+from qlued.models import StorageProviderDb, Token
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import latency, ratelimit
+from .archive import read_archived_job
+from .context import RequestStats, deadline_var, request_id_var, request_stats_var
+from .deadlines import DeadlineExceeded, get_budget
+from .instrumentation import get_storage_latency
+from .models import RequestProfile
+from .profiling import SamplingProfiler
+from .routers import PrimaryPin, primary_pin_var
+from .submission import read_pending_job, submitted_var
+from .validation import validators
+
+access_logger = logging.getLogger("frontend.access")
+
+# request ids that are passed in by a proxy are only accepted if they look harmless
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def get_api_token(request) -> str:
+    """
+    Get the user token of an API request. It is either part of the query or of the
+    json body.
+
+    Args:
+        request: the request to be handled.
+
+    Returns:
+        The token or an empty string if none was provided.
+    """
+    token = request.GET.get("token", "")
+    if token or request.method != "POST":
+        return token
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return ""
+    if isinstance(body, dict):
+        return str(body.get("token", ""))
+    return ""
+
+
+def api_error_response(detail: str, status: int, retry_after: float) -> JsonResponse:
+    """
+    A response in the format of the status messages of the API, which tells the client
+    when to try again.
+    """
+    response = JsonResponse(
+        {
+            "job_id": "None",
+            "status": "ERROR",
+            "detail": detail,
+            "error_message": detail,
+        },
+        status=status,
+    )
+    # a bucket without refill never recovers, so we cap the waiting time at one day
+    response["Retry-After"] = str(max(1, math.ceil(min(retry_after, 86400))))
+    return response
+
+
+class RateLimitMiddleware:
+    """
+    Admission control for the API. Each request consumes a token of the bucket of the
+    user and of the backend, or none if one of them is empty. Once the storage providers
+    become too slow, all the limited requests are rejected until the latency recovers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    # pylint: disable=W0613
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Decide if the request is admitted before the view is called.
+        """
+        if not settings.RATELIMIT_ENABLED:
+            return None
+        match = request.resolver_match
+        if match is None or match.url_name not in settings.RATELIMIT_URL_NAMES:
+            return None
+
+        threshold = settings.STORAGE_LATENCY_SHED_THRESHOLD
+        if threshold and get_storage_latency() > threshold:
+            return api_error_response(
+                "The storage is overloaded. Please try again later.",
+                status=503,
+                retry_after=settings.STORAGE_LATENCY_SHED_RETRY_AFTER,
+            )
+
+        names = {}
+        token = get_api_token(request)
+        if token:
+            names["user"] = token
+        backend_name = match.kwargs.get("backend_name")
+        if backend_name:
+            names["backend"] = backend_name
+        wait, scope = ratelimit.check(names)
+        if wait:
+            return api_error_response(
+                f"Too many requests for this {scope}.", status=429, retry_after=wait
+            )
+        return None
+
+
+class DeadlineMiddleware:
+    """
+    Give each request a time budget for the storage providers, which depends on the
+    url. Requests that run out of time get a response that tells the client to try again
+    instead of an error of the worker.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.started_at = time.monotonic()
+        token = deadline_var.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            deadline_var.reset(token)
+
+    # pylint: disable=W0613
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Start the deadline once the url is known.
+        """
+        match = request.resolver_match
+        budget = get_budget(match.url_name if match else "")
+        if budget is not None:
+            deadline_var.set(request.started_at + budget)
+
+    def process_exception(self, request, exception):
+        """
+        Answer the requests that ran out of time with a degraded response.
+        """
+        if not isinstance(exception, DeadlineExceeded):
+            return None
+        detail = "The storage did not answer in time. Please try again later."
+        match = request.resolver_match
+        if match is not None and "backend_name" in match.kwargs:
+            return api_error_response(
+                detail, status=503, retry_after=settings.DEADLINE_RETRY_AFTER
+            )
+        response = HttpResponse(detail, status=503, content_type="text/plain")
+        response["Retry-After"] = str(settings.DEADLINE_RETRY_AFTER)
+        return response
+
+
+class ArchiveMiddleware:
+    """
+    Serve the status and result of jobs that are not in the storage provider. These are
+    either still in the write-behind queue or archived already. Both are only consulted
+    if the storage provider did not know the job, such that the usual requests do not
+    pay for it.
+    """
+
+    # the archived members that are served for each url
+    MEMBERS = {"get_job_status": "status", "get_job_result": "result"}
+
+    # error responses are small, so larger responses are not parsed at all
+    MAX_ERROR_SIZE = 4096
+
+    # requests that were rejected before they reached the storage provider
+    REJECTED_STATUS_CODES = (401, 403, 429, 503)
+
+    # the detail of the status that the storage providers return for unknown jobs
+    NOT_FOUND_DETAIL = "Could not find the status file."
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = request.resolver_match
+        if match is None or match.url_name not in self.MEMBERS:
+            return response
+        if not self.job_not_found(response):
+            return response
+
+        job_id = request.GET.get("job_id", "")
+        backend_parts = match.kwargs.get("backend_name", "").split("_")
+        if not job_id or len(backend_parts) < 2:
+            return response
+        # the storage provider checked the token before, but it did not find the job
+        # pylint: disable=E1101
+        if not Token.objects.filter(
+            key=request.GET.get("token", ""),
+            user__username=request.GET.get("username", ""),
+            is_active=True,
+        ).exists():
+            return response
+        content = read_pending_job(
+            backend_parts[0], backend_parts[1], job_id
+        ) or read_archived_job(
+            backend_parts[0], backend_parts[1], job_id, self.MEMBERS[match.url_name]
+        )
+        if content is None:
+            return response
+        return JsonResponse(content)
+
+    def job_not_found(self, response) -> bool:
+        """
+        Did the API fail to find the job in the storage provider ?
+        """
+        if (
+            getattr(response, "streaming", False)
+            or response.status_code in self.REJECTED_STATUS_CODES
+        ):
+            return False
+        if response.status_code == 200 and len(response.content) > self.MAX_ERROR_SIZE:
+            return False
+        try:
+            content = json.loads(response.content)
+        except ValueError:
+            return False
+        # failed jobs are reported with an error, too, but with their own detail
+        return (
+            isinstance(content, dict)
+            and content.get("status") == "ERROR"
+            and content.get("detail") == self.NOT_FOUND_DETAIL
+        )
+
+
+class IdempotencyMiddleware:
+    """
+    Deduplicates job submissions. A job that is submitted again by the same user to the
+    same backend within `IDEMPOTENCY_WINDOW` gets the response of the first submission,
+    without another upload to the storage provider. Duplicates are recognized by the
+    `Idempotency-Key` header or, if `IDEMPOTENCY_CONTENT_HASH` is set, by a hash of the
+    job.
+    """
+
+    header = "Idempotency-Key"
+
+    # the marker of a submission that is still handled
+    PENDING = "pending"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        cache_key = getattr(request, "idempotency_cache_key", None)
+        if cache_key is None:
+            return response
+        content = None
+        if response.status_code == 200 and not getattr(response, "streaming", False):
+            try:
+                content = json.loads(response.content)
+            except ValueError:
+                pass
+        if isinstance(content, dict) and content.get("job_id", "None") != "None":
+            cache.set(
+                cache_key,
+                {"fingerprint": request.idempotency_fingerprint, "response": content},
+                timeout=settings.IDEMPOTENCY_WINDOW,
+            )
+        else:
+            # failed submissions can be retried right away
+            cache.delete(cache_key)
+        return response
+
+    # pylint: disable=W0613
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Answer duplicates from the index and claim the key for new submissions.
+        """
+        match = request.resolver_match
+        if (
+            not settings.IDEMPOTENCY_WINDOW
+            or request.method != "POST"
+            or match is None
+            or match.url_name not in settings.IDEMPOTENCY_URL_NAMES
+        ):
+            return None
+        submission = self.read_submission(request, match.kwargs.get("backend_name", ""))
+        if submission is None:
+            return None
+        cache_key, fingerprint = submission
+        if cache.add(cache_key, self.PENDING, timeout=settings.IDEMPOTENCY_WINDOW):
+            request.idempotency_cache_key = cache_key
+            request.idempotency_fingerprint = fingerprint
+            return None
+        return self.replay(cache.get(cache_key), fingerprint)
+
+    def read_submission(self, request, backend_name: str) -> Optional[tuple[str, str]]:
+        """
+        The key of the submission in the index and the fingerprint of its job.
+
+        Returns:
+            None if the submission is not deduplicated, e.g. because the payload is
+            invalid or the token does not belong to the user.
+        """
+        try:
+            body = json.loads(request.body)
+            job = json.loads(body["job"])
+        except (ValueError, KeyError, TypeError):
+            # the api explains the problem with the payload
+            return None
+        key = request.headers.get(self.header, "")
+        if not key and not settings.IDEMPOTENCY_CONTENT_HASH:
+            return None
+        # only the owner of a token may claim a key or get an earlier response
+        username = str(body.get("username", ""))
+        # pylint: disable=E1101
+        if not Token.objects.filter(
+            key=str(body.get("token", "")), user__username=username, is_active=True
+        ).exists():
+            return None
+        # the canonical form of the job does not depend on the order of the keys
+        fingerprint = hashlib.sha256(
+            json.dumps(job, sort_keys=True, separators=(",", ":")).encode()
+        ).hexdigest()
+        cache_key = (
+            "idempotency:"
+            + hashlib.sha256(
+                json.dumps([username, backend_name, key or fingerprint]).encode()
+            ).hexdigest()
+        )
+        return cache_key, fingerprint
+
+    def replay(self, entry, fingerprint: str):
+        """
+        The response to a duplicate, given the entry of the earlier submission.
+        """
+        if entry is None:
+            # the earlier submission failed or expired in the meantime
+            return None
+        if entry == self.PENDING:
+            return api_error_response(
+                "The same job is submitted right now. Please try again.",
+                status=409,
+                retry_after=1,
+            )
+        if entry["fingerprint"] != fingerprint:
+            return api_error_response(
+                f"The {self.header} was already used for another job.",
+                status=422,
+                retry_after=settings.IDEMPOTENCY_WINDOW,
+            )
+        response = JsonResponse(entry["response"])
+        response["Idempotent-Replayed"] = "true"
+        return response
+
+
+class SubmissionMiddleware:
+    """
+    Hooks into the submission of jobs through the API. Jobs beyond the limits of their
+    backend are rejected before the view is called. Within the view, the storage
+    providers upload the job and its status concurrently or accept the job into the
+    write-behind queue, see `submission.install`.
+    """
+
+    url_name = "post_job"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = submitted_var.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            submitted_var.reset(token)
+
+    # pylint: disable=W0613
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Validate the job and switch on the hooks for the view.
+        """
+        match = request.resolver_match
+        if match is None or match.url_name != self.url_name:
+            return None
+        response = self.validate(request, match.kwargs.get("backend_name", ""))
+        if response is None:
+            submitted_var.set({})
+        return response
+
+    def validate(self, request, backend_name: str) -> Optional[JsonResponse]:
+        """
+        Check the job against the limits of the backend.
+
+        Returns:
+            The error response if the job cannot be run, else None. Submissions that the
+            API rejects anyway, e.g. because the payload is broken, are left to it. The
+            limits of the backends are public, so the token is checked by the API only.
+        """
+        if not settings.JOB_VALIDATION:
+            return None
+        job_dict = self.read_job(request)
+        backend_parts = backend_name.split("_")
+        entry = None
+        if job_dict is not None and len(backend_parts) >= 2:
+            # pylint: disable=E1101
+            entry = StorageProviderDb.objects.filter(
+                name=backend_parts[0], is_active=True
+            ).first()
+        if entry is None:
+            return None
+        try:
+            validator = validators.get(
+                get_storage_provider_from_entry(entry), backend_name, backend_parts[1]
+            )
+        except FileNotFoundError:
+            return self.error_response("Unknown back-end!", 404)
+        errors = validator.validate(job_dict)
+        if not errors:
+            return None
+        return self.error_response(" ".join(errors), 422)
+
+    def read_job(self, request) -> Optional[dict]:
+        """
+        The job of the submission or None if it cannot be read.
+        """
+        try:
+            job_dict = json.loads(json.loads(request.body)["job"])
+        except (ValueError, KeyError, TypeError):
+            return None
+        return job_dict if isinstance(job_dict, dict) else None
+
+    def error_response(self, detail: str, status: int) -> JsonResponse:
+        """
+        An error in the format of the status messages of the API.
+        """
+        return JsonResponse(
+            {
+                "job_id": "None",
+                "status": "ERROR",
+                "detail": detail,
+                "error_message": detail,
+            },
+            status=status,
+        )
+
+
+# pylint: disable=R0903
+class RequestLogMiddleware:
+    """
+    Assigns an id to every request and writes a structured access log entry once the
+    response is ready. The id is kept in the request context, such that the calls to the
+    storage providers are logged with it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        stats = RequestStats()
+        id_token = request_id_var.set(request_id)
+        stats_token = request_stats_var.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats_var.reset(stats_token)
+            request_id_var.reset(id_token)
+        duration = time.perf_counter() - start
+
+        response["X-Request-ID"] = request_id
+        match = request.resolver_match
+        # only use the user if it was already loaded, such that we do not add a query
+        user = getattr(request, "_cached_user", None)
+        access_logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "request_id": request_id,
+                "user": user.get_username() if user is not None else "",
+                "url_name": match.url_name if match is not None else "",
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "storage_ms": round(stats.storage_seconds * 1000, 3),
+                "storage_calls": stats.storage_calls,
+            },
+        )
+        # the durations are written by the telemetry once the response was sent
+        if match is not None and match.url_name:
+            latency.recorder.record("endpoint", match.url_name, duration)
+        return response
+
+
+# pylint: disable=R0903
+class ReplicaPinningMiddleware:
+    """
+    Keeps the reads of a client on the primary database for a short time after it wrote
+    to the database. The time is remembered in a cookie.
+    """
+
+    cookie_name = "db_primary_until"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            pinned_until = 0.0
+        pin = PrimaryPin(pinned=pinned_until > time.time())
+        token = primary_pin_var.set(pin)
+        try:
+            response = self.get_response(request)
+        finally:
+            primary_pin_var.reset(token)
+
+        if pin.wrote:
+            pin_seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                self.cookie_name,
+                str(time.time() + pin_seconds),
+                max_age=pin_seconds,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a single request if a staff user asks for it through the query parameter
+    `profile` or the header `X-Profile`. All other requests only pay for a lookup in the
+    query string and the headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        # the user might change within the request, e.g. on logout
+        user = request.user
+        start = time.perf_counter()
+        with SamplingProfiler(
+            threading.get_ident(), settings.PROFILER_INTERVAL
+        ) as profiler:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        profile = self.store_profile(request, user, response, profiler, duration)
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
+
+    def wants_profile(self, request) -> bool:
+        """
+        Only staff users can trigger the profiler. The user is only loaded if the
+        trigger is present.
+        """
+        if not settings.PROFILER_ENABLED:
+            return False
+        if "HTTP_X_PROFILE" not in request.META and "profile=" not in request.META.get(
+            "QUERY_STRING", ""
+        ):
+            return False
+        if "HTTP_X_PROFILE" not in request.META and "profile" not in request.GET:
+            return False
+        return request.user.is_staff
+
+    # pylint: disable=R0913
+    def store_profile(self, request, user, response, profiler, duration):
+        """
+        Save the profile and remove the oldest ones beyond the limit.
+        """
+        match = request.resolver_match
+        url_name = match.url_name if match is not None and match.url_name else ""
+        profile = RequestProfile(
+            user=user,
+            method=request.method,
+            path=request.path[:500],
+            url_name=url_name,
+            status=response.status_code,
+            duration_ms=duration * 1000,
+            n_samples=profiler.n_samples,
+        )
+        file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{url_name or 'request'}.folded"
+        profile.profile.save(file_name, ContentFile(profiler.folded()), save=True)
+
+        # pylint: disable=E1101
+        outdated = RequestProfile.objects.all()[settings.PROFILER_MAX_PROFILES :]
+        for old_profile in outdated:
+            old_profile.profile.delete(save=False)
+            old_profile.delete()
+        return profile
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("frontend", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimit",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[("user", "User token"), ("backend", "Backend")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        blank=True,
+                        help_text="The user token or the backend name. Leave empty for the default.",
+                        max_length=200,
+                    ),
+                ),
+                (
+                    "capacity",
+                    models.PositiveIntegerField(
+                        default=60,
+                        help_text="The maximal number of requests in a burst.",
+                    ),
+                ),
+                (
+                    "refill_rate",
+                    models.FloatField(
+                        default=1.0,
+                        help_text="The allowed number of requests per second.",
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "name"), name="unique_rate_limit_scope_name"
+                    )
+                ],
+            },
+        ),
+    ]
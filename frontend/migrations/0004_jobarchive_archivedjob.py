@@ -0,0 +1,92 @@
+# Generated by Django 5.0.6 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("frontend", "0003_requestprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("storage_provider", models.CharField(max_length=100)),
+                ("display_name", models.CharField(max_length=100)),
+                (
+                    "month",
+                    models.DateField(help_text="The first day of the month."),
+                ),
+                ("bundle", models.FileField(upload_to="archives/")),
+                ("n_jobs", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-month", "storage_provider", "display_name"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("storage_provider", "display_name", "month"),
+                        name="unique_job_archive_backend_month",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("storage_provider", models.CharField(max_length=100)),
+                ("display_name", models.CharField(max_length=100)),
+                ("job_id", models.CharField(max_length=100)),
+                (
+                    "is_deleted",
+                    models.BooleanField(
+                        default=False, help_text="The job ended with an error."
+                    ),
+                ),
+                ("finished_at", models.DateTimeField()),
+                (
+                    "archive",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="frontend.jobarchive",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["storage_provider", "archive", "finished_at"],
+                        name="archived_job_pending_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("storage_provider", "job_id"),
+                        name="unique_archived_job_provider_job_id",
+                    )
+                ],
+            },
+        ),
+    ]
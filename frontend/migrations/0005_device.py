@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0004_jobarchive_archivedjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Device",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("storage_provider", models.CharField(max_length=100)),
+                ("backend_name", models.CharField(max_length=200, unique=True)),
+                ("display_name", models.CharField(max_length=100)),
+                ("description", models.TextField(blank=True)),
+                ("cold_atom_type", models.CharField(max_length=20)),
+                ("simulator", models.BooleanField()),
+                ("operational", models.BooleanField()),
+                (
+                    "status",
+                    models.JSONField(
+                        help_text="The status of the backend as in the API."
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["display_name", "backend_name"],
+                "indexes": [
+                    models.Index(
+                        fields=["cold_atom_type", "simulator", "operational"],
+                        name="device_filter_idx",
+                    ),
+                    models.Index(
+                        fields=["storage_provider"], name="device_provider_idx"
+                    ),
+                    models.Index(
+                        fields=["display_name", "backend_name"], name="device_order_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0005_device"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StorageProviderHealth",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("storage_provider", models.CharField(max_length=100)),
+                ("recorded_at", models.DateTimeField()),
+                ("n_calls", models.PositiveIntegerField()),
+                ("n_errors", models.PositiveIntegerField()),
+                (
+                    "latencies",
+                    models.JSONField(
+                        help_text="A random sample of the durations of the calls in ms."
+                    ),
+                ),
+                ("last_success_at", models.DateTimeField(blank=True, null=True)),
+                ("backend_count", models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["storage_provider", "recorded_at"],
+                        name="provider_health_recent_idx",
+                    ),
+                    models.Index(
+                        fields=["recorded_at"], name="provider_health_expiry_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-19 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0006_storageproviderhealth"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="device",
+            name="version",
+            field=models.CharField(
+                blank=True,
+                help_text="A hash of the configuration and status, which keys the cached card.",
+                max_length=40,
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0007_device_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("storage_provider", models.CharField(max_length=100)),
+                ("display_name", models.CharField(max_length=100)),
+                ("username", models.CharField(max_length=150)),
+                ("job_id", models.CharField(max_length=200)),
+                ("job", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("lease", models.CharField(blank=True, max_length=32)),
+                ("leased_until", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="pendingjob",
+            constraint=models.UniqueConstraint(
+                fields=("storage_provider", "job_id"), name="pending_job_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.0.6 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0008_pendingjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatencySketch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("endpoint", "Endpoint"),
+                            ("storage", "Storage provider"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("period_start", models.DateTimeField()),
+                (
+                    "resolution",
+                    models.PositiveIntegerField(
+                        help_text="The length of the period in s."
+                    ),
+                ),
+                ("count", models.PositiveIntegerField()),
+                ("total_ms", models.FloatField()),
+                ("max_ms", models.FloatField()),
+                (
+                    "buckets",
+                    models.JSONField(
+                        help_text="The number of durations in each logarithmic bucket."
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "latency history",
+                "ordering": ["period_start"],
+                "indexes": [
+                    models.Index(fields=["period_start"], name="latency_period_idx"),
+                    models.Index(
+                        fields=["resolution", "period_start"],
+                        name="latency_resolution_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-19 07:49
+
+import frontend.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0009_latencysketch"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="jobarchive",
+            name="bundle",
+            field=models.FileField(
+                storage=frontend.models.job_archive_storage, upload_to="archives/"
+            ),
+        ),
+    ]
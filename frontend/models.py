@@ -2,6 +2,8 @@
 The models that define our sql tables for the app.
 """
 
+from django.conf import settings
+from django.core.files.storage import storages
 from django.db import models
 
 
@@ -12,3 +14,286 @@ class Impressum(models.Model):
     """
 
     impressum = models.TextField(default="No impressum known.")
+
+
+class RateLimit(models.Model):
+    """
+    A token-bucket rate limit for the API. It applies either to a user token or to a
+    backend. A rule with an empty name is the default for its scope.
+    """
+
+    SCOPE_CHOICES = [
+        ("user", "User token"),
+        ("backend", "Backend"),
+    ]
+
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    name = models.CharField(
+        max_length=200,
+        blank=True,
+        help_text="The user token or the backend name. Leave empty for the default.",
+    )
+    capacity = models.PositiveIntegerField(
+        default=60, help_text="The maximal number of requests in a burst."
+    )
+    refill_rate = models.FloatField(
+        default=1.0, help_text="The allowed number of requests per second."
+    )
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "name"], name="unique_rate_limit_scope_name"
+            )
+        ]
+
+    def __str__(self):
+        name = self.name or "default"
+        return f"{self.scope} {name}: {self.capacity} / {self.refill_rate} per s"
+
+
+class RequestProfile(models.Model):
+    """
+    The profile of a single request that was requested by a staff user. The samples are
+    stored in the folded format of flame graphs.
+    """
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    url_name = models.CharField(max_length=200, blank=True)
+    status = models.PositiveIntegerField()
+    duration_ms = models.FloatField()
+    n_samples = models.PositiveIntegerField()
+    profile = models.FileField(upload_to="profiles/")
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+
+def job_archive_storage():
+    """
+    The storage of the job archives, which is configured by `JOB_ARCHIVE_STORAGE`.
+    """
+    return storages.create_storage(settings.JOB_ARCHIVE_STORAGE)
+
+
+class JobArchive(models.Model):
+    """
+    A compressed bundle with the archived jobs of one backend and month. It is a zip file
+    with the job, status and result of every job, such that a single job can be read
+    without unpacking the whole bundle.
+    """
+
+    storage_provider = models.CharField(max_length=100)
+    display_name = models.CharField(max_length=100)
+    month = models.DateField(help_text="The first day of the month.")
+    bundle = models.FileField(upload_to="archives/", storage=job_archive_storage)
+    n_jobs = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-month", "storage_provider", "display_name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["storage_provider", "display_name", "month"],
+                name="unique_job_archive_backend_month",
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.storage_provider}_{self.display_name} "
+            f"{self.month:%Y-%m} ({self.n_jobs} jobs)"
+        )
+
+
+class ArchivedJob(models.Model):
+    """
+    The index of the finished and deleted jobs. A job is known as soon as it was seen in
+    the storage provider and gets its archive once it is older than the retention.
+    """
+
+    storage_provider = models.CharField(max_length=100)
+    display_name = models.CharField(max_length=100)
+    job_id = models.CharField(max_length=100)
+    is_deleted = models.BooleanField(
+        default=False, help_text="The job ended with an error."
+    )
+    finished_at = models.DateTimeField()
+    archive = models.ForeignKey(
+        JobArchive, null=True, blank=True, on_delete=models.CASCADE
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["storage_provider", "job_id"],
+                name="unique_archived_job_provider_job_id",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["storage_provider", "archive", "finished_at"],
+                name="archived_job_pending_idx",
+            )
+        ]
+
+    def __str__(self):
+        return self.job_id
+
+
+class Device(models.Model):
+    """
+    The catalogue of the backends of all active storage providers. It is refreshed from
+    the storage providers, such that the devices can be searched and paginated without
+    asking every storage provider.
+    """
+
+    storage_provider = models.CharField(max_length=100)
+    backend_name = models.CharField(max_length=200, unique=True)
+    display_name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    cold_atom_type = models.CharField(max_length=20)
+    simulator = models.BooleanField()
+    operational = models.BooleanField()
+    status = models.JSONField(help_text="The status of the backend as in the API.")
+    version = models.CharField(
+        max_length=40,
+        blank=True,
+        help_text="A hash of the configuration and status, which keys the cached card.",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["display_name", "backend_name"]
+        indexes = [
+            models.Index(
+                fields=["cold_atom_type", "simulator", "operational"],
+                name="device_filter_idx",
+            ),
+            models.Index(fields=["storage_provider"], name="device_provider_idx"),
+            models.Index(
+                fields=["display_name", "backend_name"], name="device_order_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return self.backend_name
+
+    def as_dict(self, base_url: str) -> dict:
+        """
+        The device as it is shown on the devices page and in the catalogue API.
+        """
+        return {
+            **self.status,
+            "display_name": self.display_name,
+            "description": self.description,
+            "cold_atom_type": self.cold_atom_type,
+            "simulator": self.simulator,
+            "storage_provider": self.storage_provider,
+            "version": self.version,
+            "url": base_url + "/api/v2/" + self.backend_name + "/",
+        }
+
+
+class StorageProviderHealth(models.Model):
+    """
+    The calls to a storage provider that one worker measured since its previous sample.
+    The samples are only inserted, such that the workers never overwrite each other, and
+    they are removed after `STORAGE_HEALTH_RETENTION`.
+    """
+
+    storage_provider = models.CharField(max_length=100)
+    recorded_at = models.DateTimeField()
+    n_calls = models.PositiveIntegerField()
+    n_errors = models.PositiveIntegerField()
+    latencies = models.JSONField(
+        help_text="A random sample of the durations of the calls in ms."
+    )
+    last_success_at = models.DateTimeField(null=True, blank=True)
+    backend_count = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["storage_provider", "recorded_at"],
+                name="provider_health_recent_idx",
+            ),
+            models.Index(fields=["recorded_at"], name="provider_health_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.storage_provider} {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+
+
+class PendingJob(models.Model):
+    """
+    A job that was accepted in the write-behind mode and is not uploaded to its storage
+    provider yet. The job is removed once it was uploaded. A flush leases the job, such
+    that several workers can flush the queue at the same time without uploading a job
+    twice.
+    """
+
+    storage_provider = models.CharField(max_length=100)
+    display_name = models.CharField(max_length=100)
+    username = models.CharField(max_length=150)
+    job_id = models.CharField(max_length=200)
+    job = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    lease = models.CharField(max_length=32, blank=True)
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["storage_provider", "job_id"], name="pending_job_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.storage_provider} {self.display_name} {self.job_id}"
+
+
+class LatencySketch(models.Model):
+    """
+    The distribution of the durations of an endpoint or a storage provider within a
+    period, as measured by one worker. The sketches of older periods are merged into
+    hourly sketches and removed after `LATENCY_HISTORY_RETENTION`.
+    """
+
+    KIND_CHOICES = (("endpoint", "Endpoint"), ("storage", "Storage provider"))
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    name = models.CharField(max_length=100)
+    period_start = models.DateTimeField()
+    resolution = models.PositiveIntegerField(help_text="The length of the period in s.")
+    count = models.PositiveIntegerField()
+    total_ms = models.FloatField()
+    max_ms = models.FloatField()
+    buckets = models.JSONField(
+        help_text="The number of durations in each logarithmic bucket."
+    )
+
+    class Meta:
+        ordering = ["period_start"]
+        verbose_name_plural = "latency history"
+        indexes = [
+            models.Index(fields=["period_start"], name="latency_period_idx"),
+            models.Index(
+                fields=["resolution", "period_start"], name="latency_resolution_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.name} {self.period_start:%Y-%m-%d %H:%M}"
@@ -0,0 +1,77 @@
+"""
+Module that profiles single requests on demand. A background thread samples the stack of
+the request thread in regular intervals. The result is written in the folded format,
+which can be opened directly by flame graph tools like speedscope or flamegraph.pl.
+"""
+
+import collections
+import sys
+import threading
+from typing import Optional
+
+
+class SamplingProfiler:
+    """
+    A sampling profiler for a single thread.
+
+    Attributes:
+        thread_id: the id of the thread that is profiled
+        interval: the time between two samples in s
+        stacks: how often each stack was seen
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "SamplingProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start the sampling in the background."""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sampling and wait for the background thread."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample_loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Take one sample of the stack of the profiled thread."""
+        # pylint: disable=W0212
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            module = frame.f_globals.get("__name__", "?")
+            stack.append(f"{module}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        if stack:
+            self.stacks[";".join(reversed(stack))] += 1
+
+    @property
+    def n_samples(self) -> int:
+        """The total number of samples."""
+        return sum(self.stacks.values())
+
+    def folded(self) -> str:
+        """
+        The samples in the folded format, one stack per line followed by its count.
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
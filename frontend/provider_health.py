@@ -0,0 +1,239 @@
+"""
+Module that records the health of the storage providers. Every instrumented call to a
+storage provider is counted in memory and the counts are written to the database by the
+telemetry of the worker. The pages that show the health only read these samples and
+never probe the storage providers themselves.
+"""
+
+import math
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+
+from .models import StorageProviderHealth
+from .telemetry import BufferedRecorder, flusher
+
+
+@dataclass
+class PendingSample:
+    """
+    The calls to a storage provider that were not written to the database yet.
+
+    Attributes:
+        n_calls: the number of calls
+        n_errors: the number of calls that raised an exception
+        latencies: a random sample of the durations in ms
+        last_success_at: the end of the last successful call
+        backend_count: the number of backends in the last answer of `get_backends`
+    """
+
+    n_calls: int = 0
+    n_errors: int = 0
+    latencies: list[float] = field(default_factory=list)
+    last_success_at: Optional[datetime] = None
+    backend_count: Optional[int] = None
+
+
+@dataclass
+class ProviderHealth:
+    """
+    The recent health of a storage provider as shown in the tables.
+
+    Attributes:
+        last_success_at: the last successful contact within the retention
+        p95_ms: the 95th percentile of the latency within the window
+        error_rate: the fraction of failed calls within the window
+        n_calls: the number of calls within the window
+        backend_count: the number of backends that were seen last
+    """
+
+    last_success_at: Optional[datetime] = None
+    p95_ms: Optional[float] = None
+    error_rate: Optional[float] = None
+    n_calls: int = 0
+    backend_count: Optional[int] = None
+
+    @property
+    def error_percent(self) -> Optional[float]:
+        """The error rate in percent."""
+        return None if self.error_rate is None else self.error_rate * 100
+
+
+class HealthRecorder(BufferedRecorder):
+    """
+    Collects the calls to the storage providers of this process. The latencies are kept
+    in a reservoir of fixed size, such that a busy storage provider needs no more memory
+    than a quiet one.
+    """
+
+    description = "health of the storage providers"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending: dict[str, PendingSample] = {}
+        self.random = random.Random()
+
+    # pylint: disable=R0913
+    def record(
+        self,
+        storage_provider: str,
+        method: str,
+        duration: float,
+        success: bool,
+        result: Any = None,
+    ) -> None:
+        """
+        Count a call.
+
+        Args:
+            storage_provider: the name of the storage provider
+            method: the name of the method that was called
+            duration: the duration of the call in s
+            success: False if the call raised an exception
+            result: the return value of the call
+        """
+        with self.lock:
+            sample = self.pending.setdefault(storage_provider, PendingSample())
+            sample.n_calls += 1
+            latency = duration * 1000
+            size = settings.STORAGE_HEALTH_SAMPLE_SIZE
+            if len(sample.latencies) < size:
+                sample.latencies.append(latency)
+            else:
+                index = self.random.randrange(sample.n_calls)
+                if index < size:
+                    sample.latencies[index] = latency
+            if not success:
+                sample.n_errors += 1
+                return
+            sample.last_success_at = datetime.now(timezone.utc)
+            if method == "get_backends" and isinstance(result, list):
+                sample.backend_count = len(result)
+
+    def write(self, pending: dict[str, PendingSample]) -> None:
+        """
+        Write the samples to the database and remove the expired ones.
+        """
+        recorded_at = datetime.now(timezone.utc)
+        # pylint: disable=E1101
+        StorageProviderHealth.objects.bulk_create(
+            [
+                StorageProviderHealth(
+                    storage_provider=name,
+                    recorded_at=recorded_at,
+                    n_calls=sample.n_calls,
+                    n_errors=sample.n_errors,
+                    latencies=[round(value, 3) for value in sample.latencies],
+                    last_success_at=sample.last_success_at,
+                    backend_count=sample.backend_count,
+                )
+                for name, sample in pending.items()
+            ]
+        )
+        StorageProviderHealth.objects.filter(
+            recorded_at__lt=recorded_at
+            - timedelta(seconds=settings.STORAGE_HEALTH_RETENTION)
+        ).delete()
+
+
+recorder = flusher.register(HealthRecorder())
+
+
+def weighted_percentile(samples: list[tuple[list[float], int]], q: float) -> float:
+    """
+    The percentile of the latencies of several samples. Each value stands for the
+    number of calls of its sample divided by the size of the sample.
+
+    Args:
+        samples: the latencies and the number of calls of each sample
+        q: the percentile between 0 and 100
+    """
+    weighted = sorted(
+        (value, n_calls / len(latencies))
+        for latencies, n_calls in samples
+        if latencies
+        for value in latencies
+    )
+    if not weighted:
+        return math.nan
+    target = q / 100 * sum(weight for _, weight in weighted)
+    cumulative = 0.0
+    for value, weight in weighted:
+        cumulative += weight
+        if cumulative >= target:
+            return value
+    return weighted[-1][0]
+
+
+def get_provider_health(names: list[str]) -> dict[str, ProviderHealth]:
+    """
+    The recent health of the storage providers with two queries, no matter how many
+    storage providers there are.
+
+    Args:
+        names: the names of the storage providers
+
+    Returns:
+        The health of every storage provider that has samples.
+    """
+    now = datetime.now(timezone.utc)
+    health: dict[str, ProviderHealth] = {}
+
+    # pylint: disable=E1101
+    latest_backend_count = (
+        StorageProviderHealth.objects.filter(
+            storage_provider=OuterRef("storage_provider"), backend_count__isnull=False
+        )
+        .order_by("-recorded_at")
+        .values("backend_count")[:1]
+    )
+    for row in (
+        StorageProviderHealth.objects.filter(storage_provider__in=names)
+        .values("storage_provider")
+        .annotate(
+            last_success=Max("last_success_at"),
+            latest_backend_count=Subquery(latest_backend_count),
+        )
+        .order_by()
+    ):
+        health[row["storage_provider"]] = ProviderHealth(
+            last_success_at=row["last_success"],
+            backend_count=row["latest_backend_count"],
+        )
+
+    windows: dict[str, list[StorageProviderHealth]] = {}
+    for sample in StorageProviderHealth.objects.filter(
+        storage_provider__in=names,
+        recorded_at__gte=now - timedelta(seconds=settings.STORAGE_HEALTH_WINDOW),
+    ).only("storage_provider", "n_calls", "n_errors", "latencies"):
+        windows.setdefault(sample.storage_provider, []).append(sample)
+    for name, samples in windows.items():
+        provider_health = health.setdefault(name, ProviderHealth())
+        provider_health.n_calls = sum(sample.n_calls for sample in samples)
+        if provider_health.n_calls:
+            provider_health.error_rate = (
+                sum(sample.n_errors for sample in samples) / provider_health.n_calls
+            )
+            p95 = weighted_percentile(
+                [(sample.latencies, sample.n_calls) for sample in samples], 95
+            )
+            provider_health.p95_ms = None if math.isnan(p95) else p95
+    return health
+
+
+def attach_health(entries) -> list:
+    """
+    Set the `health` of each storage provider entry for the templates.
+
+    Returns:
+        The entries as a list.
+    """
+    entries = list(entries)
+    health = get_provider_health([entry.name for entry in entries])
+    for entry in entries:
+        entry.health = health.get(entry.name, ProviderHealth())
+    return entries
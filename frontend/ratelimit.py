@@ -0,0 +1,210 @@
+"""
+Module that implements the rate limiting of the API. The buckets are counters in the
+cache of the project, such that all the workers share them. They are only changed with
+`cache.add` and `cache.incr`, which are atomic in Redis.
+"""
+
+import hashlib
+import math
+import time
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import RateLimit
+
+RULES_CACHE_KEY = "ratelimit:rules"
+RULES_CACHE_TIMEOUT = 300
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """
+    The size of a bucket and the rate at which it is refilled.
+
+    Attributes:
+        capacity: the maximal number of requests in a burst
+        refill_rate: the number of requests per second that are allowed on average
+    """
+
+    capacity: float
+    refill_rate: float
+
+
+def get_rules() -> dict[str, dict[str, Bucket]]:
+    """
+    Get all the active rate limits that were defined in the admin. The rules are cached
+    and the cache is invalidated whenever a rule is changed.
+
+    Returns:
+        A dict of the form `{scope: {name: bucket}}`
+    """
+    rules = cache.get(RULES_CACHE_KEY)
+    if rules is None:
+        rules = {scope: {} for scope, _ in RateLimit.SCOPE_CHOICES}
+        # pylint: disable=E1101
+        for rule in RateLimit.objects.filter(is_active=True):
+            rules[rule.scope][rule.name] = Bucket(rule.capacity, rule.refill_rate)
+        cache.set(RULES_CACHE_KEY, rules, timeout=RULES_CACHE_TIMEOUT)
+    return rules
+
+
+def get_bucket(scope: str, name: str) -> Optional[Bucket]:
+    """
+    Get the bucket that applies to a user token or a backend. A rule for the specific
+    name wins over the rule with an empty name, which wins over the settings.
+
+    Args:
+        scope: either "user" or "backend"
+        name: the user token or the name of the backend
+
+    Returns:
+        The bucket or None if the requests should not be limited.
+    """
+    rules = get_rules().get(scope, {})
+    if name in rules:
+        return rules[name]
+    if "" in rules:
+        return rules[""]
+    default = settings.RATELIMIT_DEFAULTS.get(scope)
+    if default is None:
+        return None
+    return Bucket(*default)
+
+
+class Window(NamedTuple):
+    """
+    The current window of a bucket.
+
+    Attributes:
+        key: the cache key of the counter of the window
+        timeout: the time in s until the counter expires, None if it never does
+        remaining: the time in s until the window ends
+    """
+
+    key: str
+    timeout: Optional[int]
+    remaining: float
+
+
+def current_window(key: str, bucket: Bucket, now: float) -> Window:
+    """
+    The window of the bucket at the given time. A bucket admits `capacity` requests per
+    window of `capacity / refill_rate` seconds, which is the time it takes to refill it.
+    A bucket without refill has a single window that never ends.
+    """
+    if bucket.refill_rate <= 0:
+        return Window(key, None, math.inf)
+    length = bucket.capacity / bucket.refill_rate
+    index = math.floor(now / length)
+    remaining = (index + 1) * length - now
+    return Window(f"{key}:{index}", math.ceil(remaining) + 1, remaining)
+
+
+def charge(window: Window, tokens: int) -> int:
+    """
+    Add the tokens to the counter of the window.
+
+    Returns:
+        The count of the window after the tokens were added.
+    """
+    try:
+        return cache.incr(window.key, tokens)
+    except ValueError:
+        # the first request of the window creates the counter, unless another worker
+        # was faster
+        if cache.add(window.key, tokens, timeout=window.timeout):
+            return tokens
+        return cache.incr(window.key, tokens)
+
+
+def refund(window: Window, tokens: int) -> None:
+    """
+    Take the tokens out of the counter of the window again.
+    """
+    try:
+        cache.decr(window.key, tokens)
+    except ValueError:
+        # the window has ended in the meantime
+        pass
+
+
+def consume(buckets: dict[str, Bucket], tokens: int = 1) -> tuple[float, str]:
+    """
+    Take tokens out of all the given buckets or out of none of them. The buckets are
+    checked first, such that a request that is rejected by one bucket is not charged to
+    the others. If concurrent workers take the last tokens in the meantime, the charged
+    tokens are refunded.
+
+    Args:
+        buckets: the buckets by their cache key
+        tokens: how many tokens the request costs
+
+    Returns:
+        Zero and an empty key if the request is allowed. Otherwise the number of seconds
+        after which enough tokens are available again and the key of the empty bucket.
+    """
+    now = time.time()
+    windows = {key: current_window(key, bucket, now) for key, bucket in buckets.items()}
+    counts = cache.get_many([window.key for window in windows.values()])
+    for key, window in windows.items():
+        if counts.get(window.key, 0) + tokens > buckets[key].capacity:
+            return window.remaining, key
+
+    charged: list[Window] = []
+    for key, window in windows.items():
+        count = charge(window, tokens)
+        charged.append(window)
+        if count > buckets[key].capacity:
+            for charged_window in charged:
+                refund(charged_window, tokens)
+            return window.remaining, key
+    return 0.0, ""
+
+
+def bucket_key(scope: str, name: str) -> str:
+    """
+    The cache key of a bucket. The name is hashed, such that no tokens end up in the cache.
+    """
+    digest = hashlib.sha256(name.encode("utf-8")).hexdigest()[:32]
+    return f"ratelimit:{scope}:{digest}"
+
+
+def check(names: dict[str, str]) -> tuple[float, str]:
+    """
+    Consume a token for the user token and the backend, or for none of them.
+
+    Args:
+        names: the user token or the name of the backend by the scope, "user" or
+            "backend"
+
+    Returns:
+        Zero and an empty scope if the request is allowed. Otherwise the seconds until it
+        will be allowed and the scope whose bucket is empty.
+    """
+    buckets = {}
+    scopes = {}
+    for scope, name in names.items():
+        bucket = get_bucket(scope, name)
+        if bucket is not None:
+            key = bucket_key(scope, name)
+            buckets[key] = bucket
+            scopes[key] = scope
+    if not buckets:
+        return 0.0, ""
+    wait, key = consume(buckets)
+    return wait, scopes.get(key, "")
+
+
+# pylint: disable=W0613
+@receiver(post_save, sender=RateLimit)
+@receiver(post_delete, sender=RateLimit)
+def invalidate_rules(sender, **kwargs):
+    """
+    Make sure that changes in the admin are applied directly.
+    """
+    cache.delete(RULES_CACHE_KEY)
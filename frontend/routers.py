@@ -0,0 +1,78 @@
+"""
+Module that routes the read-only queries to a read replica of the database. After a
+write, the reads of the same client stick to the primary for a short time, such that
+users always read their own writes.
+"""
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+
+# the app label of the entries of the database cache
+CACHE_APP_LABEL = "django_cache"
+
+
+@dataclass
+class PrimaryPin:
+    """
+    Tells if the reads of the current request have to go to the primary.
+
+    Attributes:
+        pinned: the client wrote recently, so all reads go to the primary
+        wrote: the current request wrote to the database
+    """
+
+    pinned: bool = False
+    wrote: bool = False
+
+
+primary_pin_var: ContextVar[Optional[PrimaryPin]] = ContextVar(
+    "primary_pin", default=None
+)
+
+
+class ReplicaRouter:
+    """
+    Database router that sends reads to the replica and writes to the primary. The
+    replica is only used within requests and only if it is configured. The database
+    cache always uses the primary, as the rate limits have to see the latest counts.
+    """
+
+    # pylint: disable=W0613
+    def db_for_read(self, model, **hints):
+        """
+        Read from the replica, unless the client wrote recently.
+        """
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        pin = primary_pin_var.get()
+        if (
+            pin is None
+            or pin.pinned
+            or pin.wrote
+            or REPLICA_DB_ALIAS not in settings.DATABASES
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        """
+        Write to the primary and remember the write for the following reads. The writes
+        to the cache are not the writes of the user, so they do not pin the client.
+        """
+        pin = primary_pin_var.get()
+        if pin is not None and model._meta.app_label != CACHE_APP_LABEL:
+            pin.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """
+        The replica holds the same data as the primary.
+        """
+        return True
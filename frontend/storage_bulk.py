@@ -0,0 +1,242 @@
+"""
+Module that imports and exports many storage providers at once. The whole batch is
+validated before anything is written, the credentials are checked concurrently and the
+entries are written within a single transaction.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from .catalogue import invalidate_catalogue
+
+# the fields of a storage provider that are exported and imported
+FIELDS = ["storage_type", "name", "description", "login", "is_active"]
+
+FORMATS = ("json", "yaml")
+
+
+@dataclass
+class ImportResult:
+    """
+    The outcome of an import.
+
+    Attributes:
+        created: the names of the storage providers that were created
+        updated: the names of the storage providers that were updated
+        errors: the errors per storage provider. Nothing is written if there are any.
+    """
+
+    created: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    errors: dict[str, list[str]] = field(default_factory=dict)
+
+
+def load_yaml():
+    """
+    Import PyYAML, which is only needed for the YAML format.
+
+    Raises:
+        ValueError: if PyYAML is not installed
+    """
+    try:
+        # pylint: disable=C0415
+        import yaml
+    except ImportError as err:
+        raise ValueError("The YAML format requires PyYAML to be installed.") from err
+    return yaml
+
+
+def dump_records(records: list[dict], fmt: str = "json") -> str:
+    """
+    Serialize the exported storage providers.
+    """
+    if fmt == "yaml":
+        return load_yaml().safe_dump(records, sort_keys=False)
+    return json.dumps(records, indent=2)
+
+
+def parse_records(text: str, fmt: str = "json") -> list[dict]:
+    """
+    Parse the storage providers of an import.
+
+    Raises:
+        ValueError: if the document is not a list of dicts
+    """
+    if fmt == "yaml":
+        records = load_yaml().safe_load(text)
+    else:
+        records = json.loads(text)
+    if not isinstance(records, list) or not all(
+        isinstance(record, dict) for record in records
+    ):
+        raise ValueError("The document must contain a list of storage providers.")
+    return records
+
+
+def export_storage_providers(queryset) -> list[dict]:
+    """
+    Export the storage providers including the username of their owner.
+    """
+    records = []
+    for entry in queryset.select_related("owner"):
+        record = {field_name: getattr(entry, field_name) for field_name in FIELDS}
+        record["owner"] = entry.owner.get_username() if entry.owner else None
+        records.append(record)
+    return records
+
+
+def check_credentials(entry: StorageProviderDb) -> Optional[str]:
+    """
+    Check that the storage provider can be reached with its login.
+
+    Returns:
+        None if it works, the error message otherwise.
+    """
+    try:
+        get_storage_provider_from_entry(entry).get_backends()
+    # the dropbox provider exits on invalid tokens, so we also have to catch SystemExit
+    except (Exception, SystemExit) as err:  # pylint: disable=W0718
+        return f"Could not connect with the login: {err}"
+    return None
+
+
+def apply_record(entry: StorageProviderDb, record: dict) -> list[str]:
+    """
+    Copy the fields of a record onto its entry and validate the entry.
+
+    Returns:
+        The problems of the record.
+    """
+    errors = []
+    unknown_keys = set(record) - set(FIELDS) - {"owner"}
+    if unknown_keys:
+        errors.append(f"Unknown fields {sorted(unknown_keys)}.")
+    for field_name in FIELDS:
+        if field_name in record:
+            setattr(entry, field_name, record[field_name])
+
+    # the owner and the uniqueness are checked for the whole batch
+    try:
+        entry.full_clean(
+            exclude=["owner"], validate_unique=False, validate_constraints=False
+        )
+    except ValidationError as err:
+        errors.extend(err.messages)
+    return errors
+
+
+def check_all_credentials(
+    entries: list[StorageProviderDb], max_workers: int
+) -> dict[str, list[str]]:
+    """
+    Check concurrently that the active storage providers can be reached.
+
+    Returns:
+        The errors per storage provider.
+    """
+    to_check = [entry for entry in entries if entry.is_active]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return {
+            entry.name: [error]
+            for entry, error in zip(to_check, executor.map(check_credentials, to_check))
+            if error is not None
+        }
+
+
+# pylint: disable=R0914
+def import_storage_providers(
+    records: list[dict],
+    default_owner=None,
+    credentials: bool = True,
+    max_workers: int = 8,
+) -> ImportResult:
+    """
+    Create or update the storage providers. Existing storage providers are matched by
+    their name and can only be updated for the same owner.
+
+    Args:
+        records: the storage providers as dicts with the keys of `FIELDS` and optionally
+            the username of the `owner`
+        default_owner: the owner of the records that do not name one
+        credentials: check concurrently that every active storage provider can be reached
+        max_workers: the number of concurrent credential checks
+
+    Returns:
+        The names of the created and updated storage providers. If any of the records
+        is invalid, nothing is written and the errors are returned.
+    """
+    result = ImportResult()
+
+    # look up all the owners and existing entries with one query each
+    usernames = {record["owner"] for record in records if record.get("owner")}
+    user_model = get_user_model()
+    owners = {
+        user.get_username(): user
+        for user in user_model.objects.filter(
+            **{user_model.USERNAME_FIELD + "__in": usernames}
+        )
+    }
+    names = [str(record.get("name", "")) for record in records]
+    # pylint: disable=E1101
+    existing = {
+        entry.name: entry
+        for entry in StorageProviderDb.objects.filter(name__in=names).select_related(
+            "owner"
+        )
+    }
+
+    new_entries = []
+    updated_entries = []
+    seen_names = set()
+    for index, record in enumerate(records):
+        name = str(record.get("name", ""))
+        errors = []
+        if name in seen_names:
+            errors.append("The name appears more than once in the import.")
+        seen_names.add(name)
+
+        username = record.get("owner")
+        owner = owners.get(username) if username else default_owner
+        if owner is None:
+            errors.append(
+                f"Unknown owner {username!r}." if username else "No owner given."
+            )
+
+        entry = existing.get(name)
+        if entry is None:
+            entry = StorageProviderDb(owner=owner, is_active=True)
+            new_entries.append(entry)
+        else:
+            if owner is not None and entry.owner_id != owner.pk:
+                errors.append("The name is already used by another owner.")
+            updated_entries.append(entry)
+        errors.extend(apply_record(entry, record))
+        if errors:
+            result.errors.setdefault(name or f"#{index}", []).extend(errors)
+
+    if credentials and not result.errors:
+        result.errors = check_all_credentials(
+            new_entries + updated_entries, max_workers
+        )
+    if result.errors:
+        return result
+
+    with transaction.atomic():
+        StorageProviderDb.objects.bulk_create(new_entries, batch_size=500)
+        if updated_entries:
+            StorageProviderDb.objects.bulk_update(
+                updated_entries, FIELDS, batch_size=500
+            )
+    invalidate_catalogue()
+    result.created = [entry.name for entry in new_entries]
+    result.updated = [entry.name for entry in updated_entries]
+    return result
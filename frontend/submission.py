@@ -0,0 +1,441 @@
+"""
+Module that stores the submitted jobs in the storage providers. The job and its initial
+status are uploaded concurrently, such that a submission waits for a single round trip to
+the storage provider. If one of the uploads fails, the other one is removed again. The
+endpoint of the API stays in charge of the submission. Within its requests, the hooks on
+`upload_job` and `upload_status` of the storage providers take over the uploads.
+
+In the write-behind mode, the jobs are only accepted into a queue in the database and
+answered right away. A background thread of each worker uploads them in batches, and
+`python manage.py flush_pending_jobs` uploads whatever is left, e.g. after a restart.
+"""
+
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from sqooler.schemes import StatusMsgDict
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from .instrumentation import STORAGE_PROVIDER_CLASSES
+from .models import PendingJob
+
+logger = logging.getLogger(__name__)
+
+# the status of each job that was submitted within the current request to the API, which
+# is None outside of these requests
+submitted_var: ContextVar[Optional[dict[str, StatusMsgDict]]] = ContextVar(
+    "submitted", default=None
+)
+
+
+def initial_status(job_id: str) -> StatusMsgDict:
+    """
+    The status of a job that was just submitted, as the storage providers write it.
+    """
+    return StatusMsgDict(
+        job_id=job_id,
+        status="INITIALIZING",
+        detail="Got your json.",
+        error_message="None",
+    )
+
+
+def upload_job_files(
+    storage_provider, job_dict: dict, display_name: str, username: str, job_id: str
+) -> StatusMsgDict:
+    """
+    Upload the job and its initial status at the same time. If one of them fails, the
+    other one is deleted again, such that the storage provider never keeps a job without
+    status or a status without job.
+
+    Args:
+        storage_provider: the storage provider of the backend
+        job_dict: the job
+        display_name: the name of the backend
+        username: the user that submitted the job
+        job_id: the id of the job
+
+    Returns:
+        The status of the job.
+    """
+    job_path = storage_provider.get_attribute_path("queue", display_name)
+    job_file = storage_provider.get_attribute_id("job", job_id)
+    status_path = storage_provider.get_attribute_path("status", display_name, username)
+    status_file = storage_provider.get_attribute_id("status", job_id)
+
+    # each upload gets a copy of the context, such that the deadline and the statistics
+    # of the request apply to it
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        job_future = executor.submit(
+            contextvars.copy_context().run,
+            storage_provider.upload,
+            job_dict,
+            job_path,
+            job_file,
+        )
+        status_future = executor.submit(
+            contextvars.copy_context().run,
+            storage_provider.upload_status,
+            display_name,
+            username,
+            job_id,
+        )
+        wait([job_future, status_future])
+
+    job_error = upload_error(job_future)
+    status_error = upload_error(status_future)
+    if job_error is None and status_error is None:
+        if status_future.exception() is not None:
+            return initial_status(job_id)
+        return status_future.result()
+
+    if job_error is None:
+        rollback(storage_provider, job_path, job_file)
+    if status_error is None:
+        rollback(storage_provider, status_path, status_file)
+    raise job_error or status_error
+
+
+def upload_error(future) -> Optional[BaseException]:
+    """
+    The error of an upload. The job ids are unique, so an existing file was left by an
+    earlier attempt to upload the same job and counts as uploaded.
+    """
+    error = future.exception()
+    return None if isinstance(error, FileExistsError) else error
+
+
+def rollback(storage_provider, storage_path: str, file_name: str) -> None:
+    """
+    Delete the half of a submission that was uploaded.
+    """
+    try:
+        storage_provider.delete(storage_path, file_name)
+    # the original error is more interesting than this one
+    except Exception:  # pylint: disable=W0718
+        logger.exception("Could not remove %s/%s.", storage_path, file_name)
+
+
+def submit_job(
+    storage_provider, job_dict: dict, display_name: str, username: str
+) -> StatusMsgDict:
+    """
+    Submit a job to a backend. In the write-behind mode, the job is only added to the
+    queue of the pending jobs.
+
+    Returns:
+        The status of the job.
+    """
+    job_id = storage_provider.create_job_id(display_name, username)
+    if not settings.JOB_WRITE_BEHIND:
+        return upload_job_files(
+            storage_provider, job_dict, display_name, username, job_id
+        )
+
+    # pylint: disable=E1101
+    PendingJob.objects.create(
+        storage_provider=storage_provider.name,
+        display_name=display_name,
+        username=username,
+        job_id=job_id,
+        job=job_dict,
+    )
+    flusher.wake()
+    return initial_status(job_id)
+
+
+def hook_upload_job(upload_job):
+    """
+    Wrap `upload_job` of a storage provider class. Within a request to the API, the job
+    is submitted with `submit_job` and its status is kept for `upload_status`.
+    """
+
+    @functools.wraps(upload_job)
+    def wrapper(self, job_dict: dict, display_name: str, username: str) -> str:
+        submitted = submitted_var.get()
+        if submitted is None:
+            return upload_job(self, job_dict, display_name, username)
+        status = submit_job(self, job_dict, display_name, username)
+        submitted[status.job_id] = status
+        return status.job_id
+
+    wrapper.__submission_hook__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def hook_upload_status(upload_status):
+    """
+    Wrap `upload_status` of a storage provider class. The status of a job that was
+    submitted by `upload_job` in the same request is uploaded already, so it is just
+    returned.
+    """
+
+    @functools.wraps(upload_status)
+    def wrapper(self, display_name: str, username: str, job_id: str) -> StatusMsgDict:
+        submitted = submitted_var.get()
+        if submitted is not None and job_id in submitted:
+            return submitted.pop(job_id)
+        return upload_status(self, display_name, username, job_id)
+
+    wrapper.__submission_hook__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def install() -> None:
+    """
+    Hook the submission into all the storage providers. Calling it multiple times does
+    not add additional hooks.
+    """
+    hooks = {"upload_job": hook_upload_job, "upload_status": hook_upload_status}
+    for provider_class in STORAGE_PROVIDER_CLASSES:
+        for method_name, hook in hooks.items():
+            method = getattr(provider_class, method_name)
+            if not getattr(method, "__submission_hook__", False):
+                setattr(provider_class, method_name, hook(method))
+
+
+def read_pending_job(
+    storage_provider: str, display_name: str, job_id: str
+) -> Optional[dict]:
+    """
+    The status of a job that waits in the write-behind queue.
+
+    Returns:
+        The status or None if the job is not in the queue.
+    """
+    # pylint: disable=E1101
+    pending_job = PendingJob.objects.filter(
+        storage_provider=storage_provider, display_name=display_name, job_id=job_id
+    ).first()
+    if pending_job is None:
+        return None
+    if pending_job.attempts >= settings.JOB_WRITE_BEHIND_MAX_ATTEMPTS:
+        detail = "The job could not be uploaded to the storage provider."
+        return StatusMsgDict(
+            job_id=job_id, status="ERROR", detail=detail, error_message=detail
+        ).model_dump()
+    return initial_status(job_id).model_dump()
+
+
+def claim_pending_jobs(batch_size: int) -> list[PendingJob]:
+    """
+    Lease the oldest pending jobs that nobody else is uploading right now.
+    """
+    now = datetime.now(timezone.utc)
+    available = Q(attempts__lt=settings.JOB_WRITE_BEHIND_MAX_ATTEMPTS) & (
+        Q(leased_until__isnull=True) | Q(leased_until__lt=now)
+    )
+    # pylint: disable=E1101
+    candidates = list(
+        PendingJob.objects.filter(available).values_list("id", flat=True)[:batch_size]
+    )
+    if not candidates:
+        return []
+    lease = uuid.uuid4().hex
+    # the condition is checked again, such that only one flush gets each job
+    PendingJob.objects.filter(available, id__in=candidates).update(
+        lease=lease,
+        leased_until=now + timedelta(seconds=settings.JOB_WRITE_BEHIND_LEASE),
+    )
+    return list(PendingJob.objects.filter(lease=lease))
+
+
+def renew_lease(lease: str) -> None:
+    """
+    Extend the lease of the jobs that a flush is still uploading.
+    """
+    # pylint: disable=E1101
+    PendingJob.objects.filter(lease=lease).update(
+        leased_until=datetime.now(timezone.utc)
+        + timedelta(seconds=settings.JOB_WRITE_BEHIND_LEASE)
+    )
+
+
+def exhausted_jobs() -> int:
+    """
+    The number of pending jobs that failed too often and are not tried again.
+    """
+    # pylint: disable=E1101
+    return PendingJob.objects.filter(
+        attempts__gte=settings.JOB_WRITE_BEHIND_MAX_ATTEMPTS
+    ).count()
+
+
+def upload_pending_job(storage_provider, pending_job: PendingJob) -> Optional[str]:
+    """
+    Upload a pending job.
+
+    Returns:
+        The error or None if the job was uploaded.
+    """
+    if storage_provider is None:
+        return "The storage provider does not exist anymore."
+    try:
+        upload_job_files(
+            storage_provider,
+            pending_job.job,
+            pending_job.display_name,
+            pending_job.username,
+            pending_job.job_id,
+        )
+    # the job stays in the queue and is tried again later
+    except Exception as err:  # pylint: disable=W0718
+        return f"{type(err).__name__}: {err}"
+    return None
+
+
+def upload_batch(
+    pending_jobs: list[PendingJob], storage_providers: dict
+) -> dict[int, Optional[str]]:
+    """
+    Upload the leased jobs and renew their lease until all of them are done.
+
+    Returns:
+        The error of each job by its id, which is None for uploaded jobs.
+    """
+    # the jobs of a backend are written into the same folders, which the storage
+    # providers do not like to happen concurrently. So only the backends run in parallel.
+    backends: dict[tuple[str, str], list[PendingJob]] = {}
+    for pending_job in pending_jobs:
+        backends.setdefault(
+            (pending_job.storage_provider, pending_job.display_name), []
+        ).append(pending_job)
+
+    with ThreadPoolExecutor(max_workers=settings.JOB_UPLOAD_WORKERS) as executor:
+        futures = {
+            executor.submit(
+                lambda backend_jobs: [
+                    upload_pending_job(storage_providers.get(job.storage_provider), job)
+                    for job in backend_jobs
+                ],
+                backend_jobs,
+            ): backend_jobs
+            for backend_jobs in backends.values()
+        }
+        # the uploads of a backend run one after another and can take longer than the
+        # lease, so it is renewed well before it runs out
+        running = set(futures)
+        while running:
+            _, running = wait(running, timeout=settings.JOB_WRITE_BEHIND_LEASE / 3)
+            if running:
+                renew_lease(pending_jobs[0].lease)
+
+    errors: dict[int, Optional[str]] = {}
+    for future, backend_jobs in futures.items():
+        for pending_job, error in zip(backend_jobs, future.result()):
+            errors[pending_job.id] = error
+    return errors
+
+
+def flush_pending_jobs(batch_size: Optional[int] = None) -> dict:
+    """
+    Upload a batch of pending jobs to their storage providers. Jobs that fail are tried
+    again by a later flush, up to `JOB_WRITE_BEHIND_MAX_ATTEMPTS` times.
+
+    Args:
+        batch_size: the number of jobs, `JOB_WRITE_BEHIND_BATCH_SIZE` by default
+
+    Returns:
+        The number of uploaded and failed jobs.
+    """
+    pending_jobs = claim_pending_jobs(
+        batch_size or settings.JOB_WRITE_BEHIND_BATCH_SIZE
+    )
+    report = {"uploaded": 0, "failed": 0}
+    if not pending_jobs:
+        return report
+
+    # pylint: disable=E1101
+    storage_providers = {
+        entry.name: get_storage_provider_from_entry(entry)
+        for entry in StorageProviderDb.objects.filter(
+            name__in={pending_job.storage_provider for pending_job in pending_jobs}
+        )
+    }
+    errors = upload_batch(pending_jobs, storage_providers)
+
+    uploaded = []
+    for pending_job in pending_jobs:
+        error = errors[pending_job.id]
+        if error is None:
+            uploaded.append(pending_job.id)
+            continue
+        if pending_job.attempts + 1 >= settings.JOB_WRITE_BEHIND_MAX_ATTEMPTS:
+            logger.error(
+                "Gave up on the job %s after %s attempts: %s",
+                pending_job.job_id,
+                pending_job.attempts + 1,
+                error,
+            )
+        else:
+            logger.warning("Could not upload the job %s: %s", pending_job.job_id, error)
+        PendingJob.objects.filter(id=pending_job.id).update(
+            attempts=F("attempts") + 1, last_error=error, lease="", leased_until=None
+        )
+    PendingJob.objects.filter(id__in=uploaded).delete()
+    report["uploaded"] = len(uploaded)
+    report["failed"] = len(pending_jobs) - len(uploaded)
+    return report
+
+
+class WriteBehindFlusher:
+    """
+    The background thread of a worker that uploads the pending jobs. It is started by
+    the first job that is accepted and sleeps while the queue is empty. After a wake-up
+    it waits for `JOB_WRITE_BEHIND_FLUSH_DELAY`, such that the jobs of the following
+    requests are uploaded in the same batch.
+    """
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    def wake(self) -> None:
+        """
+        Upload the pending jobs soon. Nothing happens if the delay is None.
+        """
+        if settings.JOB_WRITE_BEHIND_FLUSH_DELAY is None:
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="write-behind", daemon=True
+                )
+                self.thread.start()
+        self.event.set()
+
+    def run(self) -> None:
+        """
+        Flush until the queue is empty, then wait for the next job.
+        """
+        while True:
+            self.event.wait()
+            time.sleep(settings.JOB_WRITE_BEHIND_FLUSH_DELAY or 0)
+            self.event.clear()
+            try:
+                batch_size = settings.JOB_WRITE_BEHIND_BATCH_SIZE
+                # failed jobs wait for the next wake-up instead of being retried
+                while flush_pending_jobs(batch_size)["uploaded"] >= batch_size:
+                    pass
+            # the thread must survive a broken database connection
+            except Exception:  # pylint: disable=W0718
+                logger.exception("Could not flush the pending jobs.")
+            finally:
+                connection.close()
+
+
+flusher = WriteBehindFlusher()
@@ -0,0 +1,95 @@
+"""
+Module that writes the measurements of a worker to the database. The recorders of the
+health of the storage providers and of the latency history collect their measurements in
+memory. All of them are written together at most once per `TELEMETRY_FLUSH_INTERVAL`,
+once a request is finished, such that no client waits for these writes.
+"""
+
+import abc
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedRecorder(abc.ABC):
+    """
+    Collects measurements in `pending` until they are written. Subclasses add their
+    measurements under the `lock` and write them to the database in `write`.
+    """
+
+    # what the recorder writes, for the log
+    description = "measurements"
+
+    def __init__(self) -> None:
+        self.pending: dict = {}
+        self.lock = threading.Lock()
+
+    @abc.abstractmethod
+    def write(self, pending: dict) -> None:
+        """
+        Write the measurements that were collected since the last flush.
+        """
+
+    def flush(self) -> None:
+        """
+        Write the pending measurements to the database right away.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            self.write(pending)
+        # the measurements must never break the request that happens to write them
+        except Exception:  # pylint: disable=W0718
+            logger.exception("Could not write the %s.", self.description)
+
+
+class TelemetryFlusher:
+    """
+    Writes all the recorders of this worker at most once per `TELEMETRY_FLUSH_INTERVAL`.
+    """
+
+    def __init__(self) -> None:
+        self.recorders: list[BufferedRecorder] = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def register(self, recorder: BufferedRecorder) -> BufferedRecorder:
+        """
+        Write the recorder together with the others.
+        """
+        self.recorders.append(recorder)
+        return recorder
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Write the recorders. Without `force`, nothing happens within
+        `TELEMETRY_FLUSH_INTERVAL` after the last flush.
+        """
+        interval = settings.TELEMETRY_FLUSH_INTERVAL
+        now = time.monotonic()
+        with self.lock:
+            if not force and (interval is None or now - self.last_flush < interval):
+                return
+            self.last_flush = now
+        for recorder in self.recorders:
+            recorder.flush()
+
+
+flusher = TelemetryFlusher()
+
+
+# pylint: disable=W0613
+@receiver(request_finished)
+def flush_after_request(sender, **kwargs):
+    """
+    Write the measurements once the response was sent to the client.
+    """
+    flusher.flush()
@@ -0,0 +1,236 @@
+"""
+Module that tests the archive of old jobs.
+"""
+
+# pylint: disable=C0103
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from sqooler.schemes import LocalLoginInformation, ResultDict, StatusMsgDict
+from sqooler.storage_providers.local import LocalProviderExtended
+
+from .archive import archive_storage_provider, read_archived_job
+from .fixtures import JOB_PAYLOAD, LocalStorageTestCase
+from .loadtest import FakeSpooler, LoadStats
+from .models import ArchivedJob, JobArchive
+
+
+class DropboxLayoutProvider(LocalProviderExtended):
+    """
+    A local storage provider with the folders of the Dropbox provider, which need the
+    username of the job.
+    """
+
+    def get_attribute_path(
+        self, attribute_name, display_name=None, job_id=None, username=None
+    ):
+        match attribute_name:
+            case "results":
+                if job_id is None:
+                    raise ValueError("The job_id must be set for results path.")
+                return f"/{self.results_path}/{display_name}/{job_id.split('-')[2]}/"
+            case "status":
+                return f"/{self.status_path}/{display_name}/{username}/"
+            case "finished":
+                return f"/{self.finished_path}/{display_name}/{username}/"
+        return super().get_attribute_path(
+            attribute_name, display_name, job_id, username
+        )
+
+
+class ArchiveTest(LocalStorageTestCase):
+    """
+    Test the archive of old jobs.
+    """
+
+    storage_name = "archive"
+    token_key = "archivetoken"
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.spooler = FakeSpooler(self.storage_provider, "fake0", 100.0, LoadStats())
+
+    def run_job(self, age: timedelta, fail: bool = False) -> str:
+        """
+        Submit a job, let the spooler finish it and make it look as old as given.
+        """
+        job_id = self.storage_provider.upload_job(JOB_PAYLOAD, "fake0", "sandy")
+        self.storage_provider.upload_status("fake0", "sandy", job_id)
+        self.storage_provider.get_next_job_in_queue("fake0")
+        if fail:
+            self.storage_provider.update_in_database(
+                None,
+                StatusMsgDict(
+                    job_id=job_id, status="ERROR", detail="failed", error_message="x"
+                ),
+                job_id,
+                "fake0",
+            )
+            folder = "jobs/deleted"
+        else:
+            self.spooler.finish_job(job_id)
+            folder = "jobs/finished/fake0"
+        timestamp = time.time() - age.total_seconds()
+        os.utime(f"{self.storage_dir}/{folder}/{job_id}.json", (timestamp, timestamp))
+        return job_id
+
+    def test_archive(self):
+        """
+        Are only the old jobs moved into the bundles of their month ?
+        """
+        old_job = self.run_job(timedelta(days=40))
+        old_failed_job = self.run_job(timedelta(days=40), fail=True)
+        new_job = self.run_job(timedelta(days=1))
+
+        with self.settings(MEDIA_ROOT=self.media_root, JOB_ARCHIVE_PERSISTENT=True):
+            report = archive_storage_provider(self.entry, timedelta(days=30))
+            self.assertEqual(report, {"indexed": 3, "archived": 2, "bundles": 1})
+            self.assertEqual(JobArchive.objects.get().n_jobs, 2)
+            self.assertEqual(
+                set(os.listdir(f"{self.storage_dir}/jobs/finished/fake0")),
+                {f"{new_job}.json"},
+            )
+            self.assertEqual(os.listdir(f"{self.storage_dir}/jobs/deleted"), [])
+            self.assertFalse(
+                os.path.exists(f"{self.storage_dir}/results/fake0/{old_job}.json")
+            )
+
+            result = read_archived_job("archive", "fake0", old_job, "result")
+            self.assertEqual(result["status"], "DONE")
+            status = read_archived_job("archive", "fake0", old_failed_job, "status")
+            self.assertEqual(status["status"], "ERROR")
+            self.assertIsNone(read_archived_job("archive", "fake0", new_job, "result"))
+
+            # a second run has nothing to do
+            report = archive_storage_provider(self.entry, timedelta(days=30))
+            self.assertEqual(report, {"indexed": 0, "archived": 0, "bundles": 0})
+
+            # once the retention has passed, the new job is added to the bundles
+            report = archive_storage_provider(
+                self.entry,
+                timedelta(days=30),
+                now=datetime.now(timezone.utc) + timedelta(days=31),
+            )
+            self.assertEqual(report["archived"], 1)
+            self.assertEqual(ArchivedJob.objects.filter(archive=None).count(), 0)
+
+    def test_kept_without_persistent_storage(self):
+        """
+        Are the jobs left in the storage provider if the bundles are not durable ?
+        """
+        job_id = self.run_job(timedelta(days=40))
+        with self.settings(MEDIA_ROOT=self.media_root, JOB_ARCHIVE_PERSISTENT=False):
+            report = archive_storage_provider(self.entry, timedelta(days=30))
+            self.assertEqual(report["archived"], 1)
+            self.assertTrue(
+                os.path.exists(f"{self.storage_dir}/jobs/finished/fake0/{job_id}.json")
+            )
+            self.assertTrue(
+                os.path.exists(f"{self.storage_dir}/results/fake0/{job_id}.json")
+            )
+            result = read_archived_job("archive", "fake0", job_id, "result")
+            self.assertEqual(result["status"], "DONE")
+
+            # the next run neither archives nor deletes the job again
+            report = archive_storage_provider(self.entry, timedelta(days=30))
+            self.assertEqual(report["archived"], 0)
+            self.assertTrue(
+                os.path.exists(f"{self.storage_dir}/results/fake0/{job_id}.json")
+            )
+
+    def test_dropbox_paths(self):
+        """
+        Are the jobs found and deleted in folders that depend on the username ?
+        """
+        get_user_model().objects.create(username="randy")
+        provider = DropboxLayoutProvider(
+            LocalLoginInformation(base_path=self.storage_dir), "archive"
+        )
+        finished_job = "20240101_120000-fake0-sandy-abcde"
+        failed_job = "20240101_120000-fake0-sandy-fghij"
+        provider.upload(JOB_PAYLOAD, "jobs/finished/fake0/sandy", finished_job)
+        provider.upload(JOB_PAYLOAD, "jobs/deleted", failed_job)
+        for job_id in (finished_job, failed_job):
+            provider.upload_status("fake0", "sandy", job_id)
+        provider.upload(
+            ResultDict(
+                display_name="fake0",
+                backend_version="0.1",
+                job_id=finished_job,
+                qobj_id=None,
+                success=True,
+                status="DONE",
+                header={},
+                results=[],
+            ).model_dump(),
+            "results/fake0/sandy",
+            finished_job,
+        )
+
+        with self.settings(MEDIA_ROOT=self.media_root, JOB_ARCHIVE_PERSISTENT=True):
+            with mock.patch(
+                "frontend.archive.get_storage_provider_from_entry",
+                return_value=provider,
+            ):
+                report = archive_storage_provider(
+                    self.entry,
+                    timedelta(days=30),
+                    now=datetime.now(timezone.utc) + timedelta(days=40),
+                )
+            self.assertEqual(report, {"indexed": 2, "archived": 2, "bundles": 1})
+            for folder in (
+                "jobs/finished/fake0/sandy",
+                "jobs/deleted",
+                "results/fake0/sandy",
+            ):
+                self.assertEqual(provider.get_file_queue(folder), [])
+            for job_id in (finished_job, failed_job):
+                status = provider.get_status("fake0", "sandy", job_id)
+                self.assertEqual(status.detail, "Could not find the status file.")
+            self.assertTrue(ArchivedJob.objects.get(job_id=failed_job).is_deleted)
+            result = read_archived_job("archive", "fake0", finished_job, "result")
+            self.assertEqual(result["status"], "DONE")
+
+    def test_result_endpoint(self):
+        """
+        Can archived results be fetched through the usual endpoint ?
+        """
+        job_id = self.run_job(timedelta(days=40))
+        with self.settings(MEDIA_ROOT=self.media_root, JOB_ARCHIVE_PERSISTENT=True):
+            archive_storage_provider(self.entry, timedelta(days=30))
+            url = reverse(
+                "get_job_result",
+                kwargs={"backend_name": "archive_fake0_simulator"},
+            )
+            params = {"job_id": job_id, "username": "sandy", "token": "archivetoken"}
+            r = self.client.get(url, params)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.json()["job_id"], job_id)
+            self.assertEqual(r.json()["status"], "DONE")
+
+            # the archive is not open to everyone
+            r = self.client.get(url, {**params, "token": "wrong"})
+            self.assertNotEqual(r.json().get("status"), "DONE")
+
+    def test_failed_job(self):
+        """
+        Is the archive left alone for jobs that failed in the storage provider ?
+        """
+        job_id = self.run_job(timedelta(days=1), fail=True)
+        url = reverse(
+            "get_job_status", kwargs={"backend_name": "archive_fake0_simulator"}
+        )
+        params = {"job_id": job_id, "username": "sandy", "token": "archivetoken"}
+        with mock.patch("frontend.middleware.read_archived_job") as read_archive:
+            r = self.client.get(url, params)
+        self.assertEqual(r.json()["status"], "ERROR")
+        self.assertEqual(r.json()["detail"], "failed")
+        read_archive.assert_not_called()
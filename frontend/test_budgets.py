@@ -0,0 +1,312 @@
+"""
+Module that checks the performance budgets of the views. Each url of `main/urls.py` has a
+maximal number of database queries and storage calls. The views are also called with
+seeded datasets of growing size, such that an N+1 pattern makes the tests fail.
+"""
+
+# pylint: disable=C0103
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from qlued.models import StorageProviderDb, Token
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from main.urls import urlpatterns
+
+from .catalogue import invalidate_catalogue
+from .fixtures import JOB_PAYLOAD, backend_config
+from .validation import validators
+
+# The maximal number of database queries of each url. The budgets of the pages for logged
+# in users include the two queries for the session and the user. The budgets of the
+# devices include the refresh of the catalogue and the profile reads the health of the
+# storage providers. The submission of jobs includes the token and the storage provider,
+# which the API reads after the validation of the job.
+QUERY_BUDGETS = {
+    "index": 5,
+    "about": 1,
+    "profile": 8,
+    "devices": 7,
+    "devices_api": 7,
+    "add_storage_provider": 2,
+    "delete_storage_provider": 4,
+    "edit_storage_provider": 4,
+    "signup": 14,
+    "healthz": 0,
+    "readyz": 2,
+    "login": 12,
+    "logout": 6,
+    "post_job": 5,
+}
+
+# The urls that talk to the storage providers. All others must not call them at all.
+STORAGE_URLS = {"devices", "devices_api", "readyz", "post_job"}
+
+# the queries of the devices if the catalogue is fresh: the count and the page
+CATALOGUE_QUERIES = 2
+
+# the sizes of the seeded datasets
+DATASET_SIZES = (1, 4, 16)
+
+# generous ceilings for the wall time in s, such that only real regressions fail
+WALL_TIME_BASE = 1.0
+WALL_TIME_PER_ITEM = 0.05
+
+
+# the health and the latency history are not written during the measured requests. The
+# budgets count the queries of the views, so the cache is kept in memory instead of the
+# cache table, like Redis in production.
+@override_settings(
+    TELEMETRY_FLUSH_INTERVAL=None,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class BudgetTestCase(TestCase):
+    """
+    Base class that measures the queries, storage calls and wall time of a request.
+    """
+
+    def setUp(self):
+        self.username = "sandy"
+        self.password = "dog"
+        self.user = get_user_model().objects.create(username=self.username)
+        self.user.set_password(self.password)
+        self.user.save()
+        self.storage_dir = tempfile.mkdtemp()
+        cache.clear()
+        validators.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir)
+
+    def seed_storage_providers(
+        self, n_providers: int, n_backends: int = 0
+    ) -> list[StorageProviderDb]:
+        """
+        Create local storage providers of the user, each with the given number of backends.
+        """
+        entries = []
+        for i in range(n_providers):
+            entry = StorageProviderDb.objects.create(
+                storage_type="local",
+                name=f"budget{i}",
+                owner=self.user,
+                description="test",
+                login={"base_path": f"{self.storage_dir}/budget{i}"},
+                is_active=True,
+            )
+            storage_provider = get_storage_provider_from_entry(entry)
+            for j in range(n_backends):
+                storage_provider.upload(
+                    backend_config(f"fermions{j}"), "backends/configs", f"fermions{j}"
+                )
+            entries.append(entry)
+        return entries
+
+    def seed_storage_providers_from(self, start: int, stop: int):
+        """
+        Add the storage providers with the indices from start to stop.
+        """
+        for i in range(start, stop):
+            StorageProviderDb.objects.create(
+                storage_type="local",
+                name=f"scaling{i}",
+                owner=self.user,
+                description="test",
+                login={"base_path": f"{self.storage_dir}/scaling{i}"},
+                is_active=True,
+            )
+
+    def measure(self, method: str, url: str, data=None, **extra) -> tuple:
+        """
+        Call the url and measure the request. Additional arguments are passed to the
+        test client.
+
+        Returns:
+            The response, the number of queries, the number of storage calls and the
+            wall time in s.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertLogs("frontend.access", level="INFO") as logs:
+                start = time.perf_counter()
+                response = getattr(self.client, method)(url, data, **extra)
+                duration = time.perf_counter() - start
+        return response, len(queries), logs.records[-1].storage_calls, duration
+
+    def assertWithinBudget(
+        self, url_name: str, method: str, url: str, data=None, **extra
+    ):
+        """
+        Check the query and storage budget of a single request.
+        """
+        response, n_queries, storage_calls, _ = self.measure(method, url, data, **extra)
+        self.assertLess(response.status_code, 500, url_name)
+        self.assertLessEqual(
+            n_queries,
+            QUERY_BUDGETS[url_name],
+            f"{url_name} exceeds its budget of database queries.",
+        )
+        if url_name not in STORAGE_URLS:
+            self.assertEqual(storage_calls, 0, f"{url_name} calls the storage.")
+        return response
+
+
+class UrlBudgetTest(BudgetTestCase):
+    """
+    Test that every url stays within its budget.
+    """
+
+    def test_every_url_has_a_budget(self):
+        """
+        New urls need a budget.
+        """
+        for pattern in urlpatterns:
+            if isinstance(pattern, URLPattern):
+                self.assertIn(pattern.name, QUERY_BUDGETS)
+
+    def test_anonymous_urls(self):
+        """
+        The pages that can be seen without login.
+        """
+        for url_name in (
+            "index",
+            "about",
+            "devices",
+            "devices_api",
+            "healthz",
+            "readyz",
+        ):
+            self.assertWithinBudget(url_name, "get", reverse(url_name))
+
+    def test_logged_in_urls(self):
+        """
+        The pages that need a login.
+        """
+        entry = self.seed_storage_providers(1)[0]
+        self.client.login(username=self.username, password=self.password)
+        self.assertWithinBudget("index", "get", reverse("index"))
+        self.assertWithinBudget("profile", "get", reverse("profile"))
+        self.assertWithinBudget(
+            "add_storage_provider", "get", reverse("add_storage_provider")
+        )
+        for url_name in ("edit_storage_provider", "delete_storage_provider"):
+            self.assertWithinBudget(url_name, "get", reverse(url_name, args=[entry.pk]))
+        self.assertWithinBudget("logout", "post", reverse("logout"))
+
+    def test_job_submission(self):
+        """
+        Submitting a job through the api.
+        """
+        self.seed_storage_providers(1, n_backends=1)
+        Token.objects.create(
+            key="budgettoken",
+            user=self.user,
+            created_at=datetime.now(timezone.utc),
+            is_active=True,
+        )
+        payload = {
+            "job": json.dumps(JOB_PAYLOAD),
+            "username": self.username,
+            "token": "budgettoken",
+        }
+        r = self.assertWithinBudget(
+            "post_job",
+            "post",
+            reverse("post_job", args=["budget0_fermions0_simulator"]),
+            json.dumps(payload),
+            content_type="application/json",
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["status"], "INITIALIZING")
+
+    def test_authentication_urls(self):
+        """
+        Signing up and logging in.
+        """
+        r = self.assertWithinBudget(
+            "signup",
+            "post",
+            reverse("signup"),
+            {
+                "username": "newuser",
+                "email": "newuser@example.com",
+                "password1": "a-long-Password-123",
+                "password2": "a-long-Password-123",
+            },
+        )
+        self.assertEqual(r.status_code, 302)
+        self.client.logout()
+
+        r = self.assertWithinBudget(
+            "login",
+            "post",
+            reverse("login"),
+            {"username": self.username, "password": self.password},
+        )
+        self.assertEqual(r.status_code, 302)
+
+
+class ScalingBudgetTest(BudgetTestCase):
+    """
+    Test that the views do not get slower than linear with the size of the data.
+    """
+
+    def test_profile_scaling(self):
+        """
+        The profile page needs the same number of queries for any number of storage
+        providers.
+        """
+        self.client.login(username=self.username, password=self.password)
+        # the first call creates the token of the user
+        self.client.get(reverse("profile"))
+
+        query_counts = []
+        n_seeded = 0
+        for size in DATASET_SIZES:
+            self.seed_storage_providers_from(n_seeded, size)
+            n_seeded = size
+            r, n_queries, storage_calls, duration = self.measure(
+                "get", reverse("profile")
+            )
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(storage_calls, 0)
+            self.assertLess(duration, WALL_TIME_BASE + WALL_TIME_PER_ITEM * size)
+            query_counts.append(n_queries)
+        self.assertEqual(len(set(query_counts)), 1, f"N+1 queries: {query_counts}")
+
+    def test_devices_scaling(self):
+        """
+        The refresh of the catalogue needs at most one storage call per provider and
+        backend and the same number of queries for any number of backends. Afterwards the
+        devices are read from the catalogue without any storage call.
+        """
+        query_counts = []
+        for size in DATASET_SIZES:
+            StorageProviderDb.objects.all().delete()
+            shutil.rmtree(self.storage_dir)
+            self.seed_storage_providers(2, n_backends=size)
+            invalidate_catalogue()
+            r, n_queries, storage_calls, duration = self.measure(
+                "get", reverse("devices")
+            )
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.context["page"].paginator.count, 2 * size)
+            self.assertLessEqual(storage_calls, 2 + 2 * size)
+            self.assertLess(duration, WALL_TIME_BASE + WALL_TIME_PER_ITEM * 2 * size)
+            query_counts.append(n_queries)
+
+            for url_name in ("devices", "devices_api"):
+                r, n_queries, storage_calls, _ = self.measure("get", reverse(url_name))
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(storage_calls, 0)
+                self.assertEqual(n_queries, CATALOGUE_QUERIES)
+        self.assertEqual(len(set(query_counts)), 1, f"N+1 queries: {query_counts}")
@@ -0,0 +1,189 @@
+"""
+Module that tests the catalogue of the devices.
+"""
+
+# pylint: disable=C0103
+import io
+from datetime import datetime, timezone
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from .catalogue import refresh_catalogue
+from .fixtures import LocalStorageTestCase, backend_config
+from .models import Device
+
+
+class CatalogueTest(LocalStorageTestCase):
+    """
+    Test the search in the catalogue of the devices.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.alpha = self.create_storage_provider(
+            "alpha",
+            [
+                ("fermions", "fermion", True, True),
+                ("bosons", "boson", False, False),
+            ],
+        )
+        self.create_storage_provider("beta", [("spins", "spin", True, False)])
+
+    def create_storage_provider(self, name: str, backends: list[tuple]):
+        """
+        A local storage provider with backends given as
+        (display_name, cold_atom_type, simulator, operational).
+        """
+        entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name=name,
+            owner=self.user,
+            description="test",
+            login={"base_path": f"{self.storage_dir}/{name}"},
+            is_active=True,
+        )
+        storage_provider = get_storage_provider_from_entry(entry)
+        for display_name, cold_atom_type, simulator, operational in backends:
+            config_dict = backend_config(display_name)
+            config_dict["cold_atom_type"] = cold_atom_type
+            config_dict["simulator"] = simulator
+            config_dict["description"] = f"A {cold_atom_type} machine"
+            if operational:
+                config_dict["last_queue_check"] = datetime.now(timezone.utc).isoformat()
+            storage_provider.upload(config_dict, "backends/configs", display_name)
+        return entry
+
+    def test_refresh(self):
+        """
+        Does the catalogue follow the storage providers ?
+        """
+        self.assertEqual(refresh_catalogue(), [])
+        self.assertEqual(
+            sorted(Device.objects.values_list("backend_name", flat=True)),
+            [
+                "alpha_bosons_hardware",
+                "alpha_fermions_simulator",
+                "beta_spins_simulator",
+            ],
+        )
+
+        # removed backends and inactive storage providers disappear
+        get_storage_provider_from_entry(self.alpha).delete("backends/configs", "bosons")
+        StorageProviderDb.objects.filter(name="beta").update(is_active=False)
+        refresh_catalogue()
+        self.assertEqual(
+            list(Device.objects.values_list("backend_name", flat=True)),
+            ["alpha_fermions_simulator"],
+        )
+
+        # the refresh is done by the first request and is then reused
+        self.client.get(reverse("devices"))
+        with self.assertLogs("frontend.access", level="INFO") as logs:
+            r = self.client.get(reverse("devices"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(logs.records[-1].storage_calls, 0)
+
+    def test_filters(self):
+        """
+        Can the devices be filtered on the page ?
+        """
+        url = reverse("devices")
+        cases = [
+            ({}, ["bosons", "fermions", "spins"]),
+            ({"cold_atom_type": "boson"}, ["bosons"]),
+            ({"kind": "simulator"}, ["fermions", "spins"]),
+            ({"kind": "hardware"}, ["bosons"]),
+            ({"status": "online"}, ["fermions"]),
+            ({"status": "offline", "kind": "simulator"}, ["spins"]),
+            ({"q": "SPIN"}, ["spins"]),
+            ({"q": "beta_"}, ["spins"]),
+            ({"q": "boson machine"}, ["bosons"]),
+            ({"q": "nothing"}, []),
+        ]
+        for params, expected in cases:
+            r = self.client.get(url, params)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(
+                [device["display_name"] for device in r.context["backend_list"]],
+                expected,
+                params,
+            )
+        self.assertContains(
+            self.client.get(url, {"kind": "hardware"}), "bosons hardware"
+        )
+
+    def test_card_cache(self):
+        """
+        Are the cards only rendered again once the device changed ?
+        """
+        url = reverse("devices")
+        self.assertContains(self.client.get(url), "A fermion machine")
+        fermions = Device.objects.get(display_name="fermions")
+        version = fermions.version
+        Device.objects.filter(pk=fermions.pk).update(description="Changed machine")
+        self.assertContains(self.client.get(url), "A fermion machine")
+        Device.objects.filter(pk=fermions.pk).update(version="changed")
+        self.assertContains(self.client.get(url), "Changed machine")
+
+        # the regular checks of the queue do not change the version
+        storage_provider = get_storage_provider_from_entry(self.alpha)
+        config_dict = backend_config("fermions")
+        config_dict["description"] = "A fermion machine"
+        config_dict["last_queue_check"] = datetime.now(timezone.utc).isoformat()
+        storage_provider.update(config_dict, "backends/configs", "fermions")
+        refresh_catalogue()
+        self.assertEqual(Device.objects.get(pk=fermions.pk).version, version)
+
+        # but a new configuration does
+        config_dict["max_shots"] = 10
+        storage_provider.update(config_dict, "backends/configs", "fermions")
+        refresh_catalogue()
+        self.assertNotEqual(Device.objects.get(pk=fermions.pk).version, version)
+
+    def test_benchmark(self):
+        """
+        Does the benchmark of the cards run ?
+        """
+        out = io.StringIO()
+        call_command("benchmark", suite=["cards"], devices=5, stdout=out)
+        self.assertIn("warm", out.getvalue())
+
+    @override_settings(DEVICES_PER_PAGE=2)
+    def test_pagination(self):
+        """
+        Are the devices split into pages in the page and the api ?
+        """
+        r = self.client.get(reverse("devices"), {"kind": "", "page": 2})
+        self.assertEqual(
+            [device["display_name"] for device in r.context["backend_list"]], ["spins"]
+        )
+        self.assertContains(r, "?kind=&amp;page=1")
+
+        url = reverse("devices_api")
+        content = self.client.get(url, {"kind": "simulator"}).json()
+        self.assertEqual(content["count"], 2)
+        self.assertEqual(content["num_pages"], 1)
+        self.assertIsNone(content["next"])
+        self.assertEqual(
+            [device["backend_name"] for device in content["results"]],
+            ["alpha_fermions_simulator", "beta_spins_simulator"],
+        )
+        self.assertTrue(
+            content["results"][0]["url"].endswith("/api/v2/alpha_fermions_simulator/")
+        )
+
+        content = self.client.get(url).json()
+        self.assertEqual(content["num_pages"], 2)
+        self.assertIn("page=2", content["next"])
+        content = self.client.get(content["next"]).json()
+        self.assertEqual(len(content["results"]), 1)
+        self.assertIn("page=1", content["previous"])
+
+        r = self.client.get(url, {"kind": "quantum"})
+        self.assertEqual(r.status_code, 400)
+        self.assertIn("kind", r.json()["detail"])
@@ -0,0 +1,119 @@
+"""
+Module that tests the time budgets of the requests.
+"""
+
+# pylint: disable=C0103
+import json
+import time
+
+from django.conf import settings
+from django.test import RequestFactory
+from django.urls import ResolverMatch, reverse
+from sqooler.storage_providers.local import LocalProviderExtended
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import deadlines
+from .fixtures import LocalStorageTestCase, backend_config
+from .middleware import DeadlineMiddleware
+
+
+class DeadlineTest(LocalStorageTestCase):
+    """
+    Test the time budgets of the requests.
+    """
+
+    def create_storage_provider(self, name: str):
+        """
+        A local storage provider with a single backend.
+        """
+        entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name=name,
+            owner=self.user,
+            description="test",
+            login={"base_path": f"{self.storage_dir}/{name}"},
+            is_active=True,
+        )
+        storage_provider = get_storage_provider_from_entry(entry)
+        storage_provider.upload(
+            backend_config("fermions"), "backends/configs", "fermions"
+        )
+        return storage_provider
+
+    def test_fail_fast(self):
+        """
+        Are storage calls refused once the budget is too small ?
+        """
+        storage_provider = self.create_storage_provider("fast")
+        self.assertIsNone(deadlines.remaining())
+        self.assertEqual(storage_provider.get_backends(), ["fermions"])
+
+        with deadlines.budget(10):
+            self.assertEqual(storage_provider.get_backends(), ["fermions"])
+            # a nested budget can only shorten the deadline
+            with deadlines.budget(100):
+                self.assertLessEqual(deadlines.remaining(), 10)
+            with deadlines.budget(0.01):
+                with self.assertRaises(deadlines.DeadlineExceeded):
+                    storage_provider.get_backends()
+        self.assertIsNone(deadlines.remaining())
+
+    def test_api_response(self):
+        """
+        Do API requests that run out of time get a response in the format of the API ?
+        """
+
+        def slow_view(request):
+            raise deadlines.DeadlineExceeded("too slow")
+
+        request = RequestFactory().get("/api/v2/fast_fermions_simulator/get_job_status")
+        request.resolver_match = ResolverMatch(
+            slow_view,
+            (),
+            {"backend_name": "fast_fermions_simulator"},
+            url_name="get_job_status",
+        )
+
+        def get_response(request):
+            middleware.process_view(request, slow_view, (), {})
+            self.assertLessEqual(deadlines.remaining(), settings.REQUEST_DEADLINE)
+            return middleware.process_exception(
+                request, deadlines.DeadlineExceeded("too slow")
+            )
+
+        middleware = DeadlineMiddleware(get_response)
+        response = middleware(request)
+        self.assertIsNone(deadlines.remaining())
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.content)["status"], "ERROR")
+        self.assertIn("Retry-After", response)
+
+    def test_devices_partial(self):
+        """
+        Does a slow storage provider only remove its own devices from the page ?
+        """
+        self.create_storage_provider("slow")
+        self.create_storage_provider("fast")
+        original_get_file_queue = LocalProviderExtended.get_file_queue
+
+        def get_file_queue(storage_provider, storage_path):
+            if storage_provider.name == "slow":
+                time.sleep(0.6)
+            return original_get_file_queue(storage_provider, storage_path)
+
+        LocalProviderExtended.get_file_queue = get_file_queue
+        try:
+            with self.settings(
+                REQUEST_DEADLINES={"devices": 1.0}, STORAGE_CALL_MIN_BUDGET=0.1
+            ):
+                r = self.client.get(reverse("devices"))
+        finally:
+            LocalProviderExtended.get_file_queue = original_get_file_queue
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.context["missing_providers"], ["slow"])
+        self.assertEqual(
+            [backend["backend_name"] for backend in r.context["backend_list"]],
+            ["fast_fermions_simulator"],
+        )
@@ -0,0 +1,194 @@
+"""
+Module that tests the health checks and the recorded health of the storage providers.
+"""
+
+# pylint: disable=C0103
+import math
+import shutil
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import provider_health
+from .fixtures import LocalStorageTestCase, backend_config
+from .models import StorageProviderHealth
+
+
+class HealthTest(TestCase):
+    """
+    Test the liveness and readiness probes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create(username="sandy")
+
+    def tearDown(self):
+        shutil.rmtree("storage-health", ignore_errors=True)
+
+    def test_healthz(self):
+        """
+        Is the process alive ?
+        """
+        r = self.client.get(reverse("healthz"))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["status"], "ok")
+
+    def test_readyz(self):
+        """
+        Are the database and the storage providers checked ?
+        """
+        StorageProviderDb.objects.create(
+            storage_type="local",
+            name="healthtest",
+            owner=self.user,
+            description="test",
+            login={"base_path": "storage-health"},
+            is_active=True,
+        )
+        r = self.client.get(reverse("readyz"))
+        self.assertEqual(r.status_code, 200)
+        checks = r.json()["checks"]
+        self.assertEqual(checks["database"]["status"], "ok")
+        self.assertIn("latency_ms", checks["database"])
+        self.assertEqual(checks["storage:healthtest"]["status"], "ok")
+
+        # the storage checks are cached, so a removed provider is still reported
+        StorageProviderDb.objects.all().delete()
+        r = self.client.get(reverse("readyz"))
+        self.assertIn("storage:healthtest", r.json()["checks"])
+
+
+class ProviderHealthTest(LocalStorageTestCase):
+    """
+    Test the recorded health of the storage providers.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.username = "sandy"
+        self.password = "dog"
+        self.user.is_staff = True
+        self.user.is_superuser = True
+        self.user.set_password(self.password)
+        self.user.save()
+        self.entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name="healthy",
+            owner=self.user,
+            description="test",
+            login={"base_path": self.storage_dir},
+            is_active=True,
+        )
+        self.storage_provider = get_storage_provider_from_entry(self.entry)
+        # the calls of the other tests are not of interest
+        provider_health.recorder.pending.clear()
+
+    def test_weighted_percentile(self):
+        """
+        Do busy samples weigh more than quiet ones ?
+        """
+        self.assertTrue(math.isnan(provider_health.weighted_percentile([], 95)))
+        samples = [([1.0, 2.0, 3.0, 4.0], 4)]
+        self.assertEqual(provider_health.weighted_percentile(samples, 50), 2.0)
+        self.assertEqual(provider_health.weighted_percentile(samples, 95), 4.0)
+        # the second sample stands for 100 calls of 10 ms
+        samples.append(([10.0], 100))
+        self.assertEqual(provider_health.weighted_percentile(samples, 50), 10.0)
+
+    @override_settings(STORAGE_HEALTH_SAMPLE_SIZE=5)
+    def test_reservoir(self):
+        """
+        Does a busy storage provider keep a fixed number of latencies ?
+        """
+        recorder = provider_health.HealthRecorder()
+        for i in range(100):
+            recorder.record("busy", "get", i / 1000, True)
+        self.assertEqual(recorder.pending["busy"].n_calls, 100)
+        self.assertEqual(len(recorder.pending["busy"].latencies), 5)
+
+    def test_logged_calls(self):
+        """
+        Are the storage calls only logged at the debug level ?
+        """
+        with self.assertNoLogs("frontend.instrumentation", level="INFO"):
+            self.storage_provider.get_backends()
+        with self.assertLogs("frontend.instrumentation", level="DEBUG") as logs:
+            self.storage_provider.get_backends()
+        record = logs.records[0]
+        self.assertEqual(record.storage_provider, "healthy")
+        self.assertEqual(record.method, "get_backends")
+        self.assertTrue(record.success)
+
+    def test_recorded_calls(self):
+        """
+        Are the storage calls recorded and summarized ?
+        """
+        self.storage_provider.upload(
+            backend_config("fermions"), "backends/configs", "fermions"
+        )
+        self.storage_provider.get_backends()
+        with self.assertRaises(FileNotFoundError):
+            self.storage_provider.get("jobs/queued/fermions", "missing")
+        provider_health.recorder.flush()
+
+        sample = StorageProviderHealth.objects.get(storage_provider="healthy")
+        self.assertEqual(sample.n_calls, 3)
+        self.assertEqual(sample.n_errors, 1)
+        self.assertEqual(sample.backend_count, 1)
+        self.assertEqual(len(sample.latencies), 3)
+
+        # an old sample is still used for the last contact, but not for the rates
+        StorageProviderHealth.objects.create(
+            storage_provider="healthy",
+            recorded_at=sample.recorded_at - timedelta(hours=2),
+            n_calls=10,
+            n_errors=10,
+            latencies=[5000.0],
+            backend_count=7,
+        )
+        with CaptureQueriesContext(connection) as queries:
+            health = provider_health.get_provider_health(["healthy", "unknown"])
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn("unknown", health)
+        self.assertEqual(health["healthy"].n_calls, 3)
+        self.assertAlmostEqual(health["healthy"].error_rate, 1 / 3)
+        self.assertLess(health["healthy"].p95_ms, 5000)
+        self.assertEqual(health["healthy"].backend_count, 1)
+        self.assertEqual(health["healthy"].last_success_at, sample.last_success_at)
+
+        # expired samples are removed with the next flush
+        StorageProviderHealth.objects.filter(n_calls=10).update(
+            recorded_at=sample.recorded_at - timedelta(days=2)
+        )
+        self.storage_provider.get_backends()
+        provider_health.recorder.flush()
+        self.assertEqual(StorageProviderHealth.objects.count(), 2)
+
+    def test_tables(self):
+        """
+        Do the profile and the admin show the health without probing the storage ?
+        """
+        self.storage_provider.get_backends()
+        provider_health.recorder.flush()
+        self.client.login(username=self.username, password=self.password)
+
+        with self.assertLogs("frontend.access", level="INFO") as logs:
+            r = self.client.get(reverse("profile"))
+        self.assertEqual(logs.records[-1].storage_calls, 0)
+        self.assertContains(r, "p95 latency")
+        self.assertContains(r, "0.0 %")
+        self.assertIsNotNone(r.context["storage_provider_entries"][0].health.p95_ms)
+
+        r = self.client.get(reverse("admin:qlued_storageproviderdb_changelist"))
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, "Last contact")
+        self.assertContains(r, "0.0 %")
@@ -0,0 +1,193 @@
+"""
+Module that tests the history of the latency.
+"""
+
+# pylint: disable=C0103
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve, reverse
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import latency
+from .loadtest import percentile
+from .middleware import RequestLogMiddleware
+from .models import LatencySketch, StorageProviderHealth
+
+
+class LatencyHistoryTest(TestCase):
+    """
+    Test the history of the latency.
+    """
+
+    def setUp(self):
+        self.staff_user = get_user_model().objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        latency.recorder.pending.clear()
+        cache.clear()
+
+    def test_sketch(self):
+        """
+        Are the percentiles within the accuracy and can sketches be merged ?
+        """
+        values = [float(value) for value in range(1, 1001)]
+        sketch = latency.Sketch()
+        first_half, second_half = latency.Sketch(), latency.Sketch()
+        for value in values:
+            sketch.add(value)
+            (first_half if value <= 500 else second_half).add(value)
+        for q in (50, 95, 99):
+            exact = percentile(values, q)
+            self.assertAlmostEqual(
+                sketch.quantile(q), exact, delta=exact * latency.RELATIVE_ACCURACY
+            )
+        first_half.merge(second_half)
+        self.assertEqual(first_half, sketch)
+        self.assertIsNone(latency.Sketch().quantile(50))
+
+        # the size stays bounded, no matter how wide the durations are spread
+        for exponent in range(-6, 10):
+            for mantissa in range(1, 100):
+                sketch.add(mantissa * 10.0**exponent)
+        self.assertLess(len(sketch.buckets), 500)
+        self.assertLessEqual(sketch.quantile(100), sketch.max_ms)
+
+    @override_settings(TELEMETRY_FLUSH_INTERVAL=3600.0)
+    def test_recorded_requests(self):
+        """
+        Are the endpoints and the storage providers recorded ?
+        """
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name="latency",
+            owner=self.staff_user,
+            description="test",
+            login={"base_path": storage_dir},
+            is_active=True,
+        )
+        get_storage_provider_from_entry(entry).get_backends()
+        for _ in range(3):
+            self.client.get(reverse("healthz"))
+        self.assertEqual(LatencySketch.objects.count(), 0)
+
+        latency.recorder.flush()
+        endpoint = LatencySketch.objects.get(kind="endpoint", name="healthz")
+        self.assertEqual(endpoint.count, 3)
+        self.assertEqual(endpoint.resolution, settings.LATENCY_HISTORY_RESOLUTION)
+        self.assertEqual(
+            LatencySketch.objects.get(kind="storage", name="latency").count, 1
+        )
+
+    @override_settings(TELEMETRY_FLUSH_INTERVAL=0)
+    def test_written_after_request(self):
+        """
+        Are the health and the latency written together once the response was sent ?
+        """
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name="latency",
+            owner=self.staff_user,
+            description="test",
+            login={"base_path": storage_dir},
+            is_active=True,
+        )
+        get_storage_provider_from_entry(entry).get_backends()
+
+        # the middleware only records the request
+        request = RequestFactory().get(reverse("healthz"))
+        request.resolver_match = resolve(reverse("healthz"))
+        with self.assertLogs("frontend.access", level="INFO"):
+            RequestLogMiddleware(lambda request: HttpResponse())(request)
+        self.assertEqual(LatencySketch.objects.count(), 0)
+        self.assertEqual(StorageProviderHealth.objects.count(), 0)
+
+        self.client.get(reverse("healthz"))
+        self.assertEqual(
+            LatencySketch.objects.get(kind="endpoint", name="healthz").count, 2
+        )
+        self.assertTrue(
+            StorageProviderHealth.objects.filter(storage_provider="latency").exists()
+        )
+
+    def test_compaction(self):
+        """
+        Are old sketches merged into hours and removed after the retention ?
+        """
+        now = datetime.now(timezone.utc)
+        old_hour = latency.period_of(now - timedelta(days=2), 3600)
+        # the recent sketches are in the current hour, such that they form one point
+        recent_hour = latency.period_of(now, 3600)
+        sketches = []
+        for minutes, value in ((0, 10.0), (5, 20.0), (5, 30.0)):
+            sketch = latency.Sketch()
+            sketch.add(value)
+            sketches.append(
+                sketch.to_record(
+                    "endpoint", "post_job", old_hour + timedelta(minutes=minutes), 300
+                )
+            )
+            sketches.append(
+                sketch.to_record(
+                    "endpoint",
+                    "post_job",
+                    min(recent_hour + timedelta(minutes=minutes), now),
+                    300,
+                )
+            )
+        sketches.append(
+            sketch.to_record("endpoint", "post_job", now - timedelta(days=30), 3600)
+        )
+        LatencySketch.objects.bulk_create(sketches)
+
+        self.assertEqual(latency.compact_history(now), 3)
+        hourly = LatencySketch.objects.get(resolution=3600)
+        self.assertEqual(hourly.period_start, old_hour)
+        self.assertEqual(hourly.count, 3)
+        self.assertEqual(hourly.max_ms, 30.0)
+        self.assertEqual(LatencySketch.objects.filter(resolution=300).count(), 3)
+        self.assertEqual(latency.compact_history(now), 0)
+
+        history = latency.get_history(days=3)
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0].total.count, 6)
+        self.assertEqual(
+            len([value for value in history[0].percentiles["p99"] if value]), 2
+        )
+
+    def test_dashboard(self):
+        """
+        Can the staff chart the percentiles ?
+        """
+        sketch = latency.Sketch()
+        sketch.add(12.0)
+        now = datetime.now(timezone.utc)
+        LatencySketch.objects.bulk_create(
+            [
+                sketch.to_record("storage", "mongo", now - timedelta(hours=hours), 300)
+                for hours in (1, 2, 3)
+            ]
+        )
+        url = reverse("admin:frontend_latencysketch_changelist")
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 302)
+
+        self.client.force_login(self.staff_user)
+        r = self.client.get(url, {"days": 1, "kind": "storage"})
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, "Storage provider mongo")
+        self.assertContains(r, "<polyline", count=3 * 3)
+        r = self.client.get(url, {"days": "a lot", "kind": "endpoint"})
+        self.assertContains(r, "No latency was recorded")
@@ -0,0 +1,81 @@
+"""
+Module that tests the load test.
+"""
+
+import math
+import time
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from .fixtures import JOB_PAYLOAD, LocalStorageTestCase, backend_config
+from .loadtest import FakeSpooler, LoadStats, percentile
+
+
+class LoadTestTest(LocalStorageTestCase):
+    """
+    Test the fake spoolers and the statistics of the load test.
+    """
+
+    def test_percentile(self):
+        """
+        Are the percentiles computed by the nearest rank ?
+        """
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertTrue(math.isnan(percentile([], 50)))
+
+    def test_stats(self):
+        """
+        Are throughput, queueing delays and error rates reported ?
+        """
+        stats = LoadStats()
+        stats.record_request("post_job", True)
+        stats.record_request("post_job", False)
+        # the spooler may take the job before the client knows its id
+        stats.record_pickup("job1", 10.5)
+        stats.record_submission("job1", 10.0)
+        stats.record_job(1.0)
+        stats.record_job(None)
+        summary = stats.summary(duration=2.0)
+        self.assertEqual(summary["jobs_per_second"], 0.5)
+        self.assertEqual(summary["jobs_failed"], 1)
+        self.assertEqual(summary["error_rates"], {"post_job": 0.5})
+        self.assertEqual(summary["queueing_delay"]["p50"], 0.5)
+
+    def test_fake_spooler(self):
+        """
+        Does the fake spooler finish the queued jobs of a local storage provider ?
+        """
+        entry = StorageProviderDb.objects.create(
+            storage_type="local",
+            name="loadtest",
+            owner=self.user,
+            description="test",
+            login={"base_path": self.storage_dir},
+            is_active=True,
+        )
+        storage_provider = get_storage_provider_from_entry(entry)
+        storage_provider.upload(backend_config("fake0"), "backends/configs", "fake0")
+        job_id = storage_provider.upload_job(JOB_PAYLOAD, "fake0", "sandy")
+        storage_provider.upload_status("fake0", "sandy", job_id)
+
+        stats = LoadStats()
+        spooler = FakeSpooler(storage_provider, "fake0", 100.0, stats, 0.01)
+        spooler.start()
+        deadline = time.monotonic() + 5
+        while "spooler" not in stats.requests and time.monotonic() < deadline:
+            time.sleep(0.01)
+        spooler.stop()
+        spooler.join()
+
+        self.assertEqual(stats.requests, {"spooler": 1})
+        self.assertEqual(stats.errors, {})
+        self.assertEqual(
+            storage_provider.get_status("fake0", "sandy", job_id).status, "DONE"
+        )
+        self.assertEqual(
+            storage_provider.get_result("fake0", "sandy", job_id).status, "DONE"
+        )
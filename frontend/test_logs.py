@@ -0,0 +1,60 @@
+"""
+Module that tests the structured logs of the requests.
+"""
+
+# pylint: disable=C0103
+import io
+import json
+import logging
+
+from django.test import TestCase
+from django.urls import reverse
+
+from .logs import BackgroundHandler, JsonFormatter, RequestContextFilter
+
+
+class RequestLogTest(TestCase):
+    """
+    Test the structured access logs.
+    """
+
+    def test_request_id(self):
+        """
+        Does every response carry a request id that also appears in the access log ?
+        """
+        with self.assertLogs("frontend.access", level="INFO") as logs:
+            r = self.client.get(reverse("about"))
+        request_id = r["X-Request-ID"]
+        self.assertTrue(request_id)
+        record = logs.records[0]
+        self.assertEqual(record.request_id, request_id)
+        self.assertEqual(record.url_name, "about")
+        self.assertEqual(record.status, 200)
+        self.assertEqual(record.storage_calls, 0)
+
+        # the id of a proxy is kept, but only if it is harmless
+        r = self.client.get(reverse("about"), HTTP_X_REQUEST_ID="proxy-id-1")
+        self.assertEqual(r["X-Request-ID"], "proxy-id-1")
+        r = self.client.get(reverse("about"), HTTP_X_REQUEST_ID="bad id\n")
+        self.assertNotEqual(r["X-Request-ID"], "bad id\n")
+
+    def test_background_handler(self):
+        """
+        Are the records written as json lines by the background thread ?
+        """
+        stream = io.StringIO()
+        handler = BackgroundHandler(stream=stream)
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(RequestContextFilter())
+        logger = logging.getLogger("frontend.tests.background")
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            logger.warning("hello %s", "world", extra={"status": 200})
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+        log_dict = json.loads(stream.getvalue().strip())
+        self.assertEqual(log_dict["message"], "hello world")
+        self.assertEqual(log_dict["status"], 200)
+        self.assertIn("request_id", log_dict)
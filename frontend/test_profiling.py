@@ -0,0 +1,79 @@
+"""
+Module that tests the profiling of single requests.
+"""
+
+# pylint: disable=C0103
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from .models import RequestProfile
+from .profiling import SamplingProfiler
+
+
+class ProfilerTest(TestCase):
+    """
+    Test the on-demand profiling of requests.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.staff_user = get_user_model().objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.user = get_user_model().objects.create(username="sandy")
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def test_sampling_profiler(self):
+        """
+        Does the profiler find the function that takes the time ?
+        """
+
+        def slow_function():
+            time.sleep(0.05)
+
+        with SamplingProfiler(threading.get_ident(), interval=0.001) as profiler:
+            slow_function()
+        self.assertGreater(profiler.n_samples, 0)
+        stack, count = profiler.folded().splitlines()[0].rsplit(" ", 1)
+        self.assertIn("slow_function", stack)
+        self.assertGreater(int(count), 0)
+
+    def test_profile_request(self):
+        """
+        Are only the requests of staff users profiled and are old profiles removed ?
+        """
+        url = reverse("about") + "?profile=1"
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.client.force_login(self.user)
+            r = self.client.get(url)
+            self.assertNotIn("X-Profile-Id", r)
+            self.assertEqual(RequestProfile.objects.count(), 0)
+
+            self.client.force_login(self.staff_user)
+            for _ in range(3):
+                r = self.client.get(url)
+                self.assertEqual(r.status_code, 200)
+                self.assertIn("X-Profile-Id", r)
+            with self.settings(PROFILER_MAX_PROFILES=2):
+                r = self.client.get(url)
+            self.assertEqual(RequestProfile.objects.count(), 2)
+            self.assertEqual(
+                len(os.listdir(os.path.join(self.media_root, "profiles"))), 2
+            )
+
+            # the profile can be downloaded in the admin
+            profile = RequestProfile.objects.first()
+            self.assertEqual(profile.url_name, "about")
+            r = self.client.get(
+                reverse("admin:frontend_requestprofile_download", args=[profile.pk])
+            )
+            self.assertEqual(r.status_code, 200)
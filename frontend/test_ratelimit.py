@@ -0,0 +1,162 @@
+"""
+Module that tests the rate limits of the API.
+"""
+
+import math
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import ResolverMatch
+
+from .instrumentation import LATENCY_CACHE_KEY, LatencyTracker
+from .middleware import RateLimitMiddleware
+from .models import RateLimit
+from .ratelimit import Bucket, consume
+
+
+class RateLimitTest(TestCase):
+    """
+    Test the token-bucket rate limiting of the API.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.middleware = RateLimitMiddleware(lambda request: HttpResponse("ok"))
+
+    def get_status_request(self, token="abc", backend_name="local_fermions_simulator"):
+        """
+        A request for the job status that was resolved like the one of the API.
+        """
+        request = self.factory.get(
+            "/api/v2/" + backend_name + "/get_job_status",
+            {"job_id": "1", "username": "sandy", "token": token},
+        )
+        request.resolver_match = ResolverMatch(
+            lambda request: None,
+            (),
+            {"backend_name": backend_name},
+            url_name="get_job_status",
+        )
+        return request
+
+    def test_consume(self):
+        """
+        Is the bucket emptied and refilled ?
+        """
+        bucket = Bucket(capacity=2, refill_rate=1000)
+        self.assertEqual(consume({"test": bucket}), (0, ""))
+        self.assertEqual(consume({"test": bucket}), (0, ""))
+
+        empty_bucket = Bucket(capacity=1, refill_rate=0.01)
+        self.assertEqual(consume({"empty": empty_bucket}), (0, ""))
+        wait, key = consume({"empty": empty_bucket})
+        self.assertGreater(wait, 0)
+        self.assertEqual(key, "empty")
+
+        # a bucket without refill stays empty
+        closed_bucket = Bucket(capacity=1, refill_rate=0)
+        self.assertEqual(consume({"closed": closed_bucket}), (0, ""))
+        self.assertEqual(consume({"closed": closed_bucket}), (math.inf, "closed"))
+
+    def test_all_or_nothing(self):
+        """
+        Is a request that one bucket rejects not charged to the other one ?
+        """
+        user_bucket = Bucket(capacity=2, refill_rate=0.01)
+        backend_bucket = Bucket(capacity=1, refill_rate=0.01)
+        buckets = {"user": user_bucket, "backend_a": backend_bucket}
+        self.assertEqual(consume(buckets)[0], 0)
+        self.assertEqual(consume(buckets)[1], "backend_a")
+        self.assertEqual(
+            consume({"user": user_bucket, "backend_b": backend_bucket})[0], 0
+        )
+        self.assertEqual(
+            consume({"user": user_bucket, "backend_c": backend_bucket})[1], "user"
+        )
+
+    def test_concurrent_consume(self):
+        """
+        Are the tokens refunded if another worker took the last ones in the meantime ?
+        """
+        bucket = Bucket(capacity=1, refill_rate=0.01)
+        self.assertEqual(consume({"race": bucket})[0], 0)
+        # the other worker read the counts before the first request was charged
+        get_many = cache.get_many
+        stale_reads = [{}]
+
+        def read_counts(keys, *args, **kwargs):
+            return stale_reads.pop() if stale_reads else get_many(keys, *args, **kwargs)
+
+        with mock.patch.object(cache, "get_many", side_effect=read_counts):
+            self.assertEqual(consume({"other": bucket, "race": bucket})[1], "race")
+        self.assertEqual(consume({"other": bucket})[0], 0)
+
+    def test_user_limit(self):
+        """
+        Is a user rejected once the bucket is empty ?
+        """
+        RateLimit.objects.create(scope="user", name="abc", capacity=1, refill_rate=0.01)
+        response = self.middleware.process_view(self.get_status_request(), None, (), {})
+        self.assertIsNone(response)
+        response = self.middleware.process_view(self.get_status_request(), None, (), {})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 1)
+
+        # other users are not affected
+        response = self.middleware.process_view(
+            self.get_status_request(token="xyz"), None, (), {}
+        )
+        self.assertIsNone(response)
+
+    def test_backend_limit(self):
+        """
+        Is the default rule of the backends applied ?
+        """
+        RateLimit.objects.create(scope="backend", capacity=1, refill_rate=0.01)
+        response = self.middleware.process_view(
+            self.get_status_request(token="a"), None, (), {}
+        )
+        self.assertIsNone(response)
+        response = self.middleware.process_view(
+            self.get_status_request(token="b"), None, (), {}
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_load_shedding(self):
+        """
+        Are requests rejected if the storage is too slow ?
+        """
+        cache.set(LATENCY_CACHE_KEY, 1000.0)
+        response = self.middleware.process_view(self.get_status_request(), None, (), {})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+    def test_unavailable_cache(self):
+        """
+        Is the latency still measured if it cannot be published ?
+        """
+        tracker = LatencyTracker()
+        with mock.patch.object(cache, "set", side_effect=DatabaseError("locked")):
+            tracker.add(0.5)
+            with self.assertLogs("frontend.instrumentation", level="WARNING"):
+                tracker.publish()
+        self.assertGreater(tracker.average, 0)
+
+    def test_latency_published_after_request(self):
+        """
+        Is the latency only published from the thread of the request ?
+        """
+        tracker = LatencyTracker()
+        with mock.patch.object(cache, "set") as cache_set:
+            tracker.add(0.5)
+            cache_set.assert_not_called()
+            tracker.publish()
+            cache_set.assert_called_once_with(LATENCY_CACHE_KEY, 0.1, timeout=60)
+            # nothing new within the interval
+            tracker.add(0.5)
+            tracker.publish()
+            self.assertEqual(cache_set.call_count, 1)
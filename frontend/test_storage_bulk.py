@@ -0,0 +1,146 @@
+"""
+Module that tests the bulk import and export of the storage providers.
+"""
+
+# pylint: disable=C0103
+import io
+import json
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from qlued.models import StorageProviderDb
+
+from .fixtures import LocalStorageTestCase
+from .storage_bulk import import_storage_providers
+
+
+class StorageProviderBulkTest(LocalStorageTestCase):
+    """
+    Test the bulk import and export of storage providers.
+    """
+
+    def records(self, n_providers: int) -> list[dict]:
+        """
+        Local storage providers for the import.
+        """
+        return [
+            {
+                "storage_type": "local",
+                "name": f"bulk{i}",
+                "description": "test",
+                "login": {"base_path": f"{self.storage_dir}/bulk{i}"},
+                "is_active": True,
+            }
+            for i in range(n_providers)
+        ]
+
+    def test_import_many(self):
+        """
+        Are many storage providers imported quickly with a constant number of queries ?
+        """
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            result = import_storage_providers(self.records(500), self.user)
+        self.assertLess(time.perf_counter() - start, 10)
+        # the inserts are batched, so there is no query per storage provider
+        self.assertLess(len(queries), 20)
+        self.assertEqual(len(result.created), 500)
+        self.assertEqual(result.errors, {})
+        self.assertEqual(StorageProviderDb.objects.filter(owner=self.user).count(), 500)
+
+        # a second import updates the existing entries
+        records = self.records(2)
+        records[0]["description"] = "changed"
+        result = import_storage_providers(records, self.user)
+        self.assertEqual(result.updated, ["bulk0", "bulk1"])
+        self.assertEqual(
+            StorageProviderDb.objects.get(name="bulk0").description, "changed"
+        )
+
+    def test_import_is_all_or_nothing(self):
+        """
+        Is nothing written if a single storage provider is invalid ?
+        """
+        other_user = get_user_model().objects.create(username="other")
+        StorageProviderDb.objects.create(
+            storage_type="local",
+            name="taken",
+            owner=other_user,
+            description="test",
+            login={"base_path": self.storage_dir},
+        )
+        records = self.records(3)
+        records[1]["name"] = "Not Valid"
+        records.append(dict(records[0]))
+        records.append({**self.records(1)[0], "name": "taken"})
+        records.append({**self.records(1)[0], "name": "stranger", "owner": "nobody"})
+
+        result = import_storage_providers(records, self.user)
+        self.assertEqual(
+            set(result.errors), {"Not Valid", "bulk0", "taken", "stranger"}
+        )
+        self.assertEqual(result.created, [])
+        self.assertEqual(StorageProviderDb.objects.count(), 1)
+
+    def test_commands(self):
+        """
+        Can the storage providers be exported and imported again ?
+        """
+        import_storage_providers(self.records(3), self.user)
+        path = os.path.join(self.storage_dir, "providers.json")
+        call_command("export_storage_providers", output=path)
+        with open(path, encoding="utf-8") as file:
+            exported = json.load(file)
+        self.assertEqual(
+            [record["name"] for record in exported], ["bulk0", "bulk1", "bulk2"]
+        )
+        self.assertEqual(exported[0]["owner"], "sandy")
+
+        StorageProviderDb.objects.all().delete()
+        out = io.StringIO()
+        call_command("import_storage_providers", path, stdout=out)
+        self.assertIn("Created 3", out.getvalue())
+        self.assertEqual(StorageProviderDb.objects.count(), 3)
+
+        with self.assertRaises(CommandError):
+            call_command("import_storage_providers", path, owner="nobody")
+
+    def test_admin_export(self):
+        """
+        Can the selected storage providers be exported in the admin ?
+        """
+        import_storage_providers(self.records(2), self.user)
+        admin_user = get_user_model().objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(admin_user)
+        url = reverse("admin:qlued_storageproviderdb_changelist")
+        selected = StorageProviderDb.objects.values_list("pk", flat=True)
+        r = self.client.post(
+            url, {"action": "export_json", "_selected_action": list(selected)}
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(json.loads(r.content)), 2)
+
+        r = self.client.get(reverse("admin:qlued_storageproviderdb_import"))
+        self.assertEqual(r.status_code, 200)
+
+        # staff that may only view the storage providers cannot export their logins
+        viewer = get_user_model().objects.create(username="viewer", is_staff=True)
+        viewer.user_permissions.add(
+            Permission.objects.get(codename="view_storageproviderdb")
+        )
+        self.client.force_login(viewer)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        r = self.client.post(
+            url, {"action": "export_json", "_selected_action": list(selected)}
+        )
+        self.assertTrue(r["Content-Type"].startswith("text/html"))
+        self.assertNotContains(r, "base_path")
@@ -0,0 +1,379 @@
+"""
+Module that tests the submission of jobs and their deduplication.
+"""
+
+# pylint: disable=C0103
+import io
+import json
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+from sqooler.storage_providers.local import LocalProviderExtended
+
+from qlued.models import StorageProviderDb
+from qlued.storage_providers import get_storage_provider_from_entry
+
+from . import submission
+from .fixtures import JOB_PAYLOAD, LocalStorageTestCase
+from .middleware import IdempotencyMiddleware
+from .models import PendingJob
+from .submission import (
+    claim_pending_jobs,
+    flush_pending_jobs,
+    read_pending_job,
+    upload_job_files,
+)
+
+
+class IdempotencyTest(LocalStorageTestCase):
+    """
+    Test the deduplication of job submissions.
+    """
+
+    storage_name = "idem"
+    token_key = "idemtoken"
+    url = "/api/v2/idem_fake0_simulator/post_job"
+
+    def post_job(self, job: dict, token: str = "idemtoken", **headers):
+        """
+        Submit the job and return the response and the number of storage calls.
+        """
+        payload = {"job": json.dumps(job), "username": "sandy", "token": token}
+        with self.assertLogs("frontend.access", level="INFO") as logs:
+            response = self.client.post(
+                self.url,
+                json.dumps(payload),
+                content_type="application/json",
+                headers=headers,
+            )
+        return response, logs.records[-1].storage_calls
+
+    def queued_jobs(self) -> list[str]:
+        """
+        The jobs in the queue of the backend.
+        """
+        return self.storage_provider.get_file_queue("jobs/queued/fake0")
+
+    @override_settings(IDEMPOTENCY_CONTENT_HASH=True)
+    def test_content_hash(self):
+        """
+        Is an identical job only stored once ?
+        """
+        r, storage_calls = self.post_job(JOB_PAYLOAD)
+        self.assertEqual(r.status_code, 200)
+        self.assertGreater(storage_calls, 0)
+        job_id = r.json()["job_id"]
+
+        # the order of the keys does not matter
+        reordered = dict(reversed(list(JOB_PAYLOAD.items())))
+        r, storage_calls = self.post_job(reordered)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["job_id"], job_id)
+        self.assertEqual(r["Idempotent-Replayed"], "true")
+        self.assertEqual(storage_calls, 0)
+        self.assertEqual(len(self.queued_jobs()), 1)
+
+        # other jobs and other users are not affected
+        other_job = json.loads(json.dumps(JOB_PAYLOAD))
+        other_job["experiment_0"]["shots"] = 3
+        r, _ = self.post_job(other_job)
+        self.assertNotEqual(r.json()["job_id"], job_id)
+        r, _ = self.post_job(JOB_PAYLOAD, token="wrong")
+        self.assertEqual(r.status_code, 401)
+        self.assertEqual(len(self.queued_jobs()), 2)
+
+        # after the window, the job is submitted again
+        with self.settings(IDEMPOTENCY_WINDOW=0):
+            r, _ = self.post_job(JOB_PAYLOAD)
+        self.assertNotEqual(r.json()["job_id"], job_id)
+        self.assertEqual(len(self.queued_jobs()), 3)
+
+    def test_idempotency_key(self):
+        """
+        Does the header identify the submissions ?
+        """
+        r, _ = self.post_job(JOB_PAYLOAD)
+        job_id = r.json()["job_id"]
+        r, _ = self.post_job(JOB_PAYLOAD)
+        self.assertNotEqual(r.json()["job_id"], job_id)
+
+        r, _ = self.post_job(JOB_PAYLOAD, **{"Idempotency-Key": "run-1"})
+        job_id = r.json()["job_id"]
+        r, storage_calls = self.post_job(JOB_PAYLOAD, **{"Idempotency-Key": "run-1"})
+        self.assertEqual(r.json()["job_id"], job_id)
+        self.assertEqual(storage_calls, 0)
+
+        other_job = json.loads(json.dumps(JOB_PAYLOAD))
+        other_job["experiment_0"]["shots"] = 3
+        r, _ = self.post_job(other_job, **{"Idempotency-Key": "run-1"})
+        self.assertEqual(r.status_code, 422)
+        self.assertEqual(r.json()["status"], "ERROR")
+        self.assertEqual(len(self.queued_jobs()), 3)
+
+    def test_unauthenticated(self):
+        """
+        Are keys only claimed by the owners of the token ?
+        """
+        payload = {"job": json.dumps(JOB_PAYLOAD), "username": "sandy", "token": "x"}
+        request = RequestFactory().post(
+            self.url,
+            json.dumps(payload),
+            content_type="application/json",
+            headers={"Idempotency-Key": "run-1"},
+        )
+        request.resolver_match = resolve(self.url)
+        middleware = IdempotencyMiddleware(lambda request: None)
+        self.assertIsNone(middleware.process_view(request, None, (), {}))
+        self.assertFalse(hasattr(request, "idempotency_cache_key"))
+
+        r, _ = self.post_job(JOB_PAYLOAD, **{"Idempotency-Key": "run-1"})
+        self.assertEqual(r.status_code, 200)
+        self.assertNotIn("Idempotent-Replayed", r)
+
+    @override_settings(IDEMPOTENCY_CONTENT_HASH=True)
+    def test_concurrent_submission(self):
+        """
+        Is a duplicate rejected while the first submission is still handled ?
+        """
+        payload = {
+            "job": json.dumps(JOB_PAYLOAD),
+            "username": "sandy",
+            "token": "idemtoken",
+        }
+        duplicates = []
+        original_create_job_id = LocalProviderExtended.create_job_id
+
+        def create_job_id(storage_provider, *args, **kwargs):
+            if not duplicates:
+                duplicates.append(
+                    self.client.post(
+                        self.url, json.dumps(payload), content_type="application/json"
+                    )
+                )
+            return original_create_job_id(storage_provider, *args, **kwargs)
+
+        LocalProviderExtended.create_job_id = create_job_id
+        try:
+            r = self.client.post(
+                self.url, json.dumps(payload), content_type="application/json"
+            )
+        finally:
+            LocalProviderExtended.create_job_id = original_create_job_id
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertIn("Retry-After", duplicates[0])
+        self.assertEqual(len(self.queued_jobs()), 1)
+
+
+class SubmissionTest(LocalStorageTestCase):
+    """
+    Test the upload of the submitted jobs.
+    """
+
+    storage_name = "submit"
+    token_key = "submittoken"
+
+    def setUp(self):
+        super().setUp()
+        self.payload = {
+            "job": json.dumps(JOB_PAYLOAD),
+            "username": "sandy",
+            "token": "submittoken",
+        }
+
+    def post_job(self, backend_name: str = "submit_fake0_simulator", **changes):
+        """
+        Submit the job through the api.
+        """
+        return self.client.post(
+            reverse("post_job", args=[backend_name]),
+            json.dumps({**self.payload, **changes}),
+            content_type="application/json",
+        )
+
+    def queued_jobs(self) -> list[str]:
+        """
+        The jobs in the queue of the backend.
+        """
+        return self.storage_provider.get_file_queue("jobs/queued/fake0")
+
+    def test_post_job(self):
+        """
+        Are the job and its status uploaded ?
+        """
+        r = self.post_job()
+        self.assertEqual(r.status_code, 200)
+        job_id = r.json()["job_id"]
+        self.assertEqual(r.json()["status"], "INITIALIZING")
+        self.assertEqual(self.queued_jobs(), [job_id])
+        status = self.storage_provider.get_status("fake0", "sandy", job_id)
+        self.assertEqual(status.status, "INITIALIZING")
+
+        self.assertEqual(self.post_job(token="wrong").status_code, 401)
+        self.assertEqual(self.post_job("nothing_fake0_simulator").status_code, 404)
+        self.assertEqual(self.post_job(job="no json").status_code, 422)
+        self.assertEqual(len(self.queued_jobs()), 1)
+
+    def test_storage_outage(self):
+        """
+        Do failed uploads get an error in the format of the API ?
+        """
+        with mock.patch.object(
+            LocalProviderExtended,
+            "upload_status",
+            side_effect=ConnectionError("The storage provider is gone."),
+        ):
+            r = self.post_job()
+        self.assertEqual(r.status_code, 406)
+        self.assertEqual(r.json()["status"], "ERROR")
+        self.assertEqual(r.json()["job_id"], "None")
+        self.assertEqual(self.queued_jobs(), [])
+
+    def test_hooks_outside_requests(self):
+        """
+        Do the storage providers upload as usual outside of the submissions to the API ?
+        """
+        job_id = self.storage_provider.upload_job(JOB_PAYLOAD, "fake0", "sandy")
+        self.assertEqual(self.queued_jobs(), [job_id])
+        status = self.storage_provider.get_status("fake0", "sandy", job_id)
+        self.assertEqual(status.detail, "Could not find the status file.")
+        self.storage_provider.upload_status("fake0", "sandy", job_id)
+        status = self.storage_provider.get_status("fake0", "sandy", job_id)
+        self.assertEqual(status.status, "INITIALIZING")
+
+    def test_rollback(self):
+        """
+        Is the job removed if its status could not be uploaded and vice versa ?
+        """
+        for method in ("upload_status", "upload"):
+            storage_provider = get_storage_provider_from_entry(
+                StorageProviderDb.objects.get(name="submit")
+            )
+
+            def fail(*args, **kwargs):
+                raise ConnectionError("The storage provider is gone.")
+
+            setattr(storage_provider, method, fail)
+            job_id = storage_provider.create_job_id("fake0", "sandy")
+            with self.assertRaises(ConnectionError):
+                upload_job_files(
+                    storage_provider, JOB_PAYLOAD, "fake0", "sandy", job_id
+                )
+            self.assertEqual(self.queued_jobs(), [])
+            self.assertEqual(self.storage_provider.get_file_queue("status/fake0"), [])
+
+    @override_settings(
+        JOB_WRITE_BEHIND=True, JOB_WRITE_BEHIND_FLUSH_DELAY=None, IDEMPOTENCY_WINDOW=0
+    )
+    def test_write_behind(self):
+        """
+        Are the jobs accepted right away and uploaded by the flush ?
+        """
+        job_ids = []
+        with self.assertLogs("frontend.access", level="INFO") as logs:
+            for _ in range(3):
+                r = self.post_job()
+                self.assertEqual(r.status_code, 200)
+                self.assertEqual(r.json()["status"], "INITIALIZING")
+                job_ids.append(r.json()["job_id"])
+        # only the first submission reads the configuration of the backend
+        self.assertEqual([record.storage_calls for record in logs.records], [1, 0, 0])
+        self.assertEqual(self.queued_jobs(), [])
+
+        # the status of a pending job is served from the queue
+        params = {"job_id": job_ids[0], "username": "sandy", "token": "submittoken"}
+        url = reverse("get_job_result", args=["submit_fake0_simulator"])
+        r = self.client.get(url, params)
+        self.assertEqual(r.json()["status"], "INITIALIZING")
+
+        self.assertEqual(flush_pending_jobs(batch_size=2), {"uploaded": 2, "failed": 0})
+        out = io.StringIO()
+        call_command("flush_pending_jobs", stdout=out)
+        self.assertIn("uploaded 1 jobs", out.getvalue())
+        self.assertEqual(sorted(self.queued_jobs()), sorted(job_ids))
+        self.assertEqual(PendingJob.objects.count(), 0)
+
+    @override_settings(JOB_WRITE_BEHIND=True, JOB_WRITE_BEHIND_FLUSH_DELAY=None)
+    def test_write_behind_failures(self):
+        """
+        Are failed uploads retried, finally reported and can they be retried again ?
+        """
+        # a job that was uploaded by an earlier flush counts as uploaded
+        self.post_job()
+        pending_job = PendingJob.objects.get()
+        upload_job_files(
+            self.storage_provider, JOB_PAYLOAD, "fake0", "sandy", pending_job.job_id
+        )
+        self.assertEqual(flush_pending_jobs(), {"uploaded": 1, "failed": 0})
+        self.assertEqual(self.queued_jobs(), [pending_job.job_id])
+
+        job_id = self.post_job().json()["job_id"]
+        with mock.patch.object(
+            LocalProviderExtended,
+            "upload_status",
+            side_effect=ConnectionError("The storage provider is gone."),
+        ):
+            with self.assertLogs("frontend.submission", level="WARNING"):
+                for _ in range(settings.JOB_WRITE_BEHIND_MAX_ATTEMPTS - 1):
+                    self.assertEqual(flush_pending_jobs(), {"uploaded": 0, "failed": 1})
+            with self.assertLogs("frontend.submission", level="ERROR"):
+                self.assertEqual(flush_pending_jobs(), {"uploaded": 0, "failed": 1})
+            self.assertEqual(flush_pending_jobs(), {"uploaded": 0, "failed": 0})
+        self.assertIn("ConnectionError", PendingJob.objects.get().last_error)
+        self.assertEqual(read_pending_job("submit", "fake0", job_id)["status"], "ERROR")
+        err = io.StringIO()
+        call_command("flush_pending_jobs", stdout=io.StringIO(), stderr=err)
+        self.assertIn("1 jobs failed", err.getvalue())
+
+        # the staff can give the job another chance
+        admin_user = get_user_model().objects.create(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(admin_user)
+        self.client.post(
+            reverse("admin:frontend_pendingjob_changelist"),
+            {
+                "action": "retry",
+                "_selected_action": [PendingJob.objects.get().pk],
+            },
+        )
+        self.assertEqual(flush_pending_jobs(), {"uploaded": 1, "failed": 0})
+        self.assertIn(job_id, self.queued_jobs())
+
+    @override_settings(
+        JOB_WRITE_BEHIND=True,
+        JOB_WRITE_BEHIND_FLUSH_DELAY=None,
+        JOB_WRITE_BEHIND_LEASE=0.3,
+        IDEMPOTENCY_WINDOW=0,
+    )
+    def test_lease_renewal(self):
+        """
+        Does a flush keep its jobs while the uploads take longer than the lease ?
+        """
+        self.post_job()
+        self.post_job()
+
+        def slow_upload(*args):
+            time.sleep(0.2)
+
+        original_renew_lease = submission.renew_lease
+        stolen_jobs = []
+
+        def renew_lease(lease):
+            # another worker looks for jobs right before the lease is renewed
+            stolen_jobs.extend(claim_pending_jobs(10))
+            original_renew_lease(lease)
+
+        with mock.patch.object(
+            submission, "upload_pending_job", side_effect=slow_upload
+        ), mock.patch.object(
+            submission, "renew_lease", side_effect=renew_lease
+        ) as renewals:
+            self.assertEqual(flush_pending_jobs(), {"uploaded": 2, "failed": 0})
+        self.assertTrue(renewals.called)
+        self.assertEqual(stolen_jobs, [])
@@ -0,0 +1,135 @@
+"""
+Module that tests the checks of the jobs against the limits of the backends.
+"""
+
+# pylint: disable=C0103
+import io
+import json
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+
+from .catalogue import refresh_catalogue
+from .fixtures import JOB_PAYLOAD, LocalStorageTestCase, backend_config
+from .validation import JobValidator, validators
+
+
+class ValidationTest(LocalStorageTestCase):
+    """
+    Test the checks of the jobs against the limits of the backends.
+    """
+
+    storage_name = "valid"
+    token_key = "validtoken"
+
+    def setUp(self):
+        super().setUp()
+        self.validator = JobValidator.compile(self.storage_provider.get_config("fake0"))
+
+    def changed_job(self, **changes) -> dict:
+        """
+        The job of the load tests with other values for its experiment.
+        """
+        return {"experiment_0": {**JOB_PAYLOAD["experiment_0"], **changes}}
+
+    def test_validator(self):
+        """
+        Are the jobs beyond the limits of the backend rejected ?
+        """
+        self.assertEqual(self.validator.validate(JOB_PAYLOAD), [])
+        # like the spooler, the numbers of the experiments go up to max_experiments
+        experiments = {f"experiment_{i}": JOB_PAYLOAD["experiment_0"] for i in range(6)}
+        self.assertEqual(self.validator.validate(experiments), [])
+        experiments["experiment_6"] = JOB_PAYLOAD["experiment_0"]
+        errors = self.validator.validate(experiments)
+        self.assertEqual(len(errors), 1)
+        self.assertIn("experiment_6 is beyond", errors[0])
+        renamed = {"exp_0": JOB_PAYLOAD["experiment_0"]}
+        self.assertIn("experiment_<number>", self.validator.validate(renamed)[0])
+        # the spooler maps the wires itself, whatever their order
+        self.assertEqual(
+            self.validator.validate(self.changed_job(wire_order="sequential")), []
+        )
+        self.assertIn("shots", self.validator.validate(self.changed_job(shots=1001))[0])
+        self.assertIn(
+            "wires", self.validator.validate(self.changed_job(num_wires=5))[0]
+        )
+
+        for instructions, problem in (
+            ([["rx", [0], [0.1]]], "unsupported instruction rx"),
+            ([["fhop", [0, 1, 2, 4], [0.5]]], "not within the 4 wires"),
+            ([["fhop", ["a"], [0.5]]], "not within the 4 wires"),
+            ([["fhop", [0]]], "invalid instruction"),
+            ([None], "invalid instruction"),
+        ):
+            errors = self.validator.validate(
+                self.changed_job(
+                    instructions=JOB_PAYLOAD["experiment_0"]["instructions"]
+                    + instructions
+                )
+            )
+            self.assertEqual(len(errors), 1)
+            self.assertIn(problem, errors[0])
+
+        broken = {f"experiment_{i}": None for i in range(5)}
+        self.assertEqual(len(self.validator.validate(broken)), 5)
+
+    def test_rejected_submission(self):
+        """
+        Is a job beyond the limits rejected before anything is uploaded ?
+        """
+        payload = {
+            "job": json.dumps(self.changed_job(shots=1001)),
+            "username": "sandy",
+            "token": "validtoken",
+        }
+        url = reverse("post_job", args=["valid_fake0_simulator"])
+        r = self.client.post(url, json.dumps(payload), content_type="application/json")
+        self.assertEqual(r.status_code, 422)
+        self.assertEqual(r.json()["status"], "ERROR")
+        self.assertIn("shots", r.json()["detail"])
+        self.assertEqual(self.storage_provider.get_file_queue("jobs/queued/fake0"), [])
+
+        url = reverse("post_job", args=["valid_nothing_simulator"])
+        r = self.client.post(url, json.dumps(payload), content_type="application/json")
+        self.assertEqual(r.status_code, 404)
+
+    @override_settings(JOB_VALIDATOR_CHECK_INTERVAL=0)
+    def test_cache(self):
+        """
+        Is the validator only compiled again once the backend changed ?
+        """
+        backend_name = "valid_fake0_simulator"
+        refresh_catalogue()
+        with self.assertLogs("frontend.instrumentation", level="DEBUG") as logs:
+            validator = validators.get(self.storage_provider, backend_name, "fake0")
+            self.assertIs(
+                validators.get(self.storage_provider, backend_name, "fake0"), validator
+            )
+        self.assertEqual(
+            [record.method for record in logs.records if hasattr(record, "method")],
+            ["get_config"],
+        )
+
+        self.storage_provider.update(
+            {**backend_config("fake0"), "max_shots": 5000},
+            "backends/configs",
+            "fake0",
+        )
+        self.assertIs(
+            validators.get(self.storage_provider, backend_name, "fake0"), validator
+        )
+        refresh_catalogue()
+        validator = validators.get(self.storage_provider, backend_name, "fake0")
+        self.assertEqual(validator.max_shots, 5000)
+
+    def test_benchmark(self):
+        """
+        Does the benchmark of the validation run ?
+        """
+        out = io.StringIO()
+        call_command(
+            "benchmark", suite=["validation"], experiments=2, instructions=5, stdout=out
+        )
+        self.assertIn("validate", out.getvalue())
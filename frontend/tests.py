@@ -1,5 +1,6 @@
 """
-Module that contains all the tests for this app folder.
+Module that contains the tests of the pages of this app folder. The tests of the single
+features are in the `test_*.py` modules next to it.
 """
 
 # pylint: disable=C0103
@@ -7,6 +8,7 @@ import json
 import shutil
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.test import TestCase
 from django.urls import reverse
@@ -15,6 +17,7 @@ from icecream import ic
 from qlued.models import StorageProviderDb
 from qlued.storage_providers import get_storage_provider_from_entry
 
+from .catalogue import invalidate_catalogue
 from .models import Impressum
 
 
@@ -253,6 +256,7 @@ class DevicesTest(TestCase):
         user = get_user_model().objects.create(username=self.username)
         user.set_password(self.password)
         user.save()
+        cache.clear()
 
     def tearDown(self):
         shutil.rmtree("storage-1")
@@ -302,11 +306,14 @@ class DevicesTest(TestCase):
 
         local_storage = get_storage_provider_from_entry(local_entry)
         local_storage.upload(fermions_config, "backends/configs", "fermions")
+        # the catalogue of the devices is only refreshed once in a while
+        invalidate_catalogue()
         r = self.client.get(url)
         self.assertEqual(r.status_code, 200)
 
         # now test that we have the appropriate information in each device
         devices = r.context["backend_list"]
+        self.assertEqual(len(devices), 1)
         for device in devices:
             self.assertIsNotNone(
                 device["url"], "Device dictionary does not contain valid url"
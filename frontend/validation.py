@@ -0,0 +1,215 @@
+"""
+Module that checks the submitted jobs against the capabilities of their backend before
+anything is uploaded. The configuration of a backend is compiled once into a validator,
+which is kept in the memory of the worker until the version of the backend in the device
+catalogue changes. The spooler still checks every instruction in detail, this module only
+rejects the jobs that the backend can never run.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from itertools import chain
+from operator import itemgetter
+from typing import Optional
+
+from django.conf import settings
+
+from .models import Device
+
+# a broken job can have a lot of problems, but the first ones are enough for the user
+MAX_ERRORS = 10
+
+
+@dataclass(frozen=True)
+class JobValidator:
+    """
+    The limits of a backend in the form that is fastest to check.
+
+    Attributes:
+        supported_instructions: the names of the instructions that the backend knows
+        num_wires: the maximal number of wires
+        max_shots: the maximal number of shots per experiment
+        max_experiments: the highest number in the names of the experiments
+    """
+
+    supported_instructions: frozenset[str]
+    num_wires: int
+    max_shots: int
+    max_experiments: int
+
+    @classmethod
+    def compile(cls, backend_config) -> "JobValidator":
+        """
+        The validator of the configuration of a backend.
+        """
+        return cls(
+            supported_instructions=frozenset(backend_config.supported_instructions),
+            num_wires=backend_config.num_wires,
+            max_shots=backend_config.max_shots,
+            max_experiments=backend_config.max_experiments,
+        )
+
+    def validate(self, job_dict: dict) -> list[str]:
+        """
+        Check the job against the limits of the backend.
+
+        Returns:
+            The problems of the job, which are empty if the job can be run.
+        """
+        if not job_dict:
+            return ["The job has no experiments."]
+
+        errors = []
+        for name, experiment in job_dict.items():
+            if len(errors) >= MAX_ERRORS:
+                break
+            # the experiments are named like the spooler expects them
+            if not name.startswith("experiment_") or not name[11:].isdigit():
+                errors.append(f"{name} is not named experiment_<number>.")
+                continue
+            if int(name[11:]) > self.max_experiments:
+                errors.append(
+                    f"{name} is beyond the experiment_{self.max_experiments} that the "
+                    "backend allows."
+                )
+                continue
+            if not isinstance(experiment, dict):
+                errors.append(f"{name} is not an experiment.")
+                continue
+            shots = experiment.get("shots")
+            if not isinstance(shots, int) or not 0 < shots <= self.max_shots:
+                errors.append(f"{name} needs between 1 and {self.max_shots} shots.")
+            num_wires = experiment.get("num_wires")
+            if not isinstance(num_wires, int) or not 0 < num_wires <= self.num_wires:
+                errors.append(f"{name} needs between 1 and {self.num_wires} wires.")
+                num_wires = self.num_wires
+            instructions = experiment.get("instructions")
+            if not isinstance(instructions, list):
+                errors.append(f"{name} has no list of instructions.")
+                continue
+            if not self.instructions_fit(instructions, num_wires):
+                errors.append(self.explain_instructions(name, instructions, num_wires))
+        return errors[:MAX_ERRORS]
+
+    def instructions_fit(self, instructions: list, num_wires: int) -> bool:
+        """
+        Are all instructions supported and applied to existing wires ? The loops run in
+        C through `map`, which makes large jobs several times faster than a loop over
+        the instructions.
+        """
+        try:
+            if instructions and set(map(len, instructions)) != {3}:
+                return False
+            if not self.supported_instructions.issuperset(
+                map(itemgetter(0), instructions)
+            ):
+                return False
+            wires = list(chain.from_iterable(map(itemgetter(1), instructions)))
+            # min and max fail for anything but numbers
+            return not wires or (min(wires) >= 0 and max(wires) < num_wires)
+        except TypeError:
+            return False
+
+    def explain_instructions(
+        self, name: str, instructions: list, num_wires: int
+    ) -> str:
+        """
+        The first problem of the instructions of an experiment.
+        """
+        for instruction in instructions:
+            try:
+                instruction_name, wires, _ = instruction
+            except (TypeError, ValueError):
+                return f"{name} has the invalid instruction {instruction}."
+            if instruction_name not in self.supported_instructions:
+                return f"{name} uses the unsupported instruction {instruction_name}."
+            if not self.instructions_fit([instruction], num_wires):
+                return (
+                    f"{name} applies {instruction_name} to the wires {wires}, "
+                    f"which are not within the {num_wires} wires."
+                )
+        return f"{name} has invalid instructions."
+
+
+class ValidatorCache:
+    """
+    The validators of the backends in the memory of this worker. The version of a backend
+    in the device catalogue is looked up at most once per `JOB_VALIDATOR_CHECK_INTERVAL`
+    and the validator is compiled again once it changed. Backends that are not in the
+    catalogue yet are compiled again after `DEVICE_CATALOGUE_MAX_AGE`.
+    """
+
+    max_size = 512
+
+    def __init__(self) -> None:
+        # the version, the time of the compilation and of the last check of the version
+        self.validators: dict[str, tuple[Optional[str], float, float, JobValidator]] = (
+            {}
+        )
+        self.lock = threading.Lock()
+
+    def get(self, storage_provider, backend_name: str, display_name: str):
+        """
+        The validator of a backend.
+
+        Args:
+            storage_provider: the storage provider of the backend
+            backend_name: the full name of the backend
+            display_name: the name of the backend within its storage provider
+
+        Raises:
+            FileNotFoundError: if the backend does not exist
+        """
+        now = time.monotonic()
+        with self.lock:
+            cached = self.validators.get(backend_name)
+        if cached is not None:
+            _, _, checked_at, validator = cached
+            if now - checked_at < settings.JOB_VALIDATOR_CHECK_INTERVAL:
+                return validator
+
+        current_version = self.catalogue_version(backend_name)
+        if cached is not None:
+            version, compiled_at, _, validator = cached
+            if version == current_version and (
+                current_version is not None
+                or now - compiled_at < settings.DEVICE_CATALOGUE_MAX_AGE
+            ):
+                self.store(backend_name, (version, compiled_at, now, validator))
+                return validator
+
+        validator = JobValidator.compile(storage_provider.get_config(display_name))
+        self.store(backend_name, (current_version, now, now, validator))
+        return validator
+
+    @staticmethod
+    def catalogue_version(backend_name: str) -> Optional[str]:
+        """
+        The version of the backend in the device catalogue, if it is listed there.
+        """
+        # pylint: disable=E1101
+        return (
+            Device.objects.filter(backend_name=backend_name)
+            .values_list("version", flat=True)
+            .first()
+        )
+
+    def store(self, backend_name: str, entry: tuple) -> None:
+        """
+        Keep the validator of a backend and forget the oldest one if there are too many.
+        """
+        with self.lock:
+            self.validators.pop(backend_name, None)
+            if len(self.validators) >= self.max_size:
+                # the dict keeps the order of insertion, so this is the oldest one
+                del self.validators[next(iter(self.validators))]
+            self.validators[backend_name] = entry
+
+    def clear(self) -> None:
+        """Forget all validators."""
+        with self.lock:
+            self.validators.clear()
+
+
+validators = ValidatorCache()
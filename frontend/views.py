@@ -10,20 +10,25 @@ from decouple import config
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.paginator import Page
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.template import loader
 from django.urls import reverse
-from pydantic import ValidationError
 
 from qlued.models import StorageProviderDb, Token
-from qlued.storage_providers import (
-    get_storage_provider_from_entry,
-    get_short_backend_name,
-)
 
-from .forms import SignUpForm, StorageProviderForm
+from .catalogue import (
+    ensure_fresh_catalogue,
+    filter_devices,
+    get_page,
+    invalidate_catalogue,
+    render_cards,
+)
+from .forms import DeviceFilterForm, SignUpForm, StorageProviderForm
+from .health import check_database, check_storage_providers
 from .models import Impressum
+from .provider_health import attach_health
 
 
 def index(request):
@@ -52,47 +57,72 @@ def index(request):
     return HttpResponse(template.render(context, request))
 
 
+def search_devices(request, form: DeviceFilterForm) -> Page:
+    """
+    The requested page of the devices that match the filters of the form.
+    """
+    filters = form.cleaned_data if form.is_valid() else {}
+    return get_page(filter_devices(**filters), request.GET.get("page"))
+
+
 def devices(request):
-    """The about that contains all the available backend devices."""
+    """The page with the available backend devices, which can be searched and filtered."""
     template = loader.get_template("frontend/backends.html")
 
-    # pylint: disable=W0613, E1101
-    backend_list = []
-    # obtain all the available storage providers from the database
-    storage_provider_entries = StorageProviderDb.objects.all()
+    # the storage providers that did not answer in time during the last refresh
+    missing_providers = ensure_fresh_catalogue()
+    form = DeviceFilterForm(request.GET)
+    page = search_devices(request, form)
+
+    # the filters are kept when switching the page
+    query = request.GET.copy()
+    query.pop("page", None)
 
-    # now loop through them and obtain the backends
-    for storage_provider_entry in storage_provider_entries:
-        if not storage_provider_entry.is_active:
-            continue
-        try:
-            storage_provider = get_storage_provider_from_entry(storage_provider_entry)
-
-            backend_names = storage_provider.get_backends()
-            for backend in backend_names:
-                # for testing we created dummy devices. We should ignore them in any other cases.
-                if not "dummy_" in backend:
-                    device_status = storage_provider.get_backend_status(backend)
-                    # we have to add the URL to the backend configuration
-                    base_url = config("BASE_URL")
-
-                    config_dict = device_status.model_dump()
-                    config_dict["display_name"] = get_short_backend_name(
-                        device_status.backend_name
-                    )
-                    config_dict["url"] = (
-                        base_url + "/api/v2/" + device_status.backend_name + "/"
-                    )
-
-                    backend_list.append(config_dict)
-        except ValidationError:
-            # we ignore the entry if it is not valid
-            pass
     base_url = config("BASE_URL", default="http://www.example.com")
-    context = {"backend_list": backend_list, "base_url": base_url}
+    backend_list = [device.as_dict(base_url) for device in page]
+    context = {
+        "backend_list": backend_list,
+        "cards": render_cards(backend_list),
+        "base_url": base_url,
+        "missing_providers": missing_providers,
+        "form": form,
+        "page": page,
+        "query": query.urlencode(),
+    }
     return HttpResponse(template.render(context, request))
 
 
+def devices_api(request):
+    """
+    The devices as json with the same filters as the devices page.
+    """
+    missing_providers = ensure_fresh_catalogue()
+    form = DeviceFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"detail": form.errors}, status=400)
+    page = search_devices(request, form)
+
+    def page_url(number: int) -> str:
+        query = request.GET.copy()
+        query["page"] = number
+        return request.build_absolute_uri("?" + query.urlencode())
+
+    base_url = config("BASE_URL", default="http://www.example.com")
+    return JsonResponse(
+        {
+            "count": page.paginator.count,
+            "page": page.number,
+            "num_pages": page.paginator.num_pages,
+            "next": page_url(page.next_page_number()) if page.has_next() else None,
+            "previous": (
+                page_url(page.previous_page_number()) if page.has_previous() else None
+            ),
+            "missing_providers": missing_providers,
+            "results": [device.as_dict(base_url) for device in page],
+        }
+    )
+
+
 def about(request):
     """The about view that is called for the about page."""
     # pylint: disable=E1101
@@ -128,7 +158,10 @@ def profile(request):
         token.save()
 
     # we also need to find all the StorageProviderDb entries that belong to the user
-    storage_provider_entries = StorageProviderDb.objects.filter(owner=current_user)
+    # together with their recorded health
+    storage_provider_entries = attach_health(
+        StorageProviderDb.objects.filter(owner=current_user)
+    )
     template = loader.get_template("frontend/user.html")
     context = {
         "token_key": token.key,
@@ -137,6 +170,41 @@ def profile(request):
     return HttpResponse(template.render(context, request))
 
 
+def healthz(request):
+    """
+    Liveness probe that only tells that the process is able to answer.
+    """
+    # pylint: disable=W0613
+    return JsonResponse({"status": "ok"})
+
+
+def readyz(request):
+    """
+    Readiness probe. The server is only ready if the database answers. The storage
+    providers are reported with their latency, but a failing storage provider
+    only marks the server as degraded, as it is not under the control of this instance.
+    """
+    # pylint: disable=W0613
+    database_check = check_database()
+    storage_checks = check_storage_providers()
+
+    checks = {"database": database_check}
+    for name, storage_check in storage_checks.items():
+        checks["storage:" + name] = storage_check
+
+    if database_check["status"] != "ok":
+        status = "error"
+    elif any(check["status"] != "ok" for check in storage_checks.values()):
+        status = "degraded"
+    else:
+        status = "ok"
+    response = JsonResponse(
+        {"status": status, "checks": checks}, status=503 if status == "error" else 200
+    )
+    response["Cache-Control"] = "no-store"
+    return response
+
+
 def signup(request):
     """
     Allow the user to sign up on our website.
@@ -209,6 +277,7 @@ def add_storage_provider(request):
             )
             storage_provider.full_clean()
             storage_provider.save()
+            invalidate_catalogue()
             return HttpResponseRedirect(reverse("profile"))
     else:
         form = StorageProviderForm()
@@ -254,6 +323,7 @@ def edit_storage_provider(request, storage_id):
             # now clean the storage provider and save it
             storage_provider.full_clean()
             storage_provider.save()
+            invalidate_catalogue()
             return HttpResponseRedirect(reverse("profile"))
     else:
         try:
@@ -305,6 +375,7 @@ def delete_storage_provider(request, storage_id):
     # delete the storage provider from the database if the user confirmed the deletion
     if request.method == "POST":
         storage_provider.delete()
+        invalidate_catalogue()
         return HttpResponseRedirect(reverse("profile"))
 
     # show the user a confirmation page
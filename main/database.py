@@ -0,0 +1,92 @@
+"""
+Module that configures the database connections in the same way on every deployment.
+Connections are persistent and checked before they are reused. SQLite is tuned such
+that concurrent requests do not lock each other out.
+"""
+
+import django
+import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+
+# the pragmas that are executed on every new SQLite connection. WAL allows readers and
+# a writer at the same time, the rest reduces the number of disk syncs and reads.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-20000;",
+    "PRAGMA mmap_size=134217728;",
+)
+
+POOL_MODES = ("", "native", "pgbouncer")
+
+
+def database_settings(
+    url: str,
+    conn_max_age: int = 600,
+    ssl_require: bool = False,
+    sqlite_timeout: float = 20.0,
+    pool: str = "",
+) -> dict:
+    """
+    Create the settings of a database from its url.
+
+    Args:
+        url: the url of the database, e.g. `sqlite:///db.sqlite3` or `postgres://...`
+        conn_max_age: how long a connection is kept open in s
+        ssl_require: require ssl for the connection to Postgres
+        sqlite_timeout: how long SQLite waits for a lock in s
+        pool: "native" uses the connection pool of Django for Postgres,
+            "pgbouncer" prepares the connections for an external pooler like PgBouncer
+
+    Returns:
+        The settings of the database
+
+    Raises:
+        ImproperlyConfigured: if the pool is not supported by the database
+    """
+    if pool not in POOL_MODES:
+        raise ImproperlyConfigured(f"DATABASE_POOL must be one of {POOL_MODES}.")
+
+    is_sqlite = url.startswith("sqlite")
+    db_settings = dj_database_url.parse(
+        url,
+        conn_max_age=conn_max_age,
+        conn_health_checks=True,
+        ssl_require=ssl_require and not is_sqlite,
+    )
+
+    if is_sqlite:
+        if pool:
+            raise ImproperlyConfigured("SQLite does not support connection pooling.")
+        db_settings.setdefault("OPTIONS", {})["timeout"] = sqlite_timeout
+        return db_settings
+
+    if pool == "native":
+        if django.VERSION < (5, 1):
+            raise ImproperlyConfigured(
+                "The native connection pool requires Django 5.1 and psycopg 3."
+            )
+        # the pool manages the connections, so they must not be persistent
+        db_settings["CONN_MAX_AGE"] = 0
+        db_settings.setdefault("OPTIONS", {})["pool"] = True
+    elif pool == "pgbouncer":
+        # server side cursors do not survive the transaction pooling of PgBouncer
+        db_settings["DISABLE_SERVER_SIDE_CURSORS"] = True
+    return db_settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply the pragmas to every new SQLite connection.
+    """
+    # pylint: disable=W0613
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+
+
+connection_created.connect(configure_sqlite, dispatch_uid="configure_sqlite")
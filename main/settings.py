@@ -10,12 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
-import dj_database_url
 import os
 from pathlib import Path
 from decouple import config
 from django.test.runner import DiscoverRunner
 
+from main.database import database_settings
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -35,6 +36,8 @@ if IS_HEROKU:
     ALLOWED_HOSTS = ["*"]
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
     SECURE_SSL_REDIRECT = True
+    # the load balancer probes the health endpoints without TLS
+    SECURE_REDIRECT_EXEMPT = [r"^healthz$", r"^readyz$"]
 
     # improving security
     SESSION_COOKIE_SECURE = True
@@ -70,6 +73,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "frontend.middleware.RequestLogMiddleware",
+    "frontend.middleware.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -80,6 +85,12 @@ MIDDLEWARE = [
     "csp.middleware.CSPMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    "frontend.middleware.DeadlineMiddleware",
+    "frontend.middleware.RateLimitMiddleware",
+    "frontend.middleware.ArchiveMiddleware",
+    "frontend.middleware.IdempotencyMiddleware",
+    "frontend.middleware.SubmissionMiddleware",
+    "frontend.middleware.ProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "main.urls"
@@ -106,24 +117,200 @@ WSGI_APPLICATION = "main.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-MAX_CONN_AGE = 600
+# The same configuration is used on every deployment. Without DATABASE_URL we fall back
+# to a local SQLite file. See main/database.py for the details.
+MAX_CONN_AGE = config("DATABASE_CONN_MAX_AGE", default=600, cast=int)
+
+DATABASE_URL = config(
+    "DATABASE_URL", default="sqlite:///" + os.path.join(BASE_DIR, "db.sqlite3")
+)
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
-    }
+    "default": database_settings(
+        DATABASE_URL,
+        conn_max_age=MAX_CONN_AGE,
+        ssl_require=config("DATABASE_SSL_REQUIRE", default=IS_HEROKU, cast=bool),
+        sqlite_timeout=config("DATABASE_SQLITE_TIMEOUT", default=20.0, cast=float),
+        pool=config("DATABASE_POOL", default=""),
+    )
 }
 
-if IS_HEROKU and "DATABASE_URL" in os.environ:
-    # Configure Django for DATABASE_URL environment variable.
-    DATABASES["default"] = dj_database_url.config(
-        conn_max_age=MAX_CONN_AGE, ssl_require=True
+# Enable test database if found in CI environment.
+if IS_HEROKU and "DATABASE_URL" in os.environ and "CI" in os.environ:
+    DATABASES["default"]["TEST"] = DATABASES["default"]  # type: ignore[assignment]
+
+# An optional read replica, e.g. `sqlite:///replica.sqlite3` for local testing.
+# Read-only queries are sent to it, while all writes go to the default database.
+REPLICA_DATABASE_URL = config("REPLICA_DATABASE_URL", default="")
+
+if REPLICA_DATABASE_URL:
+    DATABASES["replica"] = database_settings(
+        REPLICA_DATABASE_URL, conn_max_age=MAX_CONN_AGE
     )
+    # the tests run against a single database
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["frontend.routers.ReplicaRouter"]
+# after a write, the reads of the client stay on the default database for this time in s
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The cache has to be shared by all the workers, as it holds the rate limits. Redis is
+# required in production, since only its `incr` is atomic. The database cache is meant
+# for development and tests and needs the table created by
+# `python manage.py createcachetable`. A cache in the memory of each process would
+# multiply the rate limits by the number of workers.
+REDIS_URL = config("REDIS_URL", default="")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "qlued_cache",
+        }
+    }
 
-    # Enable test database if found in CI environment.
-    if "CI" in os.environ:
-        DATABASES["default"]["TEST"] = DATABASES["default"]  # type: ignore[assignment]
+# Rate limiting of the API
+# The limits can be adapted in the admin. The defaults below apply if no rule
+# was defined for the scope. They are given as (capacity, requests per second).
+RATELIMIT_ENABLED = config("RATELIMIT_ENABLED", default=True, cast=bool)
+RATELIMIT_URL_NAMES = ["post_job", "get_job_status", "get_job_result"]
+RATELIMIT_DEFAULTS = {
+    "user": (60, 1.0),
+    "backend": (600, 10.0),
+}
+
+# reject all the limited requests once the storage latency exceeds this value in s
+STORAGE_LATENCY_SHED_THRESHOLD = config(
+    "STORAGE_LATENCY_SHED_THRESHOLD", default=10.0, cast=float
+)
+STORAGE_LATENCY_SHED_RETRY_AFTER = 30
+
+# Deduplication of job submissions
+# a job that is submitted again by the same user to the same backend within the window in
+# s gets the job id of the first submission. Duplicates are recognized by the
+# Idempotency-Key header and, if the content hash is enabled, by the job itself. A window
+# of 0 switches the deduplication off.
+IDEMPOTENCY_WINDOW = config("IDEMPOTENCY_WINDOW", default=10, cast=int)
+# without the header, identical jobs are only deduplicated on request, since users may
+# well want to run the same job twice
+IDEMPOTENCY_CONTENT_HASH = config("IDEMPOTENCY_CONTENT_HASH", default=False, cast=bool)
+IDEMPOTENCY_URL_NAMES = ["post_job"]
+
+# Submission of jobs
+# the job and its status are uploaded concurrently. In the write-behind mode, the jobs are
+# accepted into a queue in the database and uploaded in batches by a background thread of
+# each worker, which waits for the delay in s to collect a batch. A delay of None leaves
+# the uploads to `python manage.py flush_pending_jobs`. A job that failed too often is
+# reported as failed, and a flush that did not finish within the lease in s is taken over.
+JOB_WRITE_BEHIND = config("JOB_WRITE_BEHIND", default=False, cast=bool)
+JOB_WRITE_BEHIND_FLUSH_DELAY = 0.2
+JOB_WRITE_BEHIND_BATCH_SIZE = 50
+JOB_WRITE_BEHIND_MAX_ATTEMPTS = 5
+JOB_WRITE_BEHIND_LEASE = 60
+JOB_UPLOAD_WORKERS = 8
+# the jobs are checked against the limits of the backend before they are uploaded. The
+# limits are compiled once per version of the backend in the device catalogue, which is
+# looked up at most once per interval in s.
+JOB_VALIDATION = config("JOB_VALIDATION", default=True, cast=bool)
+JOB_VALIDATOR_CHECK_INTERVAL = 10.0
+
+# Deadlines of the requests
+# Each request has a time budget in s for its calls to the storage providers. It should
+# stay below the timeout of the gunicorn workers, which is 30 s by default. The budget can
+# be set per url name, None switches the deadline off.
+REQUEST_DEADLINE = config("REQUEST_DEADLINE", default=25.0, cast=float)
+REQUEST_DEADLINES = {
+    "devices": 10.0,
+    "devices_api": 10.0,
+    "readyz": 5.0,
+}
+# storage calls are not started anymore if less than this time in s is left
+STORAGE_CALL_MIN_BUDGET = 0.25
+DEADLINE_RETRY_AFTER = 5
+
+# Telemetry
+# the health of the storage providers and the history of the latency are written to the
+# database at most once per interval in s, after a request was answered. None stops the
+# writes after the requests.
+TELEMETRY_FLUSH_INTERVAL = config("TELEMETRY_FLUSH_INTERVAL", default=30.0, cast=float)
+
+# Health of the storage providers
+# the tables show the latency and error rate within the window in s, while the last
+# contact is kept for the retention in s.
+STORAGE_HEALTH_WINDOW = 900
+STORAGE_HEALTH_RETENTION = 86400
+# the number of latencies that each sample keeps
+STORAGE_HEALTH_SAMPLE_SIZE = 100
+
+# History of the latency
+# the history keeps one sketch of the durations of the endpoints and the storage
+# providers per worker and period of the resolution in s, which are merged into hourly
+# sketches after the fine retention and removed after the retention in s.
+LATENCY_HISTORY_RESOLUTION = 300
+LATENCY_HISTORY_COARSE_RESOLUTION = 3600
+LATENCY_HISTORY_FINE_RETENTION = 86400
+LATENCY_HISTORY_RETENTION = config(
+    "LATENCY_HISTORY_RETENTION", default=14 * 86400, cast=int
+)
+
+# Device catalogue
+# how long the catalogue of the devices is used before it is refreshed from the storage
+# providers in s and how many devices are shown per page
+DEVICE_CATALOGUE_MAX_AGE = config("DEVICE_CATALOGUE_MAX_AGE", default=60, cast=int)
+DEVICES_PER_PAGE = 12
+# the rendered cards of the devices are cached until their configuration or status
+# changes, at most for this time in s
+DEVICE_CARD_CACHE_TIMEOUT = 3600
+
+# Readiness probe
+# how many active storage providers are checked and how long we wait for them in s
+READINESS_STORAGE_SAMPLE_SIZE = 3
+READINESS_STORAGE_TIMEOUT = 2.0
+READINESS_MAX_CONCURRENCY = 3
+# how long the results of the storage checks are reused in s
+READINESS_CACHE_SECONDS = 10
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.0/topics/logging/
+# All records are written as json lines to stdout by a background thread.
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "request_context": {"()": "frontend.logs.RequestContextFilter"},
+    },
+    "formatters": {
+        "json": {"()": "frontend.logs.JsonFormatter"},
+    },
+    "handlers": {
+        "background": {
+            "class": "frontend.logs.BackgroundHandler",
+            "filters": ["request_context"],
+            "formatter": "json",
+        },
+    },
+    "loggers": {
+        "frontend": {
+            "handlers": ["background"],
+            "level": LOG_LEVEL,
+            "propagate": False,
+        },
+    },
+    "root": {"handlers": ["background"], "level": "WARNING"},
+}
 
 
 # Media files
@@ -131,6 +318,31 @@ if IS_HEROKU and "DATABASE_URL" in os.environ:
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIA_URL = "/media/"
 
+# On-demand profiling of single requests by staff users
+# The profiles are stored in MEDIA_ROOT/profiles and can be downloaded in the admin.
+PROFILER_ENABLED = config("PROFILER_ENABLED", default=True, cast=bool)
+# the time between two samples of the stack in s
+PROFILER_INTERVAL = 0.005
+# only the most recent profiles are kept
+PROFILER_MAX_PROFILES = 50
+
+# Archive of old jobs
+# Finished and deleted jobs are copied from the storage providers into bundles under
+# archives/ by `python manage.py archive_jobs` once they are older than this number of days.
+JOB_ARCHIVE_RETENTION_DAYS = config("JOB_ARCHIVE_RETENTION_DAYS", default=30, cast=int)
+# the storage of the bundles, by default MEDIA_ROOT, which is lost on every deploy on
+# Heroku. A durable storage is e.g. `storages.backends.s3.S3Storage` of django-storages.
+JOB_ARCHIVE_STORAGE = {
+    "BACKEND": config(
+        "JOB_ARCHIVE_STORAGE_BACKEND",
+        default="django.core.files.storage.FileSystemStorage",
+    ),
+    "OPTIONS": {},
+}
+# the jobs are only deleted from the storage providers if the storage of the bundles is
+# durable
+JOB_ARCHIVE_PERSISTENT = config("JOB_ARCHIVE_PERSISTENT", default=False, cast=bool)
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
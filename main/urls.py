@@ -24,6 +24,7 @@ urlpatterns = [
     path("about", views.about, name="about"),
     path("accounts/profile", views.profile, name="profile"),
     path("devices", views.devices, name="devices"),
+    path("devices/api", views.devices_api, name="devices_api"),
     path(
         "add_storage_provider", views.add_storage_provider, name="add_storage_provider"
     ),
@@ -38,6 +39,8 @@ urlpatterns = [
         name="edit_storage_provider",
     ),
     path("signup", views.signup, name="signup"),
+    path("healthz", views.healthz, name="healthz"),
+    path("readyz", views.readyz, name="readyz"),
     path("login", auth_views.LoginView.as_view(), name="login"),
     path("logout", auth_views.LogoutView.as_view(), name="logout"),
     path("admin/", admin.site.urls),